@@ -2,11 +2,15 @@
 #Description-Generate URDF file from Fusion 360
 
 import adsk, adsk.core, adsk.fusion, traceback
+import cProfile
+import dataclasses
+import io
 import os
-import re
+import pstats
 import sys
-from .utils import utils
-from .core import Link, Joint, Write
+from .utils import utils, mesh, refinement, pipeline, metrics, apitrace
+from .utils.options import ExportOptions
+from .core import Joint, Write, Snapshot, Kinematics, Export
 
 """
 # length unit is 'cm' and inertial unit is 'kg/cm^2'
@@ -21,6 +25,8 @@ from .core import Link, Joint, Write
 
 def run(context):
     ui = None
+    stages = None
+    profiler = None
     success_msg = 'Successfully create URDF file'
     msg = success_msg
     
@@ -45,6 +51,20 @@ def run(context):
             except Exception:
                 pass
 
+        options = ExportOptions()
+        # stage clock and background worker (see utils/pipeline.py), timers
+        # and counters of the stages (see utils/metrics.py)
+        stages = pipeline.Pipeline()
+        export_metrics = metrics.Metrics()
+        metrics.activate(export_metrics)
+        if options.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        # every adsk object the stages reach from the design is traced
+        tracer = None
+        if options.trace_api:
+            tracer = apitrace.Tracer()
+            design = tracer.wrap(design)
         root = design.rootComponent  # root component 
         components = design.allComponents
 
@@ -57,8 +77,8 @@ def run(context):
             dlg = ui.createProgressDialog()
             dlg.isBackgroundTranslucency = False
             dlg.cancelButtonText = 'Cancel'
-            # 7 main steps below
-            dlg.show(title, 'Step %v of %m: %p%', 0, 7, 1)
+            # 10 main steps below
+            dlg.show(title, 'Step %v of %m: %p%', 0, 10, 1)
         except Exception:
             dlg = None
 
@@ -94,28 +114,10 @@ def run(context):
             return 0
 
         # If a package with the same name already exists in the selected folder,
-        # append a version suffix _vN where N is 1 higher than the highest
-        # existing version number found. Existing names handled are:
-        #   package_name
-        #   package_name_v1, package_name_v2, ...
-        try:
-            existing_versions = []
-            for name in os.listdir(base_dir):
-                if name == package_name:
-                    existing_versions.append(0)
-                else:
-                    m = re.match(re.escape(package_name) + r'_v(\d+)$', name)
-                    if m:
-                        try:
-                            existing_versions.append(int(m.group(1)))
-                        except ValueError:
-                            pass
-            if existing_versions:
-                new_ver = max(existing_versions) + 1
-                package_name = f"{package_name}_v{new_ver}"
-        except Exception:
-            # If anything goes wrong (permissions, etc.), fall back to original name
-            pass
+        # append a version suffix _vN (see utils.next_package_name). Meshes that
+        # did not change since that previous version are reused from it.
+        package_name, previous_name = utils.next_package_name(base_dir, package_name)
+        previous_dir = os.path.join(base_dir, previous_name) if previous_name else None
 
         # Final save directory is the selected folder + package_name
         save_dir = os.path.join(base_dir, package_name)
@@ -126,12 +128,28 @@ def run(context):
 
         package_dir = os.path.abspath(os.path.dirname(__file__)) + '/package/'
         
+        # --------------------
+        # read the design once; every stage below works on this snapshot
+        stages.begin('snapshot')
+        _tick('Reading design...')
+        try:
+            snapshot = Snapshot.take_snapshot(root, options.mass_accuracy)
+        except Exception:
+            if dlg: dlg.hide()
+            ui.messageBox('Failed while reading the design:\n{}'.format(traceback.format_exc()), title)
+            return 0
+        if _check_cancel():
+            if dlg: dlg.hide()
+            ui.messageBox('Fusion2URDF was canceled', title)
+            return 0
+
         # --------------------
         # set dictionaries
+        stages.begin('kinematics')
         _tick('Building joints...')
         # Generate joints_dict. All joints are related to root. 
         try:
-            joints_dict, msg = Joint.make_joints_dict(root, msg)
+            joints_dict, msg = Joint.make_joints_dict(snapshot, msg)
         except Exception:
             if dlg: dlg.hide()
             ui.messageBox('Failed while creating joints:\n{}'.format(traceback.format_exc()), title)
@@ -144,133 +162,145 @@ def run(context):
             if dlg: dlg.hide()
             ui.messageBox('No joints were found. Please check your Fusion design and try again.', title)
             return 0
+        # tree, link frames and mimics; the stages without Fusion calls are
+        # shared with `python -m URDF_Exporter` (see core/Export.py)
+        export = Export.ExportStages(snapshot, joints_dict, options, save_dir, package_name, robot_name, log, _tick)
+        try:
+            export.kinematics()
+        except Kinematics.KinematicTreeError as e:
+            if dlg: dlg.hide()
+            ui.messageBox(str(e), title)
+            return 0
+        processed_mimics, unmatched_mimics = len(export.mimics.annotated), len(export.mimics.unmatched)
         if _check_cancel():
             if dlg: dlg.hide()
             ui.messageBox('Fusion2URDF was canceled', title)
             return 0
+        
+        # the text files that only need the joints are rendered on the
+        # background worker while the main thread drives Fusion
+        model = export.model
+        stages.background('text', lambda: Write.write_artifacts(model, package_name, robot_name, save_dir, package_dir,
+                                                                options.artifact_workers, Write.JOINT_ARTIFACTS))
 
+        # --------------------
+        stages.begin('inertials')
         try:
-            inertial_dict, msg = Link.make_inertial_dict(root, msg)
-        except Exception:
+            export.inertials()
+        except Export.StageError as e:
             if dlg: dlg.hide()
-            ui.messageBox('Failed while computing inertials:\n{}'.format(traceback.format_exc()), title)
+            ui.messageBox(str(e), title)
             return 0
-        
-        # Link positions dict
-        links_xyz_dict = {}
+        link_keys = export.link_keys
+        export.mesh_settings()
+        mesh_format = export.mesh_format
 
-        # --------------------
-        # Parse mimics embedded in joint names: "<follower>-Link-<leader>:<ratio>[:<offset>]"
-        def _base_name(name):
+        stages.begin('mesh export')
+        _tick('Exporting STL meshes...')
+        # Generate STl files
+        # In 'copy' mode copy_occs returns metadata about temporary components
+        # it created so we can clean them up afterward and restore original names.
+        copied_info = []
+        try:
+            if options.mesh_export_mode == 'direct':
+                mesh_manifest = utils.export_stl_direct(design, save_dir, snapshot, previous_dir, mesh_format,
+                                                        options.mesh_refinement, options.mesh_triangle_budget)
+            else:
+                copied_info = utils.copy_occs(root, snapshot)
+                mesh_manifest = utils.export_stl(design, save_dir, components, previous_dir, mesh_format,
+                                                 options.mesh_refinement, options.mesh_triangle_budget)
+            log(f"[meshes] mode={options.mesh_export_mode}"
+                f" visited={mesh_manifest.visited} planned={mesh_manifest.planned}"
+                f" exported={mesh_manifest.exported} reused={mesh_manifest.reused}"
+                f" previous={previous_name}")
+            # per mesh report: settings, triangles and bytes of the mesh actually on disk,
+            # an STL or a reused mesh in the previous version's format
+            total_triangles = total_bytes = 0
+            meshes_dir = os.path.join(save_dir, 'meshes')
+            for name, settings in mesh_manifest.settings.items():
+                entry = mesh_manifest.meshes.get(name)
+                path = (os.path.join(meshes_dir, entry['file']) if entry and 'file' in entry
+                        else mesh.mesh_path(meshes_dir, name))
+                triangles = mesh.triangle_count(path)
+                size = os.path.getsize(path) if path and os.path.exists(path) else None
+                total_triangles += triangles or 0
+                total_bytes += size or 0
+                estimate = f" estimate={settings['estimate']}" if 'estimate' in settings else ''
+                log(f"[mesh] {name}: triangles={triangles} bytes={size}"
+                    f" refinement={refinement.describe(settings)}{estimate}")
+            budget = f" budget={options.mesh_triangle_budget}" if options.mesh_refinement == 'adaptive' else ''
+            log(f"[meshes] triangles={total_triangles} bytes={total_bytes}{budget}")
+        except Exception:
+            # Still attempt cleanup below, but report export error
+            if dlg: dlg.hide()
+            ui.messageBox('Failed while exporting STL meshes:\n{}'.format(traceback.format_exc()), title)
+            return 0
+        finally:
+            # delete temporary copied components and restore original names
             try:
-                return name.split('-Link-')[0]
+                utils.delete_copied_components(root, copied_info)
             except Exception:
-                return name
-
-        def _annotate_mimics_from_names(joints_dict):
-            processed = 0
-            unmatched = 0
-            # Build a mapping from base name to actual joint key
-            base_to_key = {}
-            for k in joints_dict.keys():
-                base_to_key[_base_name(k)] = k
-            # Regex for pattern
-            patt = re.compile(r'^(?P<base>.+?)-Link-(?P<leader>[^:]+):(?P<mult>[+-]?(?:\d+\.\d*|\d*\.\d+|\d+)(?:[eE][+-]?\d+)?)(?::(?P<offset>[+-]?(?:\d+\.\d*|\d*\.\d+|\d+)(?:[eE][+-]?\d+)?))?$', re.UNICODE)
-
-            for j in list(joints_dict.keys()):
-                m = patt.match(j)
-                # Always set output_name to the base part (clean name for URDF)
-                joints_dict[j]['output_name'] = _base_name(j)
-                if not m:
-                    continue
-                leader_raw = m.group('leader')
-                mult = float(m.group('mult')) if m.group('mult') is not None else 1.0
-                off = m.group('offset')
-                offset = float(off) if off is not None else 0.0
-                # Resolve leader
-                leader_key = None
-                if leader_raw in joints_dict:
-                    leader_key = leader_raw
-                elif leader_raw in base_to_key:
-                    leader_key = base_to_key[leader_raw]
-                else:
-                    # Try relaxed: match by base-insensitive
-                    for k in joints_dict.keys():
-                        if _base_name(k).lower() == leader_raw.lower():
-                            leader_key = k
-                            break
-                if not leader_key:
-                    unmatched += 1
-                    log(f"[name-link] follower={j}: leader '{leader_raw}' not found -> skipped")
-                    continue
-                # Only set mimic for supported types
-                if joints_dict[j]['type'] in ('revolute', 'continuous', 'prismatic'):
-                    if joints_dict[j].get('mimic') is None:
-                        joints_dict[j]['mimic'] = {
-                            'joint': joints_dict[leader_key].get('output_name', _base_name(leader_key)),
-                            'multiplier': mult,
-                            'offset': offset
-                        }
-                        processed += 1
-                        log(f"[mimic-name] follower={_base_name(j)} leader={joints_dict[leader_key].get('output_name', _base_name(leader_key))} mult={mult} offset={offset}")
-                else:
-                    log(f"[skip-name] follower={j}: unsupported type {joints_dict[j]['type']}")
-            return processed, unmatched
+                # best-effort cleanup; ignore errors here to avoid blocking the user
+                pass
+        if options.dump_snapshot:
+            # the STLs are saved before they are decimated or converted
+            try:
+                dump_path = os.path.join(save_dir, Snapshot.SNAPSHOT_NAME)
+                meshes = mesh_manifest.exported_meshes()
+                Snapshot.dump_snapshot(snapshot, dump_path, link_keys, meshes)
+                log(f"[snapshot] {dump_path}: {len(snapshot.joints)} joints, {len(link_keys)} links,"
+                    f" {len(meshes)} meshes, {os.path.getsize(dump_path)} bytes")
+            except Exception:
+                log(f"[snapshot] dump failed:\n{traceback.format_exc()}")
 
-        _tick('Resolving mimics from joint names...')
+        # mesh inertials, collision shapes and conversion of the exported meshes
         try:
-            processed_mimics, unmatched_mimics = _annotate_mimics_from_names(joints_dict)
-        except Exception:
-            processed_mimics, unmatched_mimics = 0, 0
+            export.meshes(mesh_manifest)
+        except Export.StageError as e:
+            if dlg: dlg.hide()
+            ui.messageBox(str(e), title)
+            return 0
         if _check_cancel():
             if dlg: dlg.hide()
             ui.messageBox('Fusion2URDF was canceled', title)
             return 0
-        
+
         # --------------------
-        # Generate URDF (will include <mimic> for any linked joints)
+        # Generate URDF (will include <mimic> for any linked joints). It is
+        # written after the meshes, whose collision shapes it refers to.
+        stages.begin('urdf')
         _tick('Writing URDF and launch files...')
+        seconds, failures = {}, {}
         try:
-            Write.write_urdf(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir)
-            Write.write_materials_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir)
-            Write.write_transmissions_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir)
-            Write.write_gazebo_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir)
-            Write.write_display_launch(package_name, robot_name, save_dir)
-            Write.write_gazebo_launch(package_name, robot_name, save_dir)
-            Write.write_control_launch(package_name, robot_name, save_dir, joints_dict)
-            Write.write_yaml(package_name, robot_name, save_dir, joints_dict)
+            # the links refer to the mesh results; the joints were resolved before
+            export.links()
+            seconds.update(Write.write_artifacts(model, package_name, robot_name, save_dir, package_dir,
+                                                 1, ['write_urdf']))
+        except Write.ArtifactError as e:
+            failures.update(e.failures)
         except Exception:
             if dlg: dlg.hide()
             ui.messageBox('Failed while writing URDF/xacro/launch files:\n{}'.format(traceback.format_exc()), title)
             return 0
-        if _check_cancel():
+        try:
+            seconds.update(stages.join('text'))
+        except Write.ArtifactError as e:
+            failures.update(e.failures)
+        if failures:
+            for name, error in failures.items():
+                log(f"[artifacts] {name} failed:\n"
+                    + ''.join(traceback.format_exception(type(error), error, error.__traceback__)))
             if dlg: dlg.hide()
-            ui.messageBox('Fusion2URDF was canceled', title)
+            ui.messageBox('Failed while writing URDF/xacro/launch files:\n{}'
+                          .format(Write.ArtifactError(failures)), title)
             return 0
-        
-        # copy over package files
-        utils.copy_package(save_dir, package_dir)
-        utils.update_cmakelists(save_dir, package_name)
-        utils.update_package_xml(save_dir, package_name)
-
-        _tick('Exporting STL meshes...')
-        # Generate STl files
-        # copy_occs returns metadata about temporary components it created so we
-        # can clean them up afterward and restore original names.
-        try:
-            copied_info = utils.copy_occs(root)
-            utils.export_stl(design, save_dir, components)
-        except Exception:
-            # Still attempt cleanup below, but report export error
+        log(f"[artifacts] {len(seconds)} writers ({len(Write.JOINT_ARTIFACTS)} in the background on"
+            f" {options.artifact_workers} threads): "
+            + ', '.join(f'{name} {t:.3f}s' for name, t in seconds.items()))
+        if _check_cancel():
             if dlg: dlg.hide()
-            ui.messageBox('Failed while exporting STL meshes:\n{}'.format(traceback.format_exc()), title)
+            ui.messageBox('Fusion2URDF was canceled', title)
             return 0
-        # delete temporary copied components and restore original names
-        try:
-            utils.delete_copied_components(root, copied_info)
-        except Exception:
-            # best-effort cleanup; ignore errors here to avoid blocking the user
-            pass
         
         try:
             if dlg: dlg.hide()
@@ -278,6 +308,7 @@ def run(context):
             pass
 
         # Append joint summary to detailed log
+        stages.begin('finalize')
         try:
             log('[summary] joints:')
             for jname, jd in joints_dict.items():
@@ -290,6 +321,43 @@ def run(context):
         except Exception:
             pass
 
+        # stage timings; the background text stage overlaps the main thread
+        stages.close()
+        for line in stages.report():
+            log(line)
+        overlap = sum(stages.overlap('text', name) for name in ('inertials', 'mesh export'))
+        log(f"[stage] text ran alongside inertials and mesh export for {overlap:.3f}s")
+
+        if tracer is not None:
+            for line in tracer.report():
+                log(line)
+            round_trips, api_seconds = tracer.totals()
+            metrics.count('api_round_trips', round_trips)
+            metrics.add_time('fusion_api', api_seconds)
+        if profiler is not None:
+            profiler.disable()
+            profile_path = os.path.join(save_dir, 'export_profile.prof')
+            profiler.dump_stats(profile_path)
+            top = io.StringIO()
+            pstats.Stats(profiler, stream=top).sort_stats('cumulative').print_stats(25)
+            log(f"[profile] {profile_path} (main thread), top functions by cumulative time:\n{top.getvalue()}")
+        # machine-readable timings and counters next to the log
+        try:
+            export_metrics.save(os.path.join(save_dir, 'export_metrics.json'),
+                                robot=robot_name, package=package_name, options=dataclasses.asdict(options),
+                                total_seconds=round(stages.now(), 6),
+                                stages=[{'name': t.name, 'thread': t.thread, 'start': round(t.start, 6),
+                                         'seconds': round(t.seconds, 6)}
+                                        for t in stages.timings if t.end is not None])
+            log('[metrics] export_metrics.json: '
+                + ' '.join(f'{k}={v}' for k, v in sorted(export_metrics.counters.items())))
+            slowest = sorted(export_metrics.links.items(), key=lambda item: -sum(item[1].values()))[:5]
+            if slowest:
+                log('[metrics] slowest links: ' + ', '.join(
+                    f"{name} ({' '.join(f'{k}={t:.3f}s' for k, t in timers.items())})" for name, timers in slowest))
+        except Exception:
+            log(f"[metrics] failed:\n{traceback.format_exc()}")
+
         # Write detailed log to file
         try:
             log_path = os.path.join(save_dir, 'urdf_export_log.txt')
@@ -317,3 +385,10 @@ def run(context):
             pass
         if ui:
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+    finally:
+        # a canceled or failed export still waits for the background worker
+        if stages:
+            stages.close()
+        if profiler is not None:
+            profiler.disable()
+        metrics.activate(None)
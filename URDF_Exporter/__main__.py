@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Rebuild description packages from design snapshots, without Fusion.
+
+    python -m URDF_Exporter robot_a.json.gz robot_b.json.gz -o build/
+    python -m URDF_Exporter design_snapshot.json.gz --set mesh_format=obj --set link_frames=occurrence
+
+A snapshot is written inside Fusion by an export with
+ExportOptions.dump_snapshot (design_snapshot.json.gz next to the log, see
+Snapshot.dump_snapshot). It holds the joints, the occurrences and their
+transforms, the mass properties of the links and the exported STLs, so
+everything after the Fusion calls runs here as it does in run(): joints,
+kinematic tree, mimics, inertials, collision meshes and primitives, mesh
+conversion and the URDF, xacro, launch and yaml files. Each package gets
+its urdf_export_log.txt, with the traceback if the export failed once the
+package directory was made; a failing snapshot does not stop the others
+and makes the exit status 1.
+
+ExportOptions fields are set with --set name=value. The options of the
+Fusion side (mesh_export_mode, mesh_refinement, mass_accuracy, ...) are
+fixed by the snapshot and have no effect.
+"""
+
+import argparse
+import dataclasses
+import os
+import sys
+import time
+import traceback
+
+from .utils import utils, manifest
+from .utils.options import ExportOptions
+from .core import Joint, Write, Snapshot, Export
+
+SUCCESS_MSG = 'Successfully create URDF file'
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'package') + '/'
+
+
+class ExportError(Exception):
+    """The snapshot cannot be exported (the message run() would show)."""
+
+
+def write_meshes(save_dir, meshes, previous_dir=None, mesh_format='stl'):
+    """
+    Write the STLs of a snapshot into save_dir/meshes and their manifest.
+
+    Parameters
+    ----------
+    save_dir: str
+    meshes: {name: (bytes, fingerprint)}
+        see Snapshot.load_snapshot
+    previous_dir: str
+        previous package version, whose manifest is kept for the conversions
+    mesh_format: str
+
+    Returns
+    ----------
+    mesh_manifest: manifest.MeshManifest
+    """
+    meshes_dir = os.path.join(save_dir, 'meshes')
+    os.makedirs(meshes_dir, exist_ok=True)
+    mesh_manifest = manifest.MeshManifest(
+        meshes_dir, os.path.join(previous_dir, 'meshes') if previous_dir else None, '.' + mesh_format)
+    mesh_manifest.planned = len(meshes)
+    for name, (stl, fp) in meshes.items():
+        with utils.atomic_open(os.path.join(meshes_dir, name + '.stl'), 'wb') as f:
+            f.write(stl)
+        mesh_manifest.record(name, fp)
+    mesh_manifest.save()
+    return mesh_manifest
+
+
+def export_snapshot(file_name, base_dir, options=None, log=print):
+    """
+    Build the description package of a snapshot file in base_dir.
+
+    Parameters
+    ----------
+    file_name: str
+        written by Snapshot.dump_snapshot
+    base_dir: str
+        the package is created there as <robot>_description, or with the
+        next _vN suffix if it exists (see utils.next_package_name)
+    options: ExportOptions
+        defaults if None
+    log: callable
+        called with every log line
+
+    Returns
+    ----------
+    save_dir: str
+        path of the package
+
+    Raises
+    ----------
+    ExportError
+        if the snapshot has no usable joints or lacks the mesh of a link
+    KinematicTreeError
+        if joints are not connected to base_link
+    Export.StageError
+        if a stage fails
+
+    An exception raised once the package directory exists carries its path
+    as save_dir.
+    """
+    options = options or ExportOptions()
+    snapshot, meshes = Snapshot.load_snapshot(file_name)
+    robot_name = snapshot.root_name.split()[0]
+    package_name, previous_name = utils.next_package_name(base_dir, robot_name + '_description')
+    previous_dir = os.path.join(base_dir, previous_name) if previous_name else None
+    save_dir = os.path.join(base_dir, package_name)
+    os.makedirs(save_dir, exist_ok=True)
+    try:
+        _export_package(file_name, snapshot, meshes, save_dir, package_name, robot_name, previous_dir, options, log)
+    except Exception as e:
+        e.save_dir = save_dir
+        raise
+    return save_dir
+
+
+def _export_package(file_name, snapshot, meshes, save_dir, package_name, robot_name, previous_dir, options, log):
+    log(f"[snapshot] {file_name}: {len(snapshot.joints)} joints, {len(snapshot.occurrences)} occurrences,"
+        f" {len(meshes)} meshes, mass tier {snapshot.mass_tier}")
+
+    joints_dict, msg = Joint.make_joints_dict(snapshot, SUCCESS_MSG)
+    if msg != SUCCESS_MSG:
+        raise ExportError(msg)
+    if not joints_dict:
+        raise ExportError('No joints were found. Please check your Fusion design and try again.')
+    if options.mass_progressive:
+        # refining needs Fusion; the snapshot holds the tier each link was read at
+        log('[inertia] the snapshot holds one tier per link, mass_progressive is ignored')
+        options = dataclasses.replace(options, mass_progressive=False)
+
+    export = Export.ExportStages(snapshot, joints_dict, options, save_dir, package_name, robot_name, log)
+    export.kinematics()
+    missing = [name for name in export.tree.order if name not in meshes]
+    if missing:
+        raise ExportError('{} holds no mesh of {}'.format(file_name, ', '.join(missing)))
+    export.inertials()
+    export.mesh_settings()
+    mesh_manifest = write_meshes(save_dir, meshes, previous_dir, export.mesh_format)
+    log(f"[meshes] {len(meshes)} STLs from the snapshot")
+    export.meshes(mesh_manifest)
+    model = export.links()
+    seconds = Write.write_artifacts(model, package_name, robot_name, save_dir, PACKAGE_DIR,
+                                    options.artifact_workers)
+    log(f"[artifacts] {len(seconds)} writers: " + ', '.join(f'{name} {t:.3f}s' for name, t in seconds.items()))
+
+
+def parse_option(options, assignment):
+    """
+    Set one ExportOptions field from 'name=value', converted to the type of
+    its default.
+
+    Returns
+    ----------
+    options: ExportOptions
+        a validated copy
+    """
+    name, sep, value = assignment.partition('=')
+    fields = {f.name: f for f in dataclasses.fields(ExportOptions)}
+    if not sep or name not in fields:
+        raise ValueError('expected name=value with name one of {}, got {!r}'.format(', '.join(fields), assignment))
+    kind = type(fields[name].default)
+    if kind is bool:
+        if value.lower() not in ('true', 'false', '1', '0'):
+            raise ValueError('{} must be true or false, got {!r}'.format(name, value))
+        value = value.lower() in ('true', '1')
+    else:
+        value = kind(value)
+    return dataclasses.replace(options, **{name: value})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m URDF_Exporter', description=__doc__.split('\n\n')[0])
+    parser.add_argument('snapshots', nargs='+', help='files written with ExportOptions.dump_snapshot')
+    parser.add_argument('-o', '--output', default='.', help='directory the packages are created in')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='ExportOptions field, may be repeated')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the export logs')
+    args = parser.parse_args(argv)
+
+    options = ExportOptions()
+    try:
+        for assignment in args.set:
+            options = parse_option(options, assignment)
+    except ValueError as e:
+        parser.error(str(e))
+    os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    for file_name in args.snapshots:
+        logs = []
+
+        def log(message):
+            logs.append(str(message))
+            if args.verbose:
+                print(message)
+        t0 = time.perf_counter()
+        save_dir = None
+        try:
+            save_dir = export_snapshot(file_name, args.output, options, log)
+            print(f'{file_name}: {save_dir} ({time.perf_counter() - t0:.2f}s)')
+        except Exception as e:
+            failed += 1
+            save_dir = getattr(e, 'save_dir', None)
+            logs.append(f'failed\n{traceback.format_exc()}')
+            print(f'{file_name}: failed\n{traceback.format_exc()}', file=sys.stderr)
+        finally:
+            if save_dir is not None:
+                with open(os.path.join(save_dir, 'urdf_export_log.txt'), 'w', encoding='utf-8') as f:
+                    f.write('\n'.join(logs))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+The stages of an export that need no Fusion call.
+
+run() reads the design into a Snapshot.DesignSnapshot and exports the
+meshes from Fusion; `python -m URDF_Exporter` loads both from a snapshot
+file (see __main__.py). Everything else is the same for both and lives
+here, one method per stage, called in this order:
+
+    export = ExportStages(snapshot, joints_dict, options, save_dir, package_name, robot_name, log)
+    export.kinematics()            tree, link frames, mimics, joints of the model
+    export.inertials()             physical properties of the links ('fusion' engine)
+    export.mesh_settings()         mesh format and collision meshes numpy allows
+    ... meshes exported or written into save_dir/meshes ...
+    export.meshes(mesh_manifest)   mesh inertials, collision primitives, meshes and
+                                   spheres, mesh conversion
+    export.links()                 links of the model
+
+Each stage keeps its results as attributes for the next ones, logs as it
+goes and raises StageError when it fails.
+"""
+
+import contextlib
+import os
+import traceback
+
+from . import Link, Model, Snapshot, Write
+from .Kinematics import KinematicTree
+from ..utils import mesh, inertia, transforms, mimic, metrics
+
+
+class StageError(Exception):
+    """A stage failed; the message names it and holds the traceback, as run() shows it."""
+
+
+@contextlib.contextmanager
+def _failing(message):
+    try:
+        yield
+    except Exception as e:
+        raise StageError('{}:\n{}'.format(message, traceback.format_exc())) from e
+
+
+class ExportStages:
+    """
+    Attributes
+    ----------
+    tree: Kinematics.KinematicTree
+    frames: transforms.Frames
+        None for link_frames 'world'
+    mimics: mimic.MimicReport
+    model: Model.RobotModel
+        its links are None until links()
+    inertia_engine: str
+        options.inertia_engine, or 'fusion' without numpy
+    link_keys: [str]
+        occurrences that become links
+    inertial_dict: {name: {mass, inertia, center_of_mass}}
+    mesh_format: str
+        options.mesh_format, or 'stl' without numpy
+    collision_dir: str
+        subdirectory of meshes/ with the decimated collision meshes, None
+        to use the visual meshes
+    collision_primitives: {name: primitive}
+    """
+
+    def __init__(self, snapshot, joints_dict, options, save_dir, package_name, robot_name, log, tick=None):
+        """
+        Parameters
+        ----------
+        snapshot: Snapshot.DesignSnapshot
+        joints_dict: {name: {parent, child, xyz, axis, ...}}
+            see Joint.make_joints_dict; mimics are annotated in place
+        options: ExportOptions
+        save_dir: str
+            path of the package
+        package_name, robot_name: str
+        log: callable
+            called with every log line
+        tick: callable
+            called with a progress message before the longer steps
+        """
+        self.snapshot = snapshot
+        self.joints_dict = joints_dict
+        self.options = options
+        self.save_dir = save_dir
+        self.meshes_dir = os.path.join(save_dir, 'meshes')
+        self.package_name = package_name
+        self.robot_name = robot_name
+        self.log = log
+        self.tick = tick or (lambda message: None)
+        self.tree = self.frames = self.mimics = self.model = None
+        self.inertia_engine = options.inertia_engine
+        self.link_keys = []
+        self.inertial_dict = {}
+        self.mesh_format = options.mesh_format
+        self.collision_dir = None
+        self.collision_primitives = {}
+
+    def kinematics(self):
+        """
+        Raises
+        ----------
+        KinematicTreeError
+            if joints are not connected to base_link
+        """
+        log, options, joints_dict = self.log, self.options, self.joints_dict
+        self.tree = tree = KinematicTree.from_joints(joints_dict)
+        tree.check()
+        log(f"[tree] {len(tree)} links, max depth {max(tree.depth.values())}")
+        if tree.loop_joints:
+            log(f"[tree] loop-closure joints left out of the URDF: {', '.join(tree.loop_joints)}")
+
+        if options.link_frames != 'world':
+            self.frames = transforms.resolve_frames(self.snapshot, joints_dict, options.link_frames)
+            turned = sum(1 for rotation, _ in self.frames.links.values() if rotation != transforms.IDENTITY)
+            log(f"[frames] link_frames={options.link_frames}: {turned} of {len(self.frames.links)} links turned")
+
+        # Parse mimics embedded in joint names: "<follower>-Link-<leader>:<ratio>[:<offset>]"
+        self.tick('Resolving mimics from joint names...')
+        try:
+            report = mimic.annotate_mimics_from_names(joints_dict)
+        except Exception:
+            report = mimic.MimicReport()
+            log(f"[mimic-name] failed, no mimics annotated:\n{traceback.format_exc()}")
+        for follower, leader in report.unmatched:
+            log(f"[name-link] follower={follower}: leader '{leader}' not found -> skipped")
+        for follower, joint_type in report.unsupported:
+            log(f"[skip-name] follower={follower}: unsupported type {joint_type}")
+        for follower, leader, mult, offset, via in report.annotated:
+            chain = f" (flattened, via {via})" if via else ''
+            log(f"[mimic-name] follower={follower} leader={leader} mult={mult} offset={offset}{chain}")
+        for cycle in report.cycles:
+            log(f"[mimic-cycle] {' -> '.join(cycle + cycle[:1])}: joints left without <mimic>")
+        self.mimics = report
+        self.model = Model.make_model(joints_dict, None, self.package_name, tree, self.frames)
+
+    def inertials(self):
+        """Physical properties are only read for the links the URDF emits."""
+        log, options, snapshot = self.log, self.options, self.snapshot
+        if self.inertia_engine == 'mesh' and not mesh.available():
+            log('[inertia] numpy is not available, the mesh engine falls back to Fusion')
+            self.inertia_engine = 'fusion'
+        link_names = self.tree.order
+        link_set = set(link_names)
+        self.link_keys = [o.key for o in snapshot.top_level_occurrences() if o.link_name in link_set]
+        log(f"[inertia] engine={self.inertia_engine} accuracy tier={snapshot.mass_tier},"
+            f" {len(self.link_keys)} links")
+        key_set = set(self.link_keys)
+        skipped = [o.name for o in snapshot.top_level_occurrences() if o.key not in key_set]
+        if skipped:
+            log(f"[inertia] skipped {len(skipped)} occurrences outside the kinematic tree: {', '.join(skipped)}")
+        # with the mesh engine the inertials are computed once the meshes are exported
+        if self.inertia_engine != 'fusion':
+            return
+        with _failing('Failed while computing inertials'):
+            if options.mass_progressive:
+                changes = Snapshot.refine_mass_properties(snapshot, options.mass_tolerance, self.link_keys)
+                for key, steps in changes.items():
+                    name = snapshot.occurrences[key].link_name
+                    log(f"[inertia] {name}: " + ', '.join(f'{t} (change {c:.2e})' for t, c in steps))
+                tiers = list(snapshot.mass_tiers.values())
+                log('[inertia] progressive pass: ' + ' '.join(f'{t}={tiers.count(t)}' for t in Snapshot.ACCURACY_TIERS))
+            self.inertial_dict, _ = Link.make_inertial_dict(snapshot, '', link_names)
+        log(f"[inertia] {metrics.counter('physical_property_reads')} physical property reads"
+            f" for {len(self.link_keys)} links")
+
+    def mesh_settings(self):
+        """Decimated collision meshes and obj/glb need numpy, which Fusion does not ship."""
+        if self.mesh_format != 'stl' and not mesh.available():
+            self.log(f'[meshes] numpy is not available, meshes are kept as stl instead of {self.mesh_format}')
+            self.mesh_format = 'stl'
+        if self.options.collision_triangle_budget > 0:
+            if mesh.available():
+                self.collision_dir = mesh.COLLISION_DIR
+            else:
+                self.log('[collision] numpy is not available, the visual meshes are used for collision')
+
+    def meshes(self, mesh_manifest):
+        """
+        Parameters
+        ----------
+        mesh_manifest: manifest.MeshManifest
+            of the meshes in save_dir/meshes, updated by the conversion
+        """
+        log, options = self.log, self.options
+        meshes_dir, link_names, mesh_format = self.meshes_dir, self.tree.order, self.mesh_format
+
+        # mesh based inertials (engine 'mesh') or their comparison with Fusion's
+        if self.inertia_engine == 'mesh' or (options.inertia_cross_check and mesh.available()):
+            with _failing('Failed while computing inertials from the meshes'):
+                masses = {n: d['mass'] for n, d in self.inertial_dict.items()}
+                mesh_inertials = inertia.make_mesh_inertial_dict(meshes_dir, link_names,
+                                                                 options.mesh_density, masses)
+                if self.inertia_engine == 'mesh':
+                    self.inertial_dict = mesh_inertials
+                    log(f"[inertia] {len(mesh_inertials)} links from meshes, density={options.mesh_density}")
+                else:
+                    for name, d in inertia.compare(self.inertial_dict, mesh_inertials).items():
+                        log(f"[inertia] check {name}: " + ('no mesh' if d is None else
+                            'mass {:.2%}, center of mass {:.3g} m, inertia {:.2%}'.format(*d)))
+
+        if options.collision_primitives and not mesh.available():
+            log('[collision] numpy is not available, no collision primitives are fitted')
+        elif options.collision_primitives:
+            self.tick('Fitting collision primitives...')
+            with _failing('Failed while fitting collision primitives'):
+                primitives, errors = mesh.fit_collision_primitives(meshes_dir, link_names,
+                                                                   options.primitive_max_error)
+                for name, error in errors.items():
+                    if name in primitives:
+                        log(f"[collision] {name}: {primitives[name]['shape']} (volume error {error:.3f})")
+                    else:
+                        log(f"[collision] {name}: mesh (best primitive volume error {error})")
+                self.collision_primitives = primitives
+
+        if self.collision_dir:
+            self.tick('Building collision meshes...')
+            with _failing('Failed while building collision meshes'):
+                stats = mesh.decimate_collision_meshes(meshes_dir, options.collision_triangle_budget,
+                                                       [n for n in link_names if n not in self.collision_primitives],
+                                                       mesh_format)
+                for name, (before, after) in stats.items():
+                    log(f"[collision] {name}: triangles {before} -> {after}" if before is not None
+                        else f"[collision] {name}: kept at full resolution")
+
+        if options.collision_spheres > 0 and not mesh.available():
+            log('[spheres] numpy is not available, no collision spheres are written')
+        elif options.collision_spheres > 0:
+            self.tick('Fitting collision spheres...')
+            with _failing('Failed while fitting collision spheres'):
+                # link frames sit at the joint of which the link is the child
+                offsets = {'base_link': (0.0, 0.0, 0.0)}
+                for j in self.joints_dict.values():
+                    offsets.setdefault(j['child'], j['xyz'])
+                spheres = mesh.fit_collision_spheres(meshes_dir, link_names, options.collision_spheres, offsets,
+                                                     options.sphere_samples,
+                                                     rotations={n: r for n, (r, _) in self.frames.links.items()}
+                                                     if self.frames else None)
+                Write.write_collision_spheres(self.package_name, self.robot_name, self.save_dir, spheres)
+                log(f"[spheres] {sum(len(v) for v in spheres.values())} spheres for {len(spheres)} links")
+
+        if mesh_format != 'stl':
+            self.tick(f'Converting meshes to {mesh_format}...')
+            with _failing('Failed while converting meshes'):
+                stats = mesh.convert_meshes(meshes_dir, link_names, mesh_format, options.weld_tolerance)
+                for name, (stl_bytes, new_bytes, corners, vertices) in stats.items():
+                    if stl_bytes is None:
+                        log(f"[meshes] {name}: kept as stl")
+                        continue
+                    mesh_manifest.replace_file(name, f'{name}.{mesh_format}')
+                    log(f"[meshes] {name}.{mesh_format}: {stl_bytes} -> {new_bytes} bytes,"
+                        f" {corners} corners welded to {vertices} vertices")
+                mesh_manifest.save()
+
+    def links(self):
+        """The links refer to the mesh files on disk; the joints were resolved in kinematics()."""
+        files = mesh.mesh_files(self.meshes_dir, self.tree.order, self.mesh_format, self.collision_dir)
+        for name, (fmt, collision_fmt) in files.items():
+            if name in self.collision_primitives:
+                continue
+            self.log(f"[meshes] {name}: refers to {name}.{fmt}, collision "
+                     + (f"{self.collision_dir}/{name}.{collision_fmt}" if collision_fmt else 'the visual mesh'))
+        self.model.links = Model.make_links(self.inertial_dict, self.package_name, self.tree, self.frames,
+                                            self.collision_dir, self.collision_primitives, self.mesh_format,
+                                            files)
+        return self.model
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Kinematic tree of the links and joints of an export.
+
+URDF describes a tree rooted at base_link: every other link has exactly one
+parent joint. Fusion designs can hold more than that, joints closing a loop
+(four-bar linkages, parallel grippers) or groups of links not connected to
+base_link at all. KinematicTree orients the joints by breadth-first search
+from the root, keeps the spanning tree with O(1) parent, children and depth
+lookups and a deterministic topological order (the search order, i.e. the
+order make_joints_dict emits the joints in), and reports the loop-closure
+and disconnected joints instead of letting them reach the writers. Building
+it is linear in the number of joints.
+"""
+
+from collections import deque
+
+
+class KinematicTreeError(Exception):
+    """The joints do not form a tree the URDF writers can emit."""
+
+
+class KinematicTree:
+    """
+    Attributes
+    ----------
+    root: str
+        name of the root link
+    parent: {link: link}
+        parent of every link of the tree but the root
+    children: {link: [link]}
+        children of every link of the tree, in topological order
+    depth: {link: int}
+        number of joints between the root and every link of the tree
+    joint: {link: str}
+        name of the joint moving every link of the tree but the root
+    origin: {link: [x, y, z]}
+        world position of every link frame (m), the xyz of its joint
+    order: [link]
+        links of the tree, root first; every link comes after its parent
+    loop_joints: [str]
+        joints between two links already in the tree (loop closures)
+    disconnected: [str]
+        joints that cannot be reached from the root
+    """
+
+    def __init__(self, root='base_link'):
+        self.root = root
+        self.parent = {}
+        self.children = {root: []}
+        self.depth = {root: 0}
+        self.joint = {}
+        self.origin = {root: [0, 0, 0]}
+        self.order = [root]
+        self.loop_joints = []
+        self.disconnected = []
+
+    def __contains__(self, link):
+        return link in self.depth
+
+    def __len__(self):
+        return len(self.order)
+
+    def _attach(self, joint, parent, child):
+        self.parent[child] = parent
+        self.children[parent].append(child)
+        self.children[child] = []
+        self.depth[child] = self.depth[parent] + 1
+        self.joint[child] = joint
+        self.order.append(child)
+
+    def _grow(self, edges):
+        # edges: [(joint, a, b, directed)], undirected ones are oriented
+        # away from the root
+        adjacency = {}
+        for joint, a, b, directed in edges:
+            adjacency.setdefault(a, []).append((b, joint))
+            if not directed:
+                adjacency.setdefault(b, []).append((a, joint))
+        placed = set()
+        queue = deque([self.root])
+        while queue:
+            node = queue.popleft()
+            for neighbour, joint in adjacency.get(node, ()):
+                if neighbour in self.depth:
+                    continue
+                self._attach(joint, node, neighbour)
+                placed.add(joint)
+                queue.append(neighbour)
+        for joint, a, b, _ in edges:
+            if joint in placed:
+                continue
+            if a in self.depth and b in self.depth:
+                self.loop_joints.append(joint)
+            else:
+                self.disconnected.append(joint)
+
+    @classmethod
+    def from_edges(cls, edges, root='base_link'):
+        """
+        Orient undirected joints away from the root.
+
+        Parameters
+        ----------
+        edges: [(joint, link, link)]
+            in design order; it decides the order of siblings
+
+        Returns
+        ----------
+        tree: KinematicTree
+        """
+        tree = cls(root)
+        tree._grow([(joint, a, b, False) for joint, a, b in edges])
+        return tree
+
+    @classmethod
+    def from_joints(cls, joints_dict, root='base_link'):
+        """
+        Tree of already oriented joints.
+
+        Parameters
+        ----------
+        joints_dict: {name: {parent, child, xyz, ...}}
+            see Joint.make_joints_dict
+
+        Returns
+        ----------
+        tree: KinematicTree
+        """
+        tree = cls(root)
+        tree._grow([(name, j['parent'], j['child'], True) for name, j in joints_dict.items()])
+        for link in tree.order[1:]:
+            tree.origin[link] = joints_dict[tree.joint[link]]['xyz']
+        return tree
+
+    def joints(self):
+        """Joints of the tree in topological order."""
+        return [self.joint[link] for link in self.order[1:]]
+
+    def offset(self, link):
+        """xyz of the joint moving link in its parent frame (m, rounded)."""
+        return [round(c - p, 6) for p, c in zip(self.origin[self.parent[link]], self.origin[link])]
+
+    def check(self):
+        """Raise KinematicTreeError if joints are not connected to the root."""
+        if self.disconnected:
+            raise KinematicTreeError(
+                'The joints\n\n{}\n\nare not connected to {}. Check whether the connections '
+                'parent=component2 and child=component1 are correct or if you need to swap '
+                'component1<=>component2.'.format('\n'.join(self.disconnected), self.root))
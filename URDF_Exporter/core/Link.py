@@ -5,13 +5,18 @@ Created on Sun May 12 20:11:28 2019
 @author: syuntoku
 """
 
-import adsk, re
 from xml.etree.ElementTree import Element, SubElement
-from ..utils import utils
+from ..utils import utils, transforms, metrics
+
+def _round(value):
+    # 6 digits like the joint origins; + 0.0 turns -0.0 into 0.0
+    return round(value, 6) + 0.0
+
 
 class Link:
 
-    def __init__(self, name, xyz, center_of_mass, repo, mass, inertia_tensor):
+    def __init__(self, name, xyz, center_of_mass, repo, mass, inertia_tensor, collision_repo=None,
+                 collision_primitive=None, mesh_format='stl', rotation=None, collision_format=None):
         """
         Parameters
         ----------
@@ -29,6 +34,19 @@ class Link:
             mass of the link
         inertia_tensor: [ixx, iyy, izz, ixy, iyz, ixz]
             tensor of the inertia
+        collision_repo: str
+            the repository of the collision meshes, repo if None
+        collision_primitive: dict
+            box, cylinder or sphere fitted by mesh.fit_collision_primitives,
+            used for the collision instead of the mesh
+        mesh_format: str
+            extension of the mesh files ('stl', 'obj' or 'glb')
+        rotation: 3x3
+            orientation of the link frame in the world (see
+            transforms.Frames); the frame is parallel to the world if None.
+            center_of_mass and inertia_tensor are given in the link frame.
+        collision_format: str
+            extension of the collision mesh, mesh_format if None
         """
         self.name = name
         # xyz for visual
@@ -39,6 +57,16 @@ class Link:
         self.repo = repo
         self.mass = mass
         self.inertia_tensor = inertia_tensor
+        self.collision_repo = collision_repo or repo
+        self.collision_primitive = collision_primitive
+        self.mesh_format = mesh_format
+        self.collision_format = collision_format or mesh_format
+        # meshes are in world coordinates: visual origin = inverse link frame
+        self.rotation = rotation
+        self.rpy = [0, 0, 0]
+        if rotation is not None:
+            self.xyz = [_round(_) for _ in transforms.rotate(transforms.transpose(rotation), self.xyz)]
+            self.rpy = [_round(_) for _ in transforms.rpy(transforms.transpose(rotation))]
         
     def make_link_xml(self):
         """
@@ -63,33 +91,57 @@ class Link:
         # visual
         visual = SubElement(link, 'visual')
         origin_v = SubElement(visual, 'origin')
-        origin_v.attrib = {'xyz':' '.join([str(_) for _ in self.xyz]), 'rpy':'0 0 0'}
+        origin_v.attrib = {'xyz':' '.join([str(_) for _ in self.xyz]), 'rpy':' '.join([str(_) for _ in self.rpy])}
         geometry_v = SubElement(visual, 'geometry')
         mesh_v = SubElement(geometry_v, 'mesh')
-        mesh_v.attrib = {'filename':'package://' + self.repo + self.name + '.stl','scale':'0.001 0.001 0.001'}
+        mesh_v.attrib = {'filename':'package://' + self.repo + self.name + '.' + self.mesh_format,'scale':'0.001 0.001 0.001'}
         material = SubElement(visual, 'material')
         material.attrib = {'name':'silver'}
         
         # collision
         collision = SubElement(link, 'collision')
         origin_c = SubElement(collision, 'origin')
-        origin_c.attrib = {'xyz':' '.join([str(_) for _ in self.xyz]), 'rpy':'0 0 0'}
         geometry_c = SubElement(collision, 'geometry')
-        mesh_c = SubElement(geometry_c, 'mesh')
-        mesh_c.attrib = {'filename':'package://' + self.repo + self.name + '.stl','scale':'0.001 0.001 0.001'}
+        primitive = self.collision_primitive
+        if primitive:
+            # the primitive center is in the mesh (world) frame, like the visual
+            if self.rotation is None:
+                xyz = [_round(c + x) for c, x in zip(primitive['center'], self.xyz)]
+                rpy = [_round(_) for _ in primitive['rpy']]
+            else:
+                world = transforms.transpose(self.rotation)
+                xyz = [_round(c + x) for c, x in zip(transforms.rotate(world, primitive['center']), self.xyz)]
+                rpy = [_round(_) for _ in transforms.rpy(transforms.matmul(
+                    world, transforms.rpy_matrix(*primitive['rpy'])))]
+            origin_c.attrib = {'xyz':' '.join([str(_) for _ in xyz]),
+                               'rpy':' '.join([str(_) for _ in rpy])}
+            shape = SubElement(geometry_c, primitive['shape'])
+            if primitive['shape'] == 'box':
+                shape.attrib = {'size':' '.join([str(_round(_)) for _ in primitive['size']])}
+            elif primitive['shape'] == 'cylinder':
+                shape.attrib = {'radius':str(_round(primitive['radius'])),
+                                'length':str(_round(primitive['length']))}
+            else:
+                shape.attrib = {'radius':str(_round(primitive['radius']))}
+        else:
+            origin_c.attrib = {'xyz':' '.join([str(_) for _ in self.xyz]), 'rpy':' '.join([str(_) for _ in self.rpy])}
+            mesh_c = SubElement(geometry_c, 'mesh')
+            mesh_c.attrib = {'filename':'package://' + self.collision_repo + self.name + '.' + self.collision_format,'scale':'0.001 0.001 0.001'}
 
-        # print("\n".join(utils.prettify(link).split("\n")[1:]))
-        self.link_xml = "\n".join(utils.prettify(link).split("\n")[1:])
+        self.link_xml = utils.pretty_xml(link)
 
 
-def make_inertial_dict(root, msg):
+def make_inertial_dict(snapshot, msg, names=None):
     """      
     Parameters
     ----------
-    root: adsk.fusion.Design.cast(product)
-        Root component
+    snapshot: Snapshot.DesignSnapshot
+        design data read by Snapshot.take_snapshot
     msg: str
         Tell the status
+    names: [str]
+        links to compute (see link_names); physical properties of the other
+        occurrences are never read. Every top-level occurrence if None.
         
     Returns
     ----------
@@ -98,30 +150,27 @@ def make_inertial_dict(root, msg):
     msg: str
         Tell the status
     """
-    # Get component properties.      
-    allOccs = root.occurrences
     inertial_dict = {}
+    names = None if names is None else set(names)
     
-    for occs in allOccs:
-        # Skip the root component.
+    for occs in snapshot.top_level_occurrences():
+        if names is not None and occs.link_name not in names:
+            continue
         occs_dict = {}
-        prop = occs.getPhysicalProperties(adsk.fusion.CalculationAccuracy.VeryHighCalculationAccuracy)
+        with metrics.timer('mass_properties', occs.link_name):
+            prop = snapshot.mass(occs.key)
         
-        occs_dict['name'] = re.sub('[ :()]', '_', occs.name)
+        occs_dict['name'] = occs.name
 
         mass = prop.mass  # kg
         occs_dict['mass'] = mass
-        center_of_mass = [_/100.0 for _ in prop.centerOfMass.asArray()] ## cm to m
+        center_of_mass = [_/100.0 for _ in prop.center_of_mass] ## cm to m
         occs_dict['center_of_mass'] = center_of_mass
 
         # https://help.autodesk.com/view/fusion360/ENU/?guid=GUID-ce341ee6-4490-11e5-b25b-f8b156d7cd97
-        (_, xx, yy, zz, xy, yz, xz) = prop.getXYZMomentsOfInertia()
-        moment_inertia_world = [_ / 10000.0 for _ in [xx, yy, zz, xy, yz, xz] ] ## kg / cm^2 -> kg/m^2
+        moment_inertia_world = [_ / 10000.0 for _ in prop.moments] ## kg / cm^2 -> kg/m^2
         occs_dict['inertia'] = utils.origin2center_of_mass(moment_inertia_world, center_of_mass, mass)
         
-        if occs.component.name == 'base_link':
-            inertial_dict['base_link'] = occs_dict
-        else:
-            inertial_dict[re.sub('[ :()]', '_', occs.name)] = occs_dict
+        inertial_dict[occs.link_name] = occs_dict
 
-    return inertial_dict, msg
\ No newline at end of file
+    return inertial_dict, msg
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Resolved robot model every writer renders from.
+
+make_model turns joints_dict, inertial_dict and the kinematic tree into
+Link.Link and Joint.Joint objects once per export: link origins, centers
+of mass and inertia in the link frames, joint origins, rpy and axes in the
+parent frames, output names and mimics. The URDF, transmission, gazebo,
+launch and yaml writers only format these objects.
+
+The joints only need joints_dict; the links also need the inertials and
+the collision shapes, which may come from the exported meshes. A model
+made without inertial_dict (links None) serves every writer but
+write_urdf, and its links are added with make_links once they exist (see
+pipeline.py).
+"""
+
+from . import Link, Joint
+from .Kinematics import KinematicTree
+from ..utils import transforms
+
+
+class RobotModel:
+    """
+    Attributes
+    ----------
+    links: [Link.Link]
+        links of the tree in topological order, base_link first; None
+        until resolved
+    joints: [Joint.Joint]
+        joints of the tree in topological order (loop closures are left out)
+    tree: Kinematics.KinematicTree
+    """
+
+    def __init__(self, links, joints, tree):
+        self.links = links
+        self.joints = joints
+        self.tree = tree
+
+    def controlled_joints(self):
+        """Joints that get a transmission and a controller: not fixed, not mimics."""
+        return [j for j in self.joints if j.type != 'fixed' and j.mimic is None]
+
+
+def _make_link(name, xyz, inertial, repo, collision_repo, collision_primitive, mesh_format, frame=None,
+               collision_format=None):
+    if frame is None:
+        center_of_mass = [i-j for i, j in zip(inertial['center_of_mass'], xyz)]
+        return Link.Link(name=name, xyz=xyz, center_of_mass=center_of_mass, repo=repo,
+                         mass=inertial['mass'], inertia_tensor=inertial['inertia'],
+                         collision_repo=collision_repo, collision_primitive=collision_primitive,
+                         mesh_format=mesh_format, collision_format=collision_format)
+    # inertials are in world coordinates: express them in the link frame
+    rotation, origin = frame
+    world = transforms.transpose(rotation)
+    center_of_mass = transforms.rotate(world, [i-j for i, j in zip(inertial['center_of_mass'], origin)])
+    inertia = [round(_, 6) for _ in transforms.rotate_tensor(world, inertial['inertia'])]
+    return Link.Link(name=name, xyz=origin, center_of_mass=list(center_of_mass), repo=repo,
+                     mass=inertial['mass'], inertia_tensor=inertia,
+                     collision_repo=collision_repo, collision_primitive=collision_primitive,
+                     mesh_format=mesh_format, rotation=rotation, collision_format=collision_format)
+
+
+def make_joints(joints_dict, tree, frames=None):
+    """
+    Joints of the tree in topological order, their origins in the parent frames.
+
+    Parameters
+    ----------
+    joints_dict: {name: {parent, child, xyz, axis, ...}}
+        see Joint.make_joints_dict; 'output_name' and 'mimic' are set by
+        mimic.annotate_mimics_from_names
+    tree: Kinematics.KinematicTree
+        tree of joints_dict
+    frames: transforms.Frames
+        link frames turning with their occurrences (see
+        transforms.resolve_frames); parallel to the world if None
+
+    Returns
+    ----------
+    joints: [Joint.Joint]
+    """
+    joints = []
+    for name in tree.order[1:]:
+        j = tree.joint[name]
+        data = joints_dict[j]
+        axis, rpy = data['axis'], None
+        if frames is not None and j in frames.joints:
+            xyz, rpy, axis = frames.joints[j]
+        else:
+            xyz = tree.offset(name)
+        joints.append(Joint.Joint(
+            name=data.get('output_name', j),
+            joint_type=data['type'],
+            xyz=xyz,
+            axis=axis,
+            parent=data['parent'],
+            child=name,
+            upper_limit=data['upper_limit'],
+            lower_limit=data['lower_limit'],
+            mimic=data.get('mimic'),
+            rpy=rpy))
+    return joints
+
+
+def make_links(inertial_dict, package_name, tree, frames=None, collision_dir=None, collision_primitives=None,
+               mesh_format='stl', mesh_files=None):
+    """
+    Links of the tree in topological order, their inertials in the link frames.
+
+    Parameters
+    ----------
+    inertial_dict: {name: {mass, inertia, center_of_mass}}
+        in world coordinates
+    package_name: str
+        the meshes are referred to as package://package_name/meshes/
+    tree: Kinematics.KinematicTree
+    frames: transforms.Frames
+        see make_joints
+    collision_dir: str
+        subdirectory of meshes/ holding the collision meshes (ex: 'collision'),
+        the visual meshes are used for collision if None
+    collision_primitives: {name: primitive}
+        links whose collision is a box, cylinder or sphere instead of a mesh
+    mesh_format: str
+        extension of the mesh files ('stl', 'obj' or 'glb')
+    mesh_files: {name: (format, collision format)}
+        links whose files on disk are not in mesh_format (see
+        mesh.mesh_files); a None collision format refers to the visual mesh
+
+    Returns
+    ----------
+    links: [Link.Link]
+    """
+    collision_primitives = collision_primitives or {}
+    mesh_files = mesh_files or {}
+    repo = package_name + '/meshes/'  # the repository of the mesh files
+    collision_repo = repo + collision_dir + '/' if collision_dir else None
+
+    def make(name, xyz, frame=None):
+        fmt, collision_fmt = mesh_files.get(name, (mesh_format, mesh_format))
+        return _make_link(name, xyz, inertial_dict[name], repo, collision_repo if collision_fmt else None,
+                          collision_primitives.get(name), fmt, frame, collision_fmt)
+
+    # base_link keeps the world frame
+    links = [make('base_link', [0, 0, 0])]
+    for name in tree.order[1:]:
+        links.append(make(name, tree.origin[name], frames.links.get(name) if frames is not None else None))
+    return links
+
+
+def make_model(joints_dict, inertial_dict, package_name, tree=None, frames=None, collision_dir=None,
+               collision_primitives=None, mesh_format='stl', mesh_files=None):
+    """
+    Parameters
+    ----------
+    joints_dict: {name: {parent, child, xyz, axis, ...}}
+        see make_joints
+    inertial_dict: {name: {mass, inertia, center_of_mass}}
+        in world coordinates; None leaves the links unresolved
+    package_name: str
+    tree: Kinematics.KinematicTree
+        tree of joints_dict, built here if None
+    frames, collision_dir, collision_primitives, mesh_format, mesh_files:
+        see make_links
+
+    Returns
+    ----------
+    model: RobotModel
+
+    Raises
+    ----------
+    KinematicTreeError
+        if joints are not connected to base_link
+    """
+    tree = tree or KinematicTree.from_joints(joints_dict)
+    tree.check()
+    links = None
+    if inertial_dict is not None:
+        links = make_links(inertial_dict, package_name, tree, frames, collision_dir, collision_primitives,
+                           mesh_format, mesh_files)
+    return RobotModel(links, make_joints(joints_dict, tree, frames), tree)
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+Plain-Python snapshot of the design data the exporter needs.
+
+take_snapshot reads every occurrence, joint, transform and sanitized name
+from the Fusion API exactly once. make_joints_dict, make_inertial_dict,
+copy_occs and the writers then work on these objects only, so the number of
+slow API round trips no longer grows with the number of times a stage looks
+at a joint.
+
+Units are kept as Fusion reports them (cm, kg, kg*cm^2); the stages convert.
+
+Mass properties are the expensive part and are read on demand, only for
+the occurrences that become links (DesignSnapshot.mass), at one of three
+accuracy tiers: 'draft' (Low), 'normal' (High) or 'final' (VeryHigh).
+refine_mass_properties upgrades, link by link, only the ones that still
+change between consecutive tiers.
+
+They are read once per component, in component coordinates, and moved to
+each occurrence with its transform (rotation of the tensor plus parallel
+axis theorem), so repeated parts such as wheels or finger segments cost a
+single API call.
+
+dump_snapshot saves a snapshot with the mass properties of the links and
+the exported STLs to a JSON file (design_snapshot.json.gz next to the log
+with ExportOptions.dump_snapshot); load_snapshot reads it back without
+Fusion, for `python -m URDF_Exporter` (see __main__.py).
+"""
+
+import base64
+import gzip
+import json
+import re
+from dataclasses import dataclass, field
+try:
+    import adsk, adsk.core, adsk.fusion
+except ImportError:  # loaded from a snapshot file, outside Fusion
+    adsk = None
+from ..utils import utils, metrics
+
+ACCURACY_TIERS = ('draft', 'normal', 'final')
+SNAPSHOT_NAME = 'design_snapshot.json.gz'
+SNAPSHOT_VERSION = 1
+
+
+def tier_accuracy(tier):
+    """adsk.fusion.CalculationAccuracy of an accuracy tier."""
+    accuracy = adsk.fusion.CalculationAccuracy
+    return {'draft': accuracy.LowCalculationAccuracy,
+            'normal': accuracy.HighCalculationAccuracy,
+            'final': accuracy.VeryHighCalculationAccuracy}[tier]
+
+
+def sanitize(name):
+    """Occurrence name as used for links and mesh files."""
+    return re.sub('[ :()]', '_', name)
+
+
+@dataclass(frozen=True, slots=True)
+class OccurrenceSnapshot:
+    """
+    Attributes
+    ----------
+    key: str
+        fullPathName, unique for each occurrence in the design
+    name: str
+        sanitized occurrence name (ex: 'arm_1' for 'arm:1')
+    link_name: str
+        'base_link' for an occurrence of the base_link component, else name
+    component_name: str
+        name of the referenced component
+    transform: (16 floats)
+        occurrence transform, row major as returned by Matrix3D.asArray()
+    body_count: int
+        number of bodies in the component
+    native: adsk.fusion.Occurrence
+        the API object, for the stages that must call back into Fusion
+        (mass properties, mesh export)
+    """
+    key: str
+    name: str
+    link_name: str
+    component_name: str
+    transform: tuple
+    body_count: int
+    native: object = field(default=None, compare=False, repr=False)
+
+    @property
+    def translation(self):
+        m = self.transform
+        return (m[3], m[7], m[11])
+
+
+@dataclass(frozen=True, slots=True)
+class JointSnapshot:
+    """
+    Attributes
+    ----------
+    name: str
+        name of the joint
+    joint_type: int
+        jointMotion.jointType
+    axis: (x, y, z) or None
+        rotation axis (revolute) or slide direction (slider)
+    limits: (max_enabled, min_enabled, maximum, minimum) or None
+        rotation or slide limits; the values are only read when both are enabled
+    occurrence_one, occurrence_two: str
+        keys of occurrenceOne and occurrenceTwo
+    origin_one, origin_two: (x, y, z) or None
+        joint origin in the coordinates of occurrenceOne / occurrenceTwo,
+        None when the geometry has no readable origin
+    """
+    name: str
+    joint_type: int
+    axis: tuple
+    limits: tuple
+    occurrence_one: str
+    occurrence_two: str
+    origin_one: tuple
+    origin_two: tuple
+    native: object = field(default=None, compare=False, repr=False)
+
+
+@dataclass(frozen=True, slots=True)
+class MassProperties:
+    """
+    Attributes
+    ----------
+    mass: float
+        kg
+    center_of_mass: (x, y, z)
+        world coordinates in cm
+    moments: (xx, yy, zz, xy, yz, xz)
+        moments of inertia about the world origin in kg*cm^2, as returned by
+        getXYZMomentsOfInertia()
+    """
+    mass: float
+    center_of_mass: tuple
+    moments: tuple
+
+
+@dataclass(slots=True)
+class DesignSnapshot:
+    """
+    Attributes
+    ----------
+    root_name: str
+        name of the root component
+    occurrences: {key: OccurrenceSnapshot}
+        every top-level occurrence plus every occurrence a joint refers to
+    top_level: (key, ...)
+        keys of root.occurrences in design order
+    joints: (JointSnapshot, ...)
+        root.joints in design order
+    mass_tier: str
+        accuracy tier mass() reads new mass properties at
+    mass_properties: {key: MassProperties}
+        physical properties read so far (see mass)
+    mass_tiers: {key: str}
+        accuracy tier each entry of mass_properties was computed at
+    component_mass: {(component_name, tier): MassProperties}
+        physical properties read from Fusion, in component coordinates
+    """
+    root_name: str
+    occurrences: dict
+    top_level: tuple
+    joints: tuple
+    mass_tier: str = 'final'
+    mass_properties: dict = field(default_factory=dict)
+    mass_tiers: dict = field(default_factory=dict)
+    component_mass: dict = field(default_factory=dict)
+
+    def top_level_occurrences(self):
+        return [self.occurrences[k] for k in self.top_level]
+
+    def mass(self, key):
+        """MassProperties of occurrence key, read from Fusion on first use."""
+        prop = self.mass_properties.get(key)
+        if prop is None:
+            prop = self.mass_at(key, self.mass_tier)
+            self.mass_properties[key] = prop
+            self.mass_tiers[key] = self.mass_tier
+        return prop
+
+    def mass_at(self, key, tier):
+        """
+        MassProperties of occurrence key at an accuracy tier, derived from
+        the (cached) properties of its component. Not stored in
+        mass_properties.
+        """
+        occ = self.occurrences[key]
+        if occ.native is None:
+            raise LookupError('no mass properties of {} in the snapshot'.format(key))
+        if not _is_rigid(occ.transform):
+            # scaled occurrences: the tensor does not simply rotate
+            return _read_mass_properties(occ.native, tier_accuracy(tier))
+        local = self.component_mass.get((occ.component_name, tier))
+        if local is None:
+            local = _read_mass_properties(occ.native.component, tier_accuracy(tier))
+            self.component_mass[(occ.component_name, tier)] = local
+        return transform_mass_properties(local, occ.transform)
+
+
+def _read_occurrence(occ):
+    component_name = occ.component.name
+    name = sanitize(occ.name)
+    return OccurrenceSnapshot(
+        key=occ.fullPathName,
+        name=name,
+        link_name='base_link' if component_name == 'base_link' else name,
+        component_name=component_name,
+        transform=tuple(occ.transform.asArray()),
+        body_count=occ.bRepBodies.count,
+        native=occ)
+
+
+def _read_origin(geometry):
+    """Local joint origin of a JointGeometry or JointOrigin, None if unavailable."""
+    try:
+        if hasattr(geometry, 'origin'):
+            return tuple(geometry.origin.asArray())
+        return tuple(geometry.geometry.origin.asArray())
+    except Exception:
+        return None
+
+
+def _read_limits(limits):
+    max_enabled = limits.isMaximumValueEnabled
+    min_enabled = limits.isMinimumValueEnabled
+    if max_enabled and min_enabled:
+        return (True, True, limits.maximumValue, limits.minimumValue)
+    return (max_enabled, min_enabled, None, None)
+
+
+def _read_mass_properties(entity, accuracy):
+    # entity: an Occurrence (world coordinates) or a Component (its own)
+    metrics.count('physical_property_reads')
+    prop = entity.getPhysicalProperties(accuracy)
+    (_, xx, yy, zz, xy, yz, xz) = prop.getXYZMomentsOfInertia()
+    return MassProperties(mass=prop.mass,
+                          center_of_mass=tuple(prop.centerOfMass.asArray()),
+                          moments=(xx, yy, zz, xy, yz, xz))
+
+
+def _is_rigid(m, tolerance=1e-9):
+    rows = (m[0:3], m[4:7], m[8:11])
+    return all(abs(sum(a*b for a, b in zip(rows[i], rows[j])) - (i == j)) <= tolerance
+               for i in range(3) for j in range(i, 3))
+
+
+def transform_mass_properties(prop, transform):
+    """
+    MassProperties of a rigidly moved body.
+
+    Parameters
+    ----------
+    prop: MassProperties
+        mass properties in the body's own coordinates
+    transform: (16 floats)
+        rigid transform, row major (Matrix3D.asArray())
+
+    Returns
+    ----------
+    prop: MassProperties
+        center of mass and moments about the origin in the coordinates the
+        transform maps to
+    """
+    m = transform
+    rotation = ((m[0], m[1], m[2]), (m[4], m[5], m[6]), (m[8], m[9], m[10]))
+    mass = prop.mass
+    # tensor about the center of mass, in body coordinates
+    xx, yy, zz, xy, yz, xz = _center_moments(prop)
+    tensor = ((xx, xy, xz), (xy, yy, yz), (xz, yz, zz))
+    # R I R^T
+    ri = [[sum(rotation[i][k] * tensor[k][j] for k in range(3)) for j in range(3)] for i in range(3)]
+    rot = [[sum(ri[i][k] * rotation[j][k] for k in range(3)) for j in range(3)] for i in range(3)]
+    cx, cy, cz = prop.center_of_mass
+    com = tuple(rotation[i][0]*cx + rotation[i][1]*cy + rotation[i][2]*cz + m[4*i + 3] for i in range(3))
+    # back to the origin (parallel axis theorem)
+    x, y, z = com
+    moments = (rot[0][0] + mass*(y*y + z*z), rot[1][1] + mass*(x*x + z*z), rot[2][2] + mass*(x*x + y*y),
+               rot[0][1] - mass*x*y, rot[1][2] - mass*y*z, rot[0][2] - mass*x*z)
+    return MassProperties(mass=mass, center_of_mass=com, moments=moments)
+
+
+def take_snapshot(root, tier='final'):
+    """
+    Read everything the exporter needs from the design in one pass.
+
+    Parameters
+    ----------
+    root: adsk.fusion.Component
+        root component
+    tier: str
+        accuracy tier of the physical properties, one of ACCURACY_TIERS;
+        they are read later, on demand (see DesignSnapshot.mass)
+
+    Returns
+    ----------
+    snapshot: DesignSnapshot
+    """
+    occurrences = {}
+    top_level = []
+    for occ in root.occurrences:
+        snap = _read_occurrence(occ)
+        occurrences[snap.key] = snap
+        top_level.append(snap.key)
+
+    def occurrence_key(occ):
+        # joints may reference nested occurrences (proxies); only read the
+        # ones the top-level pass has not seen
+        key = occ.fullPathName
+        if key not in occurrences:
+            occurrences[key] = _read_occurrence(occ)
+        return key
+
+    joints = []
+    for joint in root.joints:
+        motion = joint.jointMotion
+        joint_type = motion.jointType
+        axis = limits = None
+        if joint_type == adsk.fusion.JointTypes.RevoluteJointType:
+            axis = tuple(motion.rotationAxisVector.asArray())
+            limits = _read_limits(motion.rotationLimits)
+        elif joint_type == adsk.fusion.JointTypes.SliderJointType:
+            axis = tuple(motion.slideDirectionVector.asArray())
+            limits = _read_limits(motion.slideLimits)
+        joints.append(JointSnapshot(
+            name=joint.name,
+            joint_type=joint_type,
+            axis=axis,
+            limits=limits,
+            occurrence_one=occurrence_key(joint.occurrenceOne),
+            occurrence_two=occurrence_key(joint.occurrenceTwo),
+            origin_one=_read_origin(joint.geometryOrOriginOne),
+            origin_two=_read_origin(joint.geometryOrOriginTwo),
+            native=joint))
+
+    metrics.count('occurrences', len(occurrences))
+    metrics.count('joints', len(joints))
+    return DesignSnapshot(root_name=root.name,
+                          occurrences=occurrences,
+                          top_level=tuple(top_level),
+                          joints=tuple(joints),
+                          mass_tier=tier)
+
+
+def _center_moments(prop):
+    # moments about the center of mass, so that the comparison is not
+    # dominated by m*r^2 of links far from the origin
+    x, y, z = prop.center_of_mass
+    m = prop.mass
+    shift = (y*y + z*z, x*x + z*z, x*x + y*y, -x*y, -y*z, -x*z)
+    return [i - m*t for i, t in zip(prop.moments, shift)]
+
+
+def mass_change(old, new):
+    """
+    Relative change between two MassProperties of the same occurrence: the
+    larger of the mass change and the change of the inertia tensor about
+    the center of mass (Frobenius norm, relative to the new tensor).
+    """
+    mass = abs(new.mass - old.mass) / abs(new.mass) if new.mass else abs(old.mass)
+    a, b = _center_moments(old), _center_moments(new)
+    # the products appear twice in the symmetric tensor
+    weights = (1, 1, 1, 2, 2, 2)
+    diff = sum(w * (i - j)**2 for w, i, j in zip(weights, a, b)) ** 0.5
+    norm = sum(w * j**2 for w, j in zip(weights, b)) ** 0.5
+    inertia = diff / norm if norm else diff
+    return max(mass, inertia)
+
+
+def refine_mass_properties(snapshot, tolerance, keys=None):
+    """
+    Progressive second pass over the mass properties.
+
+    Every link below the 'final' tier is recomputed at the next tier; as
+    long as the result changes by more than tolerance (see mass_change) it
+    moves on to the following one. Links whose properties have converged
+    stay at the cheaper tier.
+
+    Parameters
+    ----------
+    snapshot: DesignSnapshot
+        updated in place
+    tolerance: float
+        relative change below which a link is considered converged
+    keys: [str]
+        occurrences to refine, every entry of snapshot.mass_properties if
+        None; missing ones are read at snapshot.mass_tier first
+
+    Returns
+    ----------
+    changes: {key: [(tier, change), ...]}
+        tiers each refined link went through and the change measured there
+    """
+    changes = {}
+    for key in (list(snapshot.mass_properties) if keys is None else keys):
+        old = snapshot.mass(key)
+        tier = snapshot.mass_tiers[key]
+        steps = []
+        while tier != 'final':
+            tier = ACCURACY_TIERS[ACCURACY_TIERS.index(tier) + 1]
+            new = snapshot.mass_at(key, tier)
+            change = mass_change(old, new)
+            old = new
+            snapshot.mass_properties[key] = new
+            snapshot.mass_tiers[key] = tier
+            steps.append((tier, change))
+            if change <= tolerance:
+                break
+        if steps:
+            changes[key] = steps
+    return changes
+
+
+def dump_snapshot(snapshot, file_name, keys=None, meshes=None):
+    """
+    Save a snapshot as JSON, gzip compressed if file_name ends with .gz.
+
+    Parameters
+    ----------
+    snapshot: DesignSnapshot
+    file_name: str
+        replaced atomically (utils.atomic_open)
+    keys: [str]
+        occurrences whose mass properties are saved, read first where they
+        are missing; those read so far if None
+    meshes: {name: (bytes, fingerprint)}
+        exported binary STLs and their manifest fingerprints (see
+        manifest.MeshManifest.exported_meshes)
+    """
+    keys = list(snapshot.mass_properties) if keys is None else keys
+    mass_properties = {}
+    for key in keys:
+        prop = snapshot.mass(key)
+        mass_properties[key] = {'mass': prop.mass, 'center_of_mass': prop.center_of_mass,
+                                'moments': prop.moments, 'tier': snapshot.mass_tiers[key]}
+    data = {
+        'version': SNAPSHOT_VERSION,
+        'root_name': snapshot.root_name,
+        'mass_tier': snapshot.mass_tier,
+        'occurrences': [{'key': o.key, 'name': o.name, 'link_name': o.link_name,
+                         'component_name': o.component_name, 'transform': o.transform,
+                         'body_count': o.body_count} for o in snapshot.occurrences.values()],
+        'top_level': snapshot.top_level,
+        'joints': [{'name': j.name, 'joint_type': j.joint_type, 'axis': j.axis, 'limits': j.limits,
+                    'occurrence_one': j.occurrence_one, 'occurrence_two': j.occurrence_two,
+                    'origin_one': j.origin_one, 'origin_two': j.origin_two} for j in snapshot.joints],
+        'mass_properties': mass_properties,
+        'meshes': {name: {'fingerprint': fp, 'stl': base64.b64encode(stl).decode('ascii')}
+                   for name, (stl, fp) in (meshes or {}).items()},
+    }
+    payload = json.dumps(data).encode('utf-8')
+    if file_name.endswith('.gz'):
+        payload = gzip.compress(payload, mtime=0)
+    with utils.atomic_open(file_name, 'wb') as f:
+        f.write(payload)
+
+
+def _tuple(value):
+    return None if value is None else tuple(value)
+
+
+def load_snapshot(file_name):
+    """
+    Read a file written by dump_snapshot. The snapshot has no natives: the
+    mass properties it holds are all there is.
+
+    Returns
+    ----------
+    snapshot: DesignSnapshot
+    meshes: {name: (bytes, fingerprint)}
+
+    Raises
+    ----------
+    ValueError
+        if the file is of another SNAPSHOT_VERSION
+    """
+    with open(file_name, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    opener = gzip.open if compressed else open
+    with opener(file_name, 'rt', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('{} is a snapshot of version {!r}, expected {}'
+                         .format(file_name, data.get('version'), SNAPSHOT_VERSION))
+    occurrences = {}
+    for o in data['occurrences']:
+        occurrences[o['key']] = OccurrenceSnapshot(
+            key=o['key'], name=o['name'], link_name=o['link_name'], component_name=o['component_name'],
+            transform=tuple(o['transform']), body_count=o['body_count'])
+    joints = tuple(JointSnapshot(
+        name=j['name'], joint_type=j['joint_type'], axis=_tuple(j['axis']), limits=_tuple(j['limits']),
+        occurrence_one=j['occurrence_one'], occurrence_two=j['occurrence_two'],
+        origin_one=_tuple(j['origin_one']), origin_two=_tuple(j['origin_two'])) for j in data['joints'])
+    snapshot = DesignSnapshot(root_name=data['root_name'], occurrences=occurrences,
+                              top_level=tuple(data['top_level']), joints=joints, mass_tier=data['mass_tier'])
+    for key, p in data['mass_properties'].items():
+        snapshot.mass_properties[key] = MassProperties(mass=p['mass'], center_of_mass=tuple(p['center_of_mass']),
+                                                       moments=tuple(p['moments']))
+        snapshot.mass_tiers[key] = p['tier']
+    meshes = {name: (base64.b64decode(m['stl']), m['fingerprint']) for name, m in data['meshes'].items()}
+    return snapshot, meshes
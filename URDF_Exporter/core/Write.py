@@ -5,139 +5,99 @@ Created on Sun May 12 20:46:26 2019
 @author: syuntoku
 """
 
-import adsk, os
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from xml.etree.ElementTree import Element, SubElement
-from . import Link, Joint
-from ..utils import utils
+from ..utils import utils, metrics
 
-def write_link_urdf(joints_dict, repo, links_xyz_dict, file_name, inertial_dict):
+
+class ArtifactError(Exception):
     """
-    Write links information into urdf "repo/file_name"
+    Some artifacts of write_artifacts failed; the others were written.
+
+    Attributes
+    ----------
+    failures: {name: exception}
+        the exception of every failed writer
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__('\n'.join('{}: {}: {}'.format(name, type(e).__name__, e)
+                                    for name, e in failures.items()))
+
+def write_link_urdf(model, f):
+    """
+    Write links information into the open urdf handle f
     
     
     Parameters
     ----------
-    joints_dict: dict
-        information of the each joint
-    repo: str
-        the name of the repository to save the xml file
-    links_xyz_dict: vacant dict
-        xyz information of the each link
-    file_name: str
-        urdf full path
-    inertial_dict:
-        information of the each inertial
+    model: Model.RobotModel
+        resolved links, in topological order
+    f: file object
+        urdf handle opened by write_urdf
     
     Note
     ----------
-    In this function, links_xyz_dict is set for write_joint_tran_urdf.
     The origin of the coordinate of center_of_mass is the coordinate of the link
     """
-    with open(file_name, mode='a') as f:
-        # for base_link
-        center_of_mass = inertial_dict['base_link']['center_of_mass']
-        link = Link.Link(name='base_link', xyz=[0,0,0], 
-            center_of_mass=center_of_mass, repo=repo,
-            mass=inertial_dict['base_link']['mass'],
-            inertia_tensor=inertial_dict['base_link']['inertia'])
-        links_xyz_dict[link.name] = link.xyz
+    for link in model.links:
         link.make_link_xml()
-        f.write(link.link_xml or '')
-        f.write('\n')
+        f.write((link.link_xml or '') + '\n')
 
-        # others
-        for joint in joints_dict:
-            name = joints_dict[joint]['child']
-            # If the link has already been written (appears as child in another joint), skip
-            # to keep the link origin determined by the primary (spanning-tree) joint.
-            if name in links_xyz_dict:
-                continue
-            center_of_mass = \
-                [ i-j for i, j in zip(inertial_dict[name]['center_of_mass'], joints_dict[joint]['xyz'])]
-            link = Link.Link(name=name, xyz=joints_dict[joint]['xyz'],\
-                center_of_mass=center_of_mass,\
-                repo=repo, mass=inertial_dict[name]['mass'],\
-                inertia_tensor=inertial_dict[name]['inertia'])
-            links_xyz_dict[link.name] = link.xyz            
-            link.make_link_xml()
-            f.write(link.link_xml or '')
-            f.write('\n')
 
-
-def write_joint_urdf(joints_dict, repo, links_xyz_dict, file_name):
+def write_joint_urdf(model, f):
     """
-    Write joints and transmission information into urdf "repo/file_name"
+    Write joints information into the open urdf handle f
     
     
     Parameters
     ----------
-    joints_dict: dict
-        information of the each joint
-    repo: str
-        the name of the repository to save the xml file
-    links_xyz_dict: dict
-        xyz information of the each link
-    file_name: str
-        urdf full path
+    model: Model.RobotModel
+        resolved joints, in topological order (loop closures are left out)
+    f: file object
+        urdf handle opened by write_urdf
     """
-    
-    with open(file_name, mode='a') as f:
-        for j in joints_dict:
-            parent = joints_dict[j]['parent']
-            child = joints_dict[j]['child']
-            joint_type = joints_dict[j]['type']
-            upper_limit = joints_dict[j]['upper_limit']
-            lower_limit = joints_dict[j]['lower_limit']
-            out_name = joints_dict[j].get('output_name', j)
-            try:
-                xyz = [round(p-c, 6) for p, c in \
-                    zip(links_xyz_dict[parent], links_xyz_dict[child])]  # xyz = parent - child
-            except KeyError as ke:
-                app = adsk.core.Application.get()
-                ui = app.userInterface
-                ui.messageBox("There seems to be an error with the connection between\n\n%s\nand\n%s\n\nCheck \
-whether the connections\nparent=component2=%s\nchild=component1=%s\nare correct or if you need \
-to swap component1<=>component2"
-                % (parent, child, parent, child), "Error!")
-                quit()
-                
-            joint = Joint.Joint(
-                name=out_name,
-                joint_type=joint_type,
-                xyz=xyz,
-                axis=joints_dict[j]['axis'],
-                parent=parent,
-                child=child,
-                upper_limit=upper_limit,
-                lower_limit=lower_limit,
-                mimic=joints_dict[j].get('mimic')
-            )
-            joint.make_joint_xml()
-            joint.make_transmission_xml()
-            f.write(joint.joint_xml or '')
-            f.write('\n')
+    for joint in model.joints:
+        joint.make_joint_xml()
+        f.write((joint.joint_xml or '') + '\n')
 
-def write_gazebo_endtag(file_name):
+def write_gazebo_endtag(f):
     """
     Write about gazebo_plugin and the </robot> tag at the end of the urdf
     
     
     Parameters
     ----------
-    file_name: str
-        urdf full path
+    f: file object
+        urdf handle opened by write_urdf
     """
-    with open(file_name, mode='a') as f:
-        f.write('</robot>\n')
-        
+    f.write('</robot>\n')
+
+
+def write_urdf(model, package_name, robot_name, save_dir):
+    """
+    Write "save_dir/urdf/robot_name.urdf"
+
 
-def write_urdf(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir):
+    Parameters
+    ----------
+    model: Model.RobotModel
+        see Model.make_model
+    package_name: str
+    robot_name: str
+    save_dir: str
+        path of the package
+    """
     try: os.mkdir(save_dir + '/urdf')
     except: pass 
 
     file_name = save_dir + '/urdf/' + robot_name + '.urdf'  # the name of urdf file
-    repo = package_name + '/meshes/'  # the repository of binary stl files
-    with open(file_name, mode='w') as f:
+    # one buffered handle for the whole file, renamed into place only once
+    # the closing tag has been written
+    with utils.atomic_open(file_name) as f:
         f.write('<?xml version="1.0" ?>\n')
         f.write('<robot name="{}" xmlns:xacro="http://www.ros.org/wiki/xacro">\n'.format(robot_name))
         f.write('\n')
@@ -148,16 +108,16 @@ def write_urdf(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_n
         f.write('<xacro:include filename="$(find {})/urdf/{}.gazebo" />'.format(package_name, robot_name))
         f.write('\n')
 
-    write_link_urdf(joints_dict, repo, links_xyz_dict, file_name, inertial_dict)
-    write_joint_urdf(joints_dict, repo, links_xyz_dict, file_name)
-    write_gazebo_endtag(file_name)
+        write_link_urdf(model, f)
+        write_joint_urdf(model, f)
+        write_gazebo_endtag(f)
 
-def write_materials_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir):
+def write_materials_xacro(package_name, robot_name, save_dir):
     try: os.mkdir(save_dir + '/urdf')
     except: pass  
 
     file_name = save_dir + '/urdf/materials.xacro'  # the name of urdf file
-    with open(file_name, mode='w') as f:
+    with utils.atomic_open(file_name) as f:
         f.write('<?xml version="1.0" ?>\n')
         f.write('<robot name="{}" xmlns:xacro="http://www.ros.org/wiki/xacro" >\n'.format(robot_name))
         f.write('\n')
@@ -167,75 +127,43 @@ def write_materials_xacro(joints_dict, links_xyz_dict, inertial_dict, package_na
         f.write('\n')
         f.write('</robot>\n')
 
-def write_transmissions_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir):
+def write_transmissions_xacro(model, package_name, robot_name, save_dir):
     """
-    Write joints and transmission information into urdf "repo/file_name"
+    Write the transmissions of the controlled joints into
+    "save_dir/urdf/robot_name.trans"
     
     
     Parameters
     ----------
-    joints_dict: dict
-        information of the each joint
-    repo: str
-        the name of the repository to save the xml file
-    links_xyz_dict: dict
-        xyz information of the each link
-    file_name: str
-        urdf full path
+    model: Model.RobotModel
+        see Model.make_model
+    package_name: str
+    robot_name: str
+    save_dir: str
+        path of the package
     """
-    
     file_name = save_dir + '/urdf/{}.trans'.format(robot_name)  # the name of urdf file
-    with open(file_name, mode='w') as f:
+    with utils.atomic_open(file_name) as f:
         f.write('<?xml version="1.0" ?>\n')
         f.write('<robot name="{}" xmlns:xacro="http://www.ros.org/wiki/xacro" >\n'.format(robot_name))
         f.write('\n')
 
-        for j in joints_dict:
-            parent = joints_dict[j]['parent']
-            child = joints_dict[j]['child']
-            joint_type = joints_dict[j]['type']
-            upper_limit = joints_dict[j]['upper_limit']
-            lower_limit = joints_dict[j]['lower_limit']
-            out_name = joints_dict[j].get('output_name', j)
-            try:
-                xyz = [round(p-c, 6) for p, c in \
-                    zip(links_xyz_dict[parent], links_xyz_dict[child])]  # xyz = parent - child
-            except KeyError as ke:
-                app = adsk.core.Application.get()
-                ui = app.userInterface
-                ui.messageBox("There seems to be an error with the connection between\n\n%s\nand\n%s\n\nCheck \
-whether the connections\nparent=component2=%s\nchild=component1=%s\nare correct or if you need \
-to swap component1<=>component2"
-                % (parent, child, parent, child), "Error!")
-                quit()
-                
-            joint = Joint.Joint(
-                name=out_name,
-                joint_type=joint_type,
-                xyz=xyz,
-                axis=joints_dict[j]['axis'],
-                parent=parent,
-                child=child,
-                upper_limit=upper_limit,
-                lower_limit=lower_limit,
-                mimic=joints_dict[j].get('mimic')
-            )
-            # Only non-fixed, non-mimic joints get transmissions
-            if joint_type != 'fixed' and joints_dict[j].get('mimic') is None:
-                joint.make_transmission_xml()
-                f.write(joint.tran_xml or '')
-                f.write('\n')
+        # Only non-fixed, non-mimic joints get transmissions
+        for joint in model.controlled_joints():
+            joint.make_transmission_xml()
+            f.write(joint.tran_xml or '')
+            f.write('\n')
 
         f.write('</robot>\n')
 
-def write_gazebo_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name, robot_name, save_dir):
+def write_gazebo_xacro(model, package_name, robot_name, save_dir):
     try: os.mkdir(save_dir + '/urdf')
     except: pass  
 
     file_name = save_dir + '/urdf/' + robot_name + '.gazebo'  # the name of urdf file
     repo = robot_name + '/meshes/'  # the repository of binary stl files
     #repo = package_name + '/' + robot_name + '/bin_stl/'  # the repository of binary stl files
-    with open(file_name, mode='w') as f:
+    with utils.atomic_open(file_name) as f:
         f.write('<?xml version="1.0" ?>\n')
         f.write('<robot name="{}" xmlns:xacro="http://www.ros.org/wiki/xacro" >\n'.format(robot_name))
         f.write('\n')
@@ -245,8 +173,7 @@ def write_gazebo_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name,
         gazebo = Element('gazebo')
         plugin = SubElement(gazebo, 'plugin')
         plugin.attrib = {'name':'control', 'filename':'libgazebo_ros_control.so'}
-        gazebo_xml = "\n".join(utils.prettify(gazebo).split("\n")[1:])
-        f.write(gazebo_xml)
+        utils.write_pretty_xml(gazebo, f)
 
         # for base_link
         f.write('<gazebo reference="base_link">\n')
@@ -259,8 +186,7 @@ def write_gazebo_xacro(joints_dict, links_xyz_dict, inertial_dict, package_name,
         f.write('\n')
 
         # others
-        for joint in joints_dict:
-            name = joints_dict[joint]['child']
+        for name in model.tree.order[1:]:
             f.write('<gazebo reference="{}">\n'.format(name))
             f.write('  <material>${body_color}</material>\n')
             f.write('  <mu1>0.2</mu1>\n')
@@ -312,11 +238,9 @@ def write_display_launch(package_name, robot_name, save_dir):
     node3 = SubElement(launch, 'node')
     node3.attrib = {'name':'rviz', 'pkg':'rviz', 'args':'-d $(arg rvizconfig)', 'type':'rviz', 'required':'true'}
 
-    launch_xml = "\n".join(utils.prettify(launch).split("\n")[1:])        
-
     file_name = save_dir + '/launch/display.launch'    
-    with open(file_name, mode='w') as f:
-        f.write(launch_xml)
+    with utils.atomic_open(file_name) as f:
+        utils.write_pretty_xml(launch, f)
 
 def write_gazebo_launch(package_name, robot_name, save_dir):
     """
@@ -358,14 +282,12 @@ def write_gazebo_launch(package_name, robot_name, save_dir):
 
 
     
-    launch_xml = "\n".join(utils.prettify(launch).split("\n")[1:])        
-    
     file_name = save_dir + '/launch/' + 'gazebo.launch'    
-    with open(file_name, mode='w') as f:
-        f.write(launch_xml)
+    with utils.atomic_open(file_name) as f:
+        utils.write_pretty_xml(launch, f)
 
 
-def write_control_launch(package_name, robot_name, save_dir, joints_dict):
+def write_control_launch(package_name, robot_name, save_dir, model):
     """
     write control launch file "save_dir/launch/controller.launch"
     
@@ -376,10 +298,9 @@ def write_control_launch(package_name, robot_name, save_dir, joints_dict):
         name of the robot
     save_dir: str
         path of the repository to save
-    joints_dict: dict
-        information of the joints
+    model: Model.RobotModel
+        see Model.make_model
     """
-    
     try: os.mkdir(save_dir + '/launch')
     except: pass     
     
@@ -391,12 +312,9 @@ def write_control_launch(package_name, robot_name, save_dir, joints_dict):
     #                   'command':'load'}
                        
     controller_args_str = ""
-    for j in joints_dict:
-        joint_type = joints_dict[j]['type']
-        # Only non-fixed, non-mimic joints get controllers
-        if joint_type != 'fixed' and joints_dict[j].get('mimic') is None:
-            out_name = joints_dict[j].get('output_name', j)
-            controller_args_str += out_name + '_position_controller '
+    # Only non-fixed, non-mimic joints get controllers
+    for joint in model.controlled_joints():
+        controller_args_str += joint.name + '_position_controller '
     controller_args_str += 'joint_state_controller '
 
     node_controller = Element('node')
@@ -411,23 +329,20 @@ def write_control_launch(package_name, robot_name, save_dir, joints_dict):
     remap.attrib = {'from':'/joint_states',\
                     'to':'/' + robot_name + '/joint_states'}
     
-    #launch_xml  = "\n".join(utils.prettify(launch).split("\n")[1:])   
-    launch_xml  = "\n".join(utils.prettify(node_controller).split("\n")[1:])   
-    launch_xml += "\n".join(utils.prettify(node_publisher).split("\n")[1:])   
-
     file_name = save_dir + '/launch/controller.launch'    
-    with open(file_name, mode='w') as f:
+    with utils.atomic_open(file_name) as f:
         f.write('<launch>\n')
         f.write('\n')
         #for some reason ROS is very picky about the attribute ordering, so we'll bitbang this element
         f.write('<rosparam file="$(find {})/launch/controller.yaml" command="load"/>'.format(package_name))
         f.write('\n')
-        f.write(launch_xml)
+        utils.write_pretty_xml(node_controller, f)
+        utils.write_pretty_xml(node_publisher, f)
         f.write('\n')
         f.write('</launch>')
         
 
-def write_yaml(package_name, robot_name, save_dir, joints_dict):
+def write_yaml(package_name, robot_name, save_dir, model):
     """
     write yaml file "save_dir/launch/controller.yaml"
     
@@ -438,15 +353,15 @@ def write_yaml(package_name, robot_name, save_dir, joints_dict):
         name of the robot
     save_dir: str
         path of the repository to save
-    joints_dict: dict
-        information of the joints
+    model: Model.RobotModel
+        see Model.make_model
     """
     try: os.mkdir(save_dir + '/launch')
     except: pass 
 
     controller_name = robot_name + '_controller'
     file_name = save_dir + '/launch/controller.yaml'
-    with open(file_name, 'w') as f:
+    with utils.atomic_open(file_name) as f:
         f.write(controller_name + ':\n')
         # joint_state_controller
         f.write('  # Publish all joint states -----------------------------------\n')
@@ -455,13 +370,130 @@ def write_yaml(package_name, robot_name, save_dir, joints_dict):
         f.write('    publish_rate: 50\n\n')
         # position_controllers
         f.write('  # Position Controllers --------------------------------------\n')
-        for joint in joints_dict:
-            joint_type = joints_dict[joint]['type']
-            # Skip mimic followers for controllers; control the leader only
-            if joint_type != 'fixed' and joints_dict[joint].get('mimic') is None:
-                out_name = joints_dict[joint].get('output_name', joint)
-                f.write('  ' + out_name + '_position_controller:\n')
-                f.write('    type: effort_controllers/JointPositionController\n')
-                f.write('    joint: '+ out_name + '\n')
-                f.write('    pid: {p: 100.0, i: 0.01, d: 10.0}\n')
+        # Skip mimic followers for controllers; control the leader only
+        for joint in model.controlled_joints():
+            f.write('  ' + joint.name + '_position_controller:\n')
+            f.write('    type: effort_controllers/JointPositionController\n')
+            f.write('    joint: '+ joint.name + '\n')
+            f.write('    pid: {p: 100.0, i: 0.01, d: 10.0}\n')
+
+
+def write_collision_spheres(package_name, robot_name, save_dir, spheres):
+    """
+    write the sphere approximation of the links into
+    "save_dir/config/collision_spheres.yaml"
+    
+    
+    Parameter
+    ---------
+    robot_name: str
+        name of the robot
+    save_dir: str
+        path of the repository to save
+    spheres: {link name: [((x, y, z), radius)]}
+        sphere centers in the link frame, meters
+    """
+    try: os.mkdir(save_dir + '/config')
+    except: pass 
+
+    file_name = save_dir + '/config/collision_spheres.yaml'
+    with utils.atomic_open(file_name) as f:
+        f.write('# sphere approximation of the links of {}, meters in the link frames\n'.format(robot_name))
+        f.write('collision_spheres:\n')
+        for link_name, link_spheres in spheres.items():
+            f.write('  {}:\n'.format(link_name))
+            for center, radius in link_spheres:
+                f.write('    - center: [{}]\n'.format(', '.join(str(round(c, 6)) for c in center)))
+                f.write('      radius: {}\n'.format(round(radius, 6)))
 
+
+# writers that only need the joints of the model (see pipeline.py)
+JOINT_ARTIFACTS = ('write_materials_xacro', 'write_transmissions_xacro', 'write_gazebo_xacro',
+                   'write_display_launch', 'write_gazebo_launch', 'write_control_launch', 'write_yaml',
+                   'copy_package')
+
+
+def write_artifacts(model, package_name, robot_name, save_dir, package_dir, workers=1, names=None):
+    """
+    Write every text file of the package and copy the package template,
+    on a pool of threads.
+
+    The writers are independent once the model exists: each renders its own
+    file through utils.atomic_open. A failing writer does not stop the others;
+    the failures are raised together once all are done.
+
+
+    Parameters
+    ----------
+    model: Model.RobotModel
+        see Model.make_model
+    package_name: str
+    robot_name: str
+    save_dir: str
+        path of the package
+    package_dir: str
+        package template copied into save_dir
+    workers: int
+        threads; 1 writes the files one after another on the calling thread
+    names: [str]
+        writers to run, all if None (JOINT_ARTIFACTS do not need model.links)
+
+    Returns
+    ----------
+    seconds: {name: float}
+        wall time of each writer
+
+    Raises
+    ----------
+    ArtifactError
+        if any writer failed
+    """
+    common = (package_name, robot_name, save_dir)
+
+    def package():
+        utils.copy_package(save_dir, package_dir)
+        utils.update_cmakelists(save_dir, package_name)
+        utils.update_package_xml(save_dir, package_name)
+
+    tasks = {
+        'write_urdf': lambda: write_urdf(model, *common),
+        'write_materials_xacro': lambda: write_materials_xacro(*common),
+        'write_transmissions_xacro': lambda: write_transmissions_xacro(model, *common),
+        'write_gazebo_xacro': lambda: write_gazebo_xacro(model, *common),
+        'write_display_launch': lambda: write_display_launch(*common),
+        'write_gazebo_launch': lambda: write_gazebo_launch(*common),
+        'write_control_launch': lambda: write_control_launch(*common, model),
+        'write_yaml': lambda: write_yaml(*common, model),
+        'copy_package': package,
+    }
+    if names is not None:
+        tasks = {name: tasks[name] for name in names}
+    # the writers share these directories; create them before any runs
+    for directory in ('urdf', 'launch'):
+        os.makedirs(os.path.join(save_dir, directory), exist_ok=True)
+
+    def timed(name, fn):
+        t0 = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - t0
+        metrics.add_time(name, seconds)
+        return seconds
+
+    seconds, failures = {}, {}
+    if workers <= 1 or len(tasks) <= 1:
+        for name, fn in tasks.items():
+            try:
+                seconds[name] = timed(name, fn)
+            except Exception as e:
+                failures[name] = e
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tasks)), thread_name_prefix='artifacts') as pool:
+            futures = {name: pool.submit(timed, name, fn) for name, fn in tasks.items()}
+        for name, future in futures.items():
+            if future.exception() is not None:
+                failures[name] = future.exception()
+            else:
+                seconds[name] = future.result()
+    if failures:
+        raise ArtifactError(failures)
+    return seconds
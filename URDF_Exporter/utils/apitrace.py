@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Count and time the Fusion API round trips of one export.
+
+Every property read and method call on an adsk object is a round trip
+into Fusion, and their cost is invisible in a Python profile, which only
+shows the script lines around them. With ExportOptions.trace_api run()
+hands the stages a traced design instead of the real one:
+
+    tracer = Tracer()
+    design = tracer.wrap(design)
+
+Everything reached from it (design.rootComponent, the occurrences and
+joints take_snapshot reads, the natives the mass properties and mesh
+export call back into, copy_occs' temporary components) is wrapped in
+turn, and each access is recorded under the type of the object and the
+name used:
+
+    Occurrence.transform        property read
+    Matrix3D.asArray()          method call
+    Component.name=             property write
+    Occurrences[]               one item of an iteration or index
+
+Plain values (numbers, strings, lists) are returned as they are, and
+traced objects passed back into the API are unwrapped first, so the
+stages run unchanged. Times cover the call into Fusion only, not the
+proxy around it. Fusion's API is main-thread only and so is the tracer.
+"""
+
+import time
+
+# values returned unwrapped
+_PLAIN = (bool, int, float, complex, str, bytes, type(None), list, tuple, dict)
+
+
+class Tracer:
+    """
+    Attributes
+    ----------
+    calls: {(type_name, name): [count, seconds]}
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    def record(self, type_name, name, seconds):
+        entry = self.calls.get((type_name, name))
+        if entry is None:
+            self.calls[(type_name, name)] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def wrap(self, value):
+        """value traced by this tracer, as it is if it is a plain value."""
+        if isinstance(value, _PLAIN) or isinstance(value, TracedObject):
+            return value
+        return TracedObject(value, self)
+
+    def totals(self):
+        """(round trips, seconds) of everything recorded."""
+        return (sum(c for c, _ in self.calls.values()), sum(s for _, s in self.calls.values()))
+
+    def report(self, limit=30):
+        """
+        Log lines ranking the recorded accesses by total time.
+
+        Parameters
+        ----------
+        limit: int
+            number of (type, name) entries listed
+
+        Returns
+        ----------
+        lines: [str]
+        """
+        count, seconds = self.totals()
+        lines = ['[api] {} round trips, {:.3f}s in the Fusion API'.format(count, seconds)]
+        by_type = {}
+        for (type_name, _), (c, s) in self.calls.items():
+            entry = by_type.setdefault(type_name, [0, 0.0])
+            entry[0] += c
+            entry[1] += s
+        ranked = sorted(by_type.items(), key=lambda item: -item[1][1])
+        lines.append('[api] by type: ' + ', '.join('{} {:.3f}s ({})'.format(t, s, c) for t, (c, s) in ranked))
+        lines.append('[api] {:>9} {:>8} {:>9}  {}'.format('seconds', 'calls', 'mean us', 'access'))
+        ranked = sorted(self.calls.items(), key=lambda item: -item[1][1])
+        for (type_name, name), (c, s) in ranked[:limit]:
+            lines.append('[api] {:9.4f} {:8d} {:9.1f}  {}{}'.format(
+                s, c, 1e6 * s / c, type_name, name if name.endswith('[]') else '.' + name))
+        if len(ranked) > limit:
+            lines.append('[api] ... {} more'.format(len(ranked) - limit))
+        return lines
+
+
+def _unwrap(value):
+    if isinstance(value, TracedObject):
+        return object.__getattribute__(value, '_traced')
+    if isinstance(value, (list, tuple)):
+        return type(value)(_unwrap(v) for v in value)
+    return value
+
+
+class TracedObject:
+    """Proxy recording every access to an adsk object in a Tracer (see Tracer.wrap)."""
+
+    __slots__ = ('_traced', '_tracer')
+
+    def __init__(self, obj, tracer):
+        object.__setattr__(self, '_traced', obj)
+        object.__setattr__(self, '_tracer', tracer)
+
+    def __getattr__(self, name):
+        obj, tracer = self._traced, self._tracer
+        type_name = type(obj).__name__
+        t0 = time.perf_counter()
+        value = getattr(obj, name)
+        seconds = time.perf_counter() - t0
+        if not callable(value) or isinstance(value, type):
+            tracer.record(type_name, name, seconds)
+            return tracer.wrap(value)
+
+        # methods are looked up in Python; the round trip is the call
+        def call(*args, **kwargs):
+            args = [_unwrap(a) for a in args]
+            kwargs = {k: _unwrap(v) for k, v in kwargs.items()}
+            t0 = time.perf_counter()
+            try:
+                return tracer.wrap(value(*args, **kwargs))
+            finally:
+                tracer.record(type_name, name + '()', time.perf_counter() - t0)
+        return call
+
+    def __setattr__(self, name, value):
+        obj = self._traced
+        t0 = time.perf_counter()
+        try:
+            setattr(obj, name, _unwrap(value))
+        finally:
+            self._tracer.record(type(obj).__name__, name + '=', time.perf_counter() - t0)
+
+    def __iter__(self):
+        obj, tracer = self._traced, self._tracer
+        type_name = type(obj).__name__
+        items = iter(obj)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            tracer.record(type_name, '[]', time.perf_counter() - t0)
+            yield tracer.wrap(item)
+
+    def __getitem__(self, index):
+        obj = self._traced
+        t0 = time.perf_counter()
+        try:
+            return self._tracer.wrap(obj[_unwrap(index)])
+        finally:
+            self._tracer.record(type(obj).__name__, '[]', time.perf_counter() - t0)
+
+    def __len__(self):
+        obj = self._traced
+        t0 = time.perf_counter()
+        try:
+            return len(obj)
+        finally:
+            self._tracer.record(type(obj).__name__, 'len()', time.perf_counter() - t0)
+
+    def __bool__(self):
+        return bool(self._traced)
+
+    def __eq__(self, other):
+        return self._traced == _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._traced)
+
+    def __repr__(self):
+        return repr(self._traced)
+
+    def __str__(self):
+        return str(self._traced)
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Mass, center of mass and inertia tensor of the exported meshes.
+
+The closed triangle mesh of a link is split into signed tetrahedra, one per
+triangle with the fourth vertex at a reference point; their volume
+integrals (divergence theorem) are summed over all triangles at once with
+numpy. With a density this replaces getPhysicalProperties, either during
+the export (ExportOptions.inertia_engine = 'mesh') or afterwards on an
+existing package:
+
+    python -m URDF_Exporter.utils.inertia path/to/robot_description --density 2700
+    python -m URDF_Exporter.utils.inertia path/to/robot_description --keep-mass --check
+
+The result is that of the tessellation: the coarser the mesh refinement,
+the further it is from the exact solid.
+"""
+
+import argparse
+import math
+import os
+import re
+import sys
+from xml.etree import ElementTree
+
+from . import mesh, utils, transforms
+
+np = mesh.np
+
+# kg/m^3 of steel, the default material of Fusion
+DEFAULT_DENSITY = 7850.0
+
+
+def mass_properties(triangles, density):
+    """
+    Mass properties of the solid a closed, outward oriented mesh bounds.
+
+    Parameters
+    ----------
+    triangles: (n, 3, 3) array
+        in meters
+    density: float
+        kg/m^3
+
+    Returns
+    ----------
+    mass: float
+        kg
+    center_of_mass: (3,) array
+        m, in the coordinates of triangles
+    moments: [xx, yy, zz, xy, yz, xz]
+        inertia tensor about the center of mass in kg*m^2 (products of
+        inertia with the tensor's sign, like getXYZMomentsOfInertia)
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    if len(triangles) == 0:
+        return 0.0, np.zeros(3), [0.0] * 6
+    # tetrahedra from a point near the mesh keep the round-off small for
+    # links far from the origin
+    reference = triangles.reshape(-1, 3).mean(axis=0)
+    t = triangles - reference
+    a, b, c = t[:, 0], t[:, 1], t[:, 2]
+    det = np.einsum('ij,ij->i', a, np.cross(b, c))  # 6 x signed volume
+    volume = det.sum() / 6.0
+    if abs(volume) < 1e-18:
+        return 0.0, reference, [0.0] * 6
+    s = a + b + c
+    first = (det[:, None] * s).sum(axis=0) / 24.0
+    # second moments: sum over the tetrahedra of det/120 (sum_k v_k v_k^T + s s^T)
+    second = (np.einsum('n,nki,nkj->ij', det, t, t) + np.einsum('n,ni,nj->ij', det, s, s)) / 120.0
+    com = first / volume
+    covariance = density * (second - volume * np.outer(com, com))
+    mass = density * volume
+    trace = np.trace(covariance)
+    tensor = trace * np.eye(3) - covariance
+    moments = [tensor[0, 0], tensor[1, 1], tensor[2, 2], tensor[0, 1], tensor[1, 2], tensor[0, 2]]
+    return float(mass), com + reference, [float(m) for m in moments]
+
+
+def make_mesh_inertial_dict(meshes_dir, names, density=DEFAULT_DENSITY, masses=None, scale=0.001):
+    """
+    inertial_dict (see Link.make_inertial_dict) from the exported meshes.
+
+    Parameters
+    ----------
+    meshes_dir: str
+        the meshes directory of the package (meshes in world coordinates)
+    names: [str]
+        links to compute
+    density: float
+        kg/m^3
+    masses: {name: float}
+        known masses; the density of these links is chosen to match them
+    scale: float
+        mesh units to meters
+
+    Returns
+    ----------
+    inertial_dict: {name:{mass, inertia, center_of_mass}}
+    """
+    inertial_dict = {}
+    for name in names:
+        path = mesh.mesh_path(meshes_dir, name)
+        triangles = mesh.read_mesh(path) * scale if path else np.zeros((0, 3, 3))
+        mass, com, moments = mass_properties(triangles, 1.0)
+        rho = masses[name] / mass if masses and name in masses and mass > 0 else density
+        inertial_dict[name] = {'name': name,
+                               'mass': mass * rho,
+                               'center_of_mass': [float(_) for _ in com],
+                               'inertia': [round(m * rho, 6) for m in moments]}
+    return inertial_dict
+
+
+def compare(reference, other):
+    """
+    Differences of two inertial_dicts, for the links of reference.
+
+    Returns
+    ----------
+    differences: {name: (mass, center_of_mass, inertia)}
+        relative mass change, distance of the centers of mass in m and
+        relative change of the tensor (Frobenius norm), None where other
+        has no entry
+    """
+    weights = (1, 1, 1, 2, 2, 2)
+    differences = {}
+    for name, ref in reference.items():
+        new = other.get(name)
+        if new is None:
+            differences[name] = None
+            continue
+        mass = abs(new['mass'] - ref['mass']) / ref['mass'] if ref['mass'] else abs(new['mass'])
+        distance = math.dist(ref['center_of_mass'], new['center_of_mass'])
+        norm = sum(w * i**2 for w, i in zip(weights, ref['inertia'])) ** 0.5
+        diff = sum(w * (i - j)**2 for w, i, j in zip(weights, ref['inertia'], new['inertia'])) ** 0.5
+        differences[name] = (mass, distance, diff / norm if norm else diff)
+    return differences
+
+
+def _floats(text, default):
+    return [float(_) for _ in text.split()] if text else list(default)
+
+
+def _visual_triangles(package_dir, visual):
+    """Triangles (m, link frame) of a <visual> mesh, None for other geometry."""
+    element = visual.find('geometry/mesh')
+    if element is None:
+        return None
+    file_name = element.get('filename', '')
+    if file_name.startswith('package://'):
+        # package://<package>/<path inside the package>
+        file_name = os.path.join(package_dir, *file_name[len('package://'):].split('/')[1:])
+    scale = _floats(element.get('scale'), (1.0, 1.0, 1.0))
+    origin = visual.find('origin')
+    xyz = _floats(origin.get('xyz') if origin is not None else None, (0.0, 0.0, 0.0))
+    rpy = _floats(origin.get('rpy') if origin is not None else None, (0.0, 0.0, 0.0))
+    triangles = mesh.read_mesh(file_name) * np.asarray(scale)
+    return triangles @ np.asarray(transforms.rpy_matrix(*rpy)).T + np.asarray(xyz)
+
+
+def _inertial_xml(mass, center_of_mass, moments, indent='  '):
+    # the layout of Link.make_link_xml
+    inertia = dict(zip(('ixx', 'iyy', 'izz', 'ixy', 'iyz', 'ixz'), moments))
+    return ('<inertial>\n'
+            '{0}  <origin xyz="{1}" rpy="0 0 0"/>\n'
+            '{0}  <mass value="{2}"/>\n'
+            '{0}  <inertia {3}/>\n'
+            '{0}</inertial>').format(indent, ' '.join(str(_) for _ in center_of_mass), mass,
+                                     ' '.join('{}="{}"'.format(k, v) for k, v in inertia.items()))
+
+
+def rederive_urdf_inertials(package_dir, urdf_file, density=DEFAULT_DENSITY, keep_mass=False, write=True):
+    """
+    Recompute the <inertial> of every link with mesh visuals.
+
+    Parameters
+    ----------
+    package_dir: str
+        root of the description package (package:// paths resolve here)
+    urdf_file: str
+        .urdf or .xacro file holding the links
+    density: float
+        kg/m^3
+    keep_mass: bool
+        keep the mass of each link, deriving its density from it
+    write: bool
+        rewrite urdf_file; False only reports the differences
+
+    Returns
+    ----------
+    differences: {name: (mass, center_of_mass, inertia) or None}
+        see compare, existing values against the new ones; None for links
+        that had no <inertial>
+    """
+    # newline='' keeps the line endings of the file as they are
+    with open(urdf_file, encoding='utf-8', newline='') as f:
+        text = f.read()
+    eol = '\r\n' if '\r\n' in text else '\n'
+    old, new = {}, {}
+    for link in ElementTree.fromstring(text).iter('link'):
+        name = link.get('name')
+        parts = [t for t in (_visual_triangles(package_dir, v) for v in link.findall('visual')) if t is not None]
+        if not parts:
+            continue
+        inertial = link.find('inertial')
+        if inertial is not None:
+            origin = inertial.find('origin')
+            tensor = inertial.find('inertia')
+            old[name] = {'mass': float(inertial.find('mass').get('value')),
+                         'center_of_mass': _floats(origin.get('xyz') if origin is not None else None, (0, 0, 0)),
+                         'inertia': [float(tensor.get(k, 0.0)) for k in ('ixx', 'iyy', 'izz', 'ixy', 'iyz', 'ixz')]}
+        mass, com, moments = mass_properties(np.concatenate(parts), 1.0)
+        rho = old[name]['mass'] / mass if keep_mass and name in old and mass > 0 else density
+        new[name] = {'mass': mass * rho,
+                     'center_of_mass': [float(_) for _ in com],
+                     'inertia': [round(m * rho, 6) + 0.0 for m in moments]}
+
+    if write and new:
+        def inertial_xml(entry, indent='  '):
+            return _inertial_xml(entry['mass'], entry['center_of_mass'], entry['inertia'], indent).replace('\n', eol)
+
+        def replace(match):
+            entry = new.get(match.group(2))
+            if entry is None:
+                return match.group(0)
+            body, count = re.subn(r'([ \t]*)<inertial>.*?</inertial>',
+                                  lambda m: m.group(1) + inertial_xml(entry, m.group(1)),
+                                  match.group(3), count=1, flags=re.S)
+            if not count:
+                body = eol + '  ' + inertial_xml(entry) + body
+            return match.group(1) + body + match.group(4)
+        text = re.sub(r'(<link\s+name="([^"]*)"\s*>)(.*?)(</link>)', replace, text, flags=re.S)
+        with utils.atomic_open(urdf_file, encoding='utf-8', newline='') as f:
+            f.write(text)
+    differences = compare(old, new)
+    differences.update((name, None) for name in new if name not in old)
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m URDF_Exporter.utils.inertia',
+        description='Re-derive the <inertial> blocks of a description package from its meshes.')
+    parser.add_argument('package_dir')
+    parser.add_argument('--urdf', help='file to rewrite, every urdf/*.urdf and urdf/*.xacro holding links if omitted')
+    parser.add_argument('--density', type=float, default=DEFAULT_DENSITY, help='kg/m^3 (default %(default)s)')
+    parser.add_argument('--keep-mass', action='store_true', help='keep the masses, recompute centers of mass and tensors')
+    parser.add_argument('--check', action='store_true', help='only report the differences')
+    args = parser.parse_args(argv)
+    if not mesh.available():
+        parser.error('numpy is required')
+
+    if args.urdf:
+        files = [args.urdf]
+    else:
+        urdf_dir = os.path.join(args.package_dir, 'urdf')
+        files = [os.path.join(urdf_dir, f) for f in sorted(os.listdir(urdf_dir)) if f.endswith(('.urdf', '.xacro'))]
+    for urdf_file in files:
+        differences = rederive_urdf_inertials(args.package_dir, urdf_file, args.density,
+                                              args.keep_mass, write=not args.check)
+        if not differences:
+            continue
+        print(urdf_file)
+        for name, d in differences.items():
+            if d is None:
+                print('  {}: new <inertial>'.format(name))
+            else:
+                print('  {}: mass {:.2%}, center of mass {:.3g} m, inertia {:.2%}'.format(name, *d))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Per-mesh content manifest for incremental STL export.
+
+Every export writes meshes/mesh_manifest.json holding a fingerprint for each
+mesh: body count, volume, area, bounding box and transform of the exported
+occurrence, the mesh refinement and the SHA-256 of the written file. When the
+previous package version (the one the _vN suffix logic in run() increments
+from) has a mesh with the same fingerprint, the file is hard-linked (or
+copied) from there instead of being tessellated again.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from . import utils, mesh
+
+MANIFEST_NAME = 'mesh_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def _num(x):
+    # 9 significant digits: stable across runs, still far below a micron
+    return float('%.9g' % x)
+
+
+def fingerprint(occ, refinement, transform=None):
+    """
+    Fingerprint of the geometry an STL export of occ would produce.
+
+    Parameters
+    ----------
+    occ: adsk.fusion.Occurrence
+        occurrence handed to createSTLExportOptions
+    refinement: str
+        description of the mesh refinement settings used for the export
+    transform: (16 floats)
+        occurrence transform if already known (ex: from the snapshot)
+
+    Returns
+    ----------
+    fingerprint: dict or None
+        None when the occurrence cannot be fingerprinted; it is then always
+        exported
+    """
+    try:
+        prop = occ.physicalProperties
+        box = occ.boundingBox
+        if transform is None:
+            transform = occ.transform.asArray()
+        return {
+            'body_count': occ.bRepBodies.count,
+            'volume': _num(prop.volume),
+            'area': _num(prop.area),
+            'bbox': [[_num(v) for v in box.minPoint.asArray()],
+                     [_num(v) for v in box.maxPoint.asArray()]],
+            'transform': [_num(v) for v in transform],
+            'refinement': refinement,
+        }
+    except Exception:
+        return None
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest(meshes_dir):
+    """Meshes recorded in meshes_dir/mesh_manifest.json, {} if there is none."""
+    try:
+        with open(os.path.join(meshes_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') == MANIFEST_VERSION:
+            return data.get('meshes', {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {}
+
+
+def _link_or_copy(src, dst):
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class MeshManifest:
+    def __init__(self, meshes_dir, previous_meshes_dir=None, extension='.stl'):
+        """
+        Attributes
+        ----------
+        meshes_dir: str
+            meshes directory of the package being exported
+        previous_meshes_dir: str
+            meshes directory of the previous package version, if any
+        extension: str
+            extension of the final mesh files ('.stl', '.obj' or '.glb');
+            only previous meshes in that format are reused
+        meshes: dict
+            manifest entries of this export, by mesh name
+        visited: int
+            (component, occurrence) pairs the export planner looked at
+        planned: int
+            unique meshes the export planner scheduled
+        settings: {name: dict}
+            refinement settings of every planned mesh
+        exported: int
+            meshes tessellated by Fusion in this export
+        reused: int
+            meshes linked or copied from the previous version
+        """
+        self.meshes_dir = meshes_dir
+        self.previous_meshes_dir = previous_meshes_dir
+        self.extension = extension
+        self.previous = load_manifest(previous_meshes_dir) if previous_meshes_dir else {}
+        self.meshes = {}
+        self.visited = 0
+        self.planned = 0
+        self.settings = {}
+        self.exported = 0
+        self.reused = 0
+
+    def reuse(self, name, fp):
+        """
+        Link or copy the mesh of name from the previous version if its
+        fingerprint is fp, it has the wanted extension and the file there is
+        still the one the manifest recorded.
+
+        Returns
+        ----------
+        True if the mesh was reused and must not be exported
+        """
+        if name in self.meshes:
+            return self.meshes[name].get('reused', False)
+        if fp is None:
+            return False
+        entry = self.previous.get(name)
+        if not entry or {k: entry.get(k) for k in fp} != fp:
+            return False
+        file_name = entry.get('file', name + '.stl')
+        if file_name != name + self.extension:
+            return False
+        src = os.path.join(self.previous_meshes_dir, file_name)
+        try:
+            if file_hash(src) != entry.get('sha256'):
+                return False
+            _link_or_copy(src, os.path.join(self.meshes_dir, file_name))
+        except OSError:
+            return False
+        self.meshes[name] = dict(entry, reused=True)
+        self.reused += 1
+        return True
+
+    def record(self, name, fp):
+        """Record the freshly exported name.stl with fingerprint fp."""
+        self.exported += 1
+        path = os.path.join(self.meshes_dir, name + '.stl')
+        if fp is None or not os.path.exists(path):
+            self.meshes.pop(name, None)
+            return
+        self.meshes[name] = dict(fp, file=name + '.stl', sha256=file_hash(path))
+
+    def replace_file(self, name, file_name):
+        """Point the entry of name at file_name, a conversion of its STL."""
+        if name in self.meshes and not self.meshes[name].get('reused'):
+            self.meshes[name]['file'] = file_name
+            self.meshes[name]['sha256'] = file_hash(os.path.join(self.meshes_dir, file_name))
+
+    def exported_meshes(self):
+        """
+        Every planned mesh on disk as a binary STL and its fingerprint (None
+        if it has none), for Snapshot.dump_snapshot. Meshes reused in another
+        format are read from the file their entry points at (needs numpy,
+        which reusing them already did).
+
+        Returns
+        ----------
+        meshes: {name: (bytes, fingerprint)}
+        """
+        meshes = {}
+        for name in self.settings:
+            entry = self.meshes.get(name)
+            path = os.path.join(self.meshes_dir, entry.get('file', name + '.stl') if entry else name + '.stl')
+            if not os.path.exists(path):
+                continue
+            fp = {k: v for k, v in entry.items() if k not in ('file', 'sha256', 'reused')} if entry else None
+            if path.endswith('.stl'):
+                with open(path, 'rb') as f:
+                    meshes[name] = (f.read(), fp)
+            else:
+                meshes[name] = (mesh.stl_bytes(mesh.read_mesh(path)), fp)
+        return meshes
+
+    def save(self):
+        meshes = {name: {k: v for k, v in entry.items() if k != 'reused'}
+                  for name, entry in self.meshes.items()}
+        with utils.atomic_open(os.path.join(self.meshes_dir, MANIFEST_NAME), encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'meshes': meshes}, f, indent=1, sort_keys=True)
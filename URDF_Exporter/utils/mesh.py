@@ -0,0 +1,687 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy helpers for the exported meshes.
+
+Fusion's bundled Python has no numpy. Every stage built on this module
+checks available() first and falls back to the full resolution meshes when
+numpy cannot be imported.
+"""
+
+import json
+import os
+import shutil
+import struct
+
+try:
+    import numpy as np
+except ImportError:  # Fusion's bundled Python
+    np = None
+
+from . import utils, refinement
+
+COLLISION_DIR = 'collision'
+# mesh file formats the package can be written in
+MESH_FORMATS = ('stl', 'obj', 'glb')
+
+if np is not None:
+    # record layout of a binary STL triangle
+    STL_DTYPE = np.dtype([('normal', '<f4', (3,)),
+                          ('vertices', '<f4', (3, 3)),
+                          ('attr', '<u2')])
+
+
+def available():
+    """True if numpy can be imported."""
+    return np is not None
+
+
+def read_stl(file_name):
+    """
+    Read a binary STL.
+
+    Returns
+    ----------
+    triangles: np.ndarray (n, 3, 3) float64
+        corners of each triangle, in the units of the file
+    """
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    if len(data) < 84:
+        raise ValueError('{} is not a binary STL'.format(file_name))
+    count = int(np.frombuffer(data, '<u4', 1, 80)[0])
+    if len(data) < 84 + count * STL_DTYPE.itemsize:
+        raise ValueError('{} is not a binary STL'.format(file_name))
+    records = np.frombuffer(data, STL_DTYPE, count, 84)
+    return records['vertices'].astype(np.float64)
+
+
+def stl_bytes(triangles, header=b'fusion2urdf'):
+    """Binary STL of triangles (n, 3, 3) with computed facet normals."""
+    triangles = np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 3)
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    length = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, length, out=np.zeros_like(normals), where=length > 0)
+
+    records = np.zeros(len(triangles), STL_DTYPE)
+    records['normal'] = normals
+    records['vertices'] = triangles
+    return header[:80].ljust(80, b' ') + np.uint32(len(records)).tobytes() + records.tobytes()
+
+
+def write_stl(file_name, triangles, header=b'fusion2urdf'):
+    """
+    Write triangles (n, 3, 3) as a binary STL with computed facet normals.
+    """
+    data = stl_bytes(triangles, header)
+    with utils.atomic_open(file_name, 'wb') as f:
+        f.write(data)
+
+
+def weld(triangles, tolerance=1e-4):
+    """
+    Merge corners closer than about tolerance into shared vertices.
+
+    Parameters
+    ----------
+    triangles: np.ndarray (n, 3, 3)
+    tolerance: float
+        quantization step, in the units of triangles
+
+    Returns
+    ----------
+    vertices: np.ndarray (m, 3)
+        mean position of the corners merged into each vertex
+    faces: np.ndarray (k, 3) int
+        vertex indices; triangles that collapse are dropped
+    """
+    corners = np.asarray(triangles, dtype=np.float64).reshape(-1, 3)
+    q = np.ascontiguousarray(np.round(corners / tolerance).astype(np.int64))
+    # unique over raw rows; much faster than np.unique(axis=0)
+    rows = q.view(np.dtype((np.void, q.dtype.itemsize * 3))).reshape(-1)
+    _, index = np.unique(rows, return_inverse=True)
+    index = index.reshape(-1)
+    n = int(index.max()) + 1 if len(index) else 0
+    counts = np.bincount(index, minlength=n)
+    vertices = np.stack([np.bincount(index, corners[:, k], n) for k in range(3)], axis=1) / counts[:, None]
+    faces = index.reshape(-1, 3)
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    return vertices, faces[keep]
+
+
+def write_obj(file_name, vertices, faces):
+    """Write an indexed Wavefront OBJ (1-based indices, no normals)."""
+    with utils.atomic_open(file_name, 'w', encoding='ascii') as f:
+        f.write('# fusion2urdf\n')
+        f.writelines('v {:.6g} {:.6g} {:.6g}\n'.format(*v) for v in vertices.tolist())
+        f.writelines('f {} {} {}\n'.format(a + 1, b + 1, c + 1) for a, b, c in faces.tolist())
+
+
+def read_obj(file_name):
+    """Triangles (n, 3, 3) of an OBJ with triangular faces."""
+    vertices = []
+    faces = []
+    with open(file_name, encoding='ascii') as f:
+        for line in f:
+            if line.startswith('v '):
+                vertices.append([float(v) for v in line.split()[1:4]])
+            elif line.startswith('f '):
+                faces.append([int(v.split('/')[0]) - 1 for v in line.split()[1:4]])
+    return np.asarray(vertices, dtype=np.float64).reshape(-1, 3)[np.asarray(faces, dtype=np.int64).reshape(-1, 3)]
+
+
+def write_glb(file_name, vertices, faces):
+    """Write a binary glTF 2.0 file with one indexed triangle mesh."""
+    positions = np.ascontiguousarray(vertices, dtype='<f4')
+    indices = np.ascontiguousarray(faces, dtype='<u4')
+    position_bytes = positions.tobytes()
+    index_bytes = indices.tobytes()
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'fusion2urdf'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'mesh': 0}],
+        'meshes': [{'primitives': [{'attributes': {'POSITION': 0}, 'indices': 1}]}],
+        'accessors': [
+            {'bufferView': 0, 'componentType': 5126, 'count': len(positions), 'type': 'VEC3',
+             'min': positions.min(axis=0).tolist() if len(positions) else [0, 0, 0],
+             'max': positions.max(axis=0).tolist() if len(positions) else [0, 0, 0]},
+            {'bufferView': 1, 'componentType': 5125, 'count': indices.size, 'type': 'SCALAR'}],
+        'bufferViews': [
+            {'buffer': 0, 'byteOffset': 0, 'byteLength': len(position_bytes), 'target': 34962},
+            {'buffer': 0, 'byteOffset': len(position_bytes), 'byteLength': len(index_bytes), 'target': 34963}],
+        'buffers': [{'byteLength': len(position_bytes) + len(index_bytes)}],
+    }
+    json_chunk = json.dumps(gltf, separators=(',', ':')).encode('ascii')
+    json_chunk += b' ' * (-len(json_chunk) % 4)
+    bin_chunk = position_bytes + index_bytes
+    bin_chunk += b'\0' * (-len(bin_chunk) % 4)
+    with utils.atomic_open(file_name, 'wb') as f:
+        f.write(struct.pack('<4sII', b'glTF', 2, 12 + 8 + len(json_chunk) + 8 + len(bin_chunk)))
+        f.write(struct.pack('<I4s', len(json_chunk), b'JSON'))
+        f.write(json_chunk)
+        f.write(struct.pack('<I4s', len(bin_chunk), b'BIN\0'))
+        f.write(bin_chunk)
+
+
+def read_glb(file_name):
+    """Triangles (n, 3, 3) of a GLB as written by write_glb."""
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    magic, _, _ = struct.unpack_from('<4sII', data, 0)
+    if magic != b'glTF':
+        raise ValueError('{} is not a binary glTF'.format(file_name))
+    json_length, _ = struct.unpack_from('<I4s', data, 12)
+    gltf = json.loads(data[20:20 + json_length])
+    bin_offset = 20 + json_length + 8
+    primitive = gltf['meshes'][0]['primitives'][0]
+
+    def accessor(i, dtype, width):
+        acc = gltf['accessors'][i]
+        view = gltf['bufferViews'][acc['bufferView']]
+        start = bin_offset + view.get('byteOffset', 0) + acc.get('byteOffset', 0)
+        return np.frombuffer(data, dtype, acc['count'] * width, start).reshape(-1, width)
+
+    vertices = accessor(primitive['attributes']['POSITION'], '<f4', 3).astype(np.float64)
+    faces = accessor(primitive['indices'], '<u4', 1).reshape(-1, 3)
+    return vertices[faces]
+
+
+def mesh_path(meshes_dir, name):
+    """Path of the mesh of name in meshes_dir, whatever its format; None if missing."""
+    for fmt in MESH_FORMATS:
+        path = os.path.join(meshes_dir, name + '.' + fmt)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def mesh_files(meshes_dir, names, fmt, collision_dir=None):
+    """
+    Formats of the meshes on disk that are not fmt, so the URDF refers to
+    the files that exist (ex: an STL that failed to convert to fmt, or a
+    collision mesh that could not be written).
+
+    Parameters
+    ----------
+    meshes_dir: str
+    names: [str]
+    fmt: str
+        format the meshes were meant to be in
+    collision_dir: str
+        subdirectory of meshes_dir with the collision meshes, if any
+
+    Returns
+    ----------
+    files: {name: (format, collision format)}
+        only names that differ from (fmt, fmt); the collision format is None
+        if there is no collision mesh (the visual one is used). Missing
+        visual meshes keep fmt.
+    """
+    def found(directory, name):
+        path = mesh_path(directory, name)
+        return os.path.splitext(path)[1][1:] if path else None
+
+    files = {}
+    for name in names:
+        visual = found(meshes_dir, name) or fmt
+        collision = found(os.path.join(meshes_dir, collision_dir), name) if collision_dir else visual
+        if (visual, collision) != (fmt, fmt):
+            files[name] = (visual, collision)
+    return files
+
+
+def read_mesh(path):
+    """Triangles (n, 3, 3) of an STL, OBJ or GLB file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.obj':
+        return read_obj(path)
+    if ext == '.glb':
+        return read_glb(path)
+    return read_stl(path)
+
+
+def triangle_count(path):
+    """
+    Triangles of an STL (from its header), OBJ or GLB file; None if it is
+    missing or unreadable, or an OBJ / GLB without numpy.
+    """
+    if path is None:
+        return None
+    if path.lower().endswith('.stl'):
+        return refinement.stl_triangle_count(path)
+    if not available():
+        return None
+    try:
+        return len(read_mesh(path))
+    except Exception:
+        return None
+
+
+def write_mesh(path, triangles, tolerance=1e-4):
+    """Write triangles as STL, or welded as OBJ / GLB, after the extension of path."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.stl':
+        write_stl(path, triangles)
+        return
+    vertices, faces = weld(triangles, tolerance)
+    if ext == '.obj':
+        write_obj(path, vertices, faces)
+    elif ext == '.glb':
+        write_glb(path, vertices, faces)
+    else:
+        raise ValueError('unknown mesh format {}'.format(ext))
+
+
+def convert_meshes(meshes_dir, names, fmt, tolerance=1e-4):
+    """
+    Replace name.stl by a vertex-welded name.obj / name.glb for every name.
+
+    Meshes without an STL (ex: reused from the previous version in fmt
+    already) are left alone. A mesh that fails to convert is kept as STL
+    and reported with None sizes.
+
+    Parameters
+    ----------
+    meshes_dir: str
+    names: [str]
+    fmt: str
+        'obj' or 'glb'
+    tolerance: float
+        weld distance in mesh units (mm)
+
+    Returns
+    ----------
+    stats: {name: (stl bytes, new bytes, stl corners, welded vertices)}
+    """
+    stats = {}
+    for name in names:
+        src = os.path.join(meshes_dir, name + '.stl')
+        if not os.path.exists(src):
+            continue
+        dst = os.path.join(meshes_dir, name + '.' + fmt)
+        try:
+            triangles = read_stl(src)
+            vertices, faces = weld(triangles, tolerance)
+            if fmt == 'obj':
+                write_obj(dst, vertices, faces)
+            else:
+                write_glb(dst, vertices, faces)
+            stats[name] = (os.path.getsize(src), os.path.getsize(dst), 3 * len(triangles), len(vertices))
+            os.remove(src)
+        except Exception as e:
+            print('Mesh {} kept as STL: {}'.format(name, e))
+            stats[name] = (None, None, None, None)
+    return stats
+
+
+def _cluster(triangles, cell, origin):
+    """
+    One vertex clustering pass: snap every corner to the mean of the corners
+    in its grid cell and drop the triangles that collapse.
+    """
+    corners = triangles.reshape(-1, 3)
+    cells = np.floor((corners - origin) / cell).astype(np.int64)
+    # one integer key per cell; 1D unique is much faster than unique(axis=0)
+    dims = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    _, index = np.unique(keys, return_inverse=True)
+    index = index.reshape(-1)
+    n_cells = int(index.max()) + 1
+    counts = np.bincount(index, minlength=n_cells)
+    centers = np.stack([np.bincount(index, corners[:, k], n_cells) for k in range(3)], axis=1)
+    centers /= counts[:, None]
+
+    faces = index.reshape(-1, 3)
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces = faces[keep]
+    # the same cell triple can come from several triangles, keep one of each
+    ordered = np.sort(faces, axis=1)
+    if n_cells < 1 << 21:
+        ordered = (ordered[:, 0] * n_cells + ordered[:, 1]) * n_cells + ordered[:, 2]
+    _, first = np.unique(ordered, axis=0 if ordered.ndim > 1 else None, return_index=True)
+    faces = faces[np.sort(first)]
+    return centers[faces]
+
+
+def decimate(triangles, budget, growth=1.25):
+    """
+    Reduce triangles to at most budget triangles by vertex clustering.
+
+    The grid starts at a cell size that would give roughly budget triangles
+    on a smooth surface of the bounding box and grows until the result
+    fits; cells are cubes, so the shape is kept evenly in every direction.
+
+    Parameters
+    ----------
+    triangles: np.ndarray (n, 3, 3)
+    budget: int
+        maximum number of triangles, at least 4
+    growth: float
+        factor the cell size grows by between passes
+
+    Returns
+    ----------
+    triangles: np.ndarray (m, 3, 3), m <= budget
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    if len(triangles) <= budget:
+        return triangles
+    corners = triangles.reshape(-1, 3)
+    lo, hi = corners.min(axis=0), corners.max(axis=0)
+    size = hi - lo
+    area = 2.0 * (size[0]*size[1] + size[1]*size[2] + size[0]*size[2])
+    # a regular grid of cells of edge c meshes a surface with ~2*area/c^2 triangles
+    cell = max(np.sqrt(2.0 * area / budget), size.max() * 1e-6, 1e-12)
+    while True:
+        result = _cluster(triangles, cell, lo)
+        if not len(result):
+            raise ValueError('a budget of {} triangles collapses the mesh'.format(budget))
+        if len(result) <= budget:
+            return result
+        cell *= growth
+
+
+def decimate_collision_meshes(meshes_dir, budget, names=None, fmt='stl'):
+    """
+    Write a decimated copy of every mesh into "meshes_dir/collision/".
+
+    A mesh that cannot be decimated is copied unchanged, so the collision
+    file the URDF refers to exists whenever the visual mesh is readable.
+
+    Parameters
+    ----------
+    meshes_dir: str
+        the meshes directory of the package
+    budget: int
+        maximum number of triangles of each collision mesh
+    names: [str]
+        meshes (without extension) to process, every .stl in meshes_dir if None
+    fmt: str
+        format of the collision meshes, one of MESH_FORMATS
+
+    Returns
+    ----------
+    stats: {name: (triangles before, triangles after)}
+        (None, None) for meshes that were copied unchanged
+    """
+    collision_dir = os.path.join(meshes_dir, COLLISION_DIR)
+    os.makedirs(collision_dir, exist_ok=True)
+    if names is None:
+        names = sorted(f[:-4] for f in os.listdir(meshes_dir) if f.lower().endswith('.stl'))
+
+    stats = {}
+    for name in names:
+        src = mesh_path(meshes_dir, name)
+        dst = os.path.join(collision_dir, name + '.' + fmt)
+        try:
+            triangles = read_mesh(src)
+            reduced = decimate(triangles, budget)
+            write_mesh(dst, reduced)
+            stats[name] = (len(triangles), len(reduced))
+        except Exception as e:
+            print('Collision mesh of {} kept at full resolution: {}'.format(name, e))
+            try:
+                if src and src.endswith('.' + fmt):
+                    shutil.copyfile(src, dst)
+                else:
+                    write_mesh(dst, read_mesh(src))
+            except Exception:
+                pass
+            stats[name] = (None, None)
+    return stats
+
+
+def _volume(triangles):
+    """Enclosed volume by signed tetrahedra, 0 for open meshes."""
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    return abs(np.einsum('ij,ij->', a, np.cross(b, c))) / 6.0
+
+
+def _frames(triangles):
+    """
+    Candidate orientations (3x3, columns are the axes): the coordinate axes
+    and the principal axes of the area-weighted surface.
+    """
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    area = np.linalg.norm(np.cross(b - a, c - a), axis=1) / 2.0
+    centroid = (a + b + c) / 3.0
+    mean = np.average(centroid, axis=0, weights=area) if area.sum() > 0 else centroid.mean(axis=0)
+    d = centroid - mean
+    cov = (d * area[:, None]).T @ d
+    _, axes = np.linalg.eigh(cov)
+    if np.linalg.det(axes) < 0:
+        axes[:, 0] = -axes[:, 0]
+    return [np.eye(3), axes]
+
+
+def _rotation_to(axis):
+    """Smallest rotation taking the z axis onto axis (the cylinder frame)."""
+    axis = axis / np.linalg.norm(axis)
+    if axis[2] < 0:
+        axis = -axis  # a cylinder is symmetric, keep the rotation small
+    v = np.cross((0.0, 0.0, 1.0), axis)
+    c = axis[2]
+    vx = np.array([[0, -v[2], v[1]], [v[2], 0, -v[0]], [-v[1], v[0], 0]])
+    return np.eye(3) + vx + vx @ vx / (1.0 + c)
+
+
+def rpy_from_matrix(R):
+    """URDF roll, pitch, yaw (R = Rz(yaw) Ry(pitch) Rx(roll)) of a rotation matrix."""
+    roll = np.arctan2(R[2, 1], R[2, 2])
+    pitch = np.arctan2(-R[2, 0], np.hypot(R[2, 1], R[2, 2]))
+    yaw = np.arctan2(R[1, 0], R[0, 0])
+    return (float(roll), float(pitch), float(yaw))
+
+
+def fit_primitive(triangles):
+    """
+    Fit an oriented box, a cylinder and a sphere around triangles and return
+    the one whose volume is closest to the mesh volume.
+
+    Every candidate encloses all vertices, so the volume error
+    (primitive volume - mesh volume) / mesh volume is never negative.
+
+    Parameters
+    ----------
+    triangles: np.ndarray (n, 3, 3)
+        closed mesh
+
+    Returns
+    ----------
+    primitive: dict or None
+        {'shape': 'box', 'size': (x, y, z)}, {'shape': 'cylinder', 'radius': r,
+        'length': l} or {'shape': 'sphere', 'radius': r}, plus 'center' (x, y, z)
+        and 'rotation' (3x3, the cylinder axis is the z column) in the
+        coordinates of triangles and 'error'; None for open or empty meshes
+    """
+    triangles = np.asarray(triangles, dtype=np.float64)
+    volume = _volume(triangles) if len(triangles) else 0.0
+    if volume <= 0:
+        return None
+    corners = triangles.reshape(-1, 3)
+    candidates = []
+    for n, frame in enumerate(_frames(triangles)):
+        # on (near) ties prefer the coordinate axes, they give clean rpy values
+        bias = 1.0 + 1e-6 * n
+        local = corners @ frame
+        lo, hi = local.min(axis=0), local.max(axis=0)
+        size = hi - lo
+        mid = (lo + hi) / 2.0
+        candidates.append((float(np.prod(size)), bias,
+                           {'shape': 'box', 'size': tuple(size), 'center': frame @ mid, 'rotation': frame}))
+        for k in range(3):
+            # cylinder along axis k, around the bounding box center of the other two
+            i, j = [m for m in range(3) if m != k]
+            radius = float(np.hypot(local[:, i] - mid[i], local[:, j] - mid[j]).max())
+            rotation = _rotation_to(frame[:, k])
+            candidates.append((np.pi * radius**2 * size[k], bias,
+                               {'shape': 'cylinder', 'radius': radius, 'length': float(size[k]),
+                                'center': frame @ mid, 'rotation': rotation}))
+        radius = float(np.linalg.norm(local - mid, axis=1).max())
+        candidates.append((4.0 / 3.0 * np.pi * radius**3, bias,
+                           {'shape': 'sphere', 'radius': radius, 'center': frame @ mid, 'rotation': frame}))
+
+    best_volume, _, best = min(candidates, key=lambda c: c[0] * c[1])
+    best['center'] = tuple(float(v) for v in best['center'])
+    best['error'] = float((best_volume - volume) / volume)
+    return best
+
+
+def fit_collision_primitives(meshes_dir, names, max_error, scale=0.001):
+    """
+    Fit a primitive to every mesh and keep the ones within max_error.
+
+    Parameters
+    ----------
+    meshes_dir: str
+        the meshes directory of the package
+    names: [str]
+        meshes (without extension) to fit
+    max_error: float
+        largest accepted relative volume error (ex: 0.1 for 10 %)
+    scale: float
+        mesh units to meters, the scale of the <mesh> elements
+
+    Returns
+    ----------
+    primitives: {name: primitive}
+        see fit_primitive; lengths and 'center' in meters, 'rotation'
+        replaced by 'rpy'
+    errors: {name: float or None}
+        volume error of the best fit of every mesh, None if none was possible
+    """
+    primitives = {}
+    errors = {}
+    for name in names:
+        try:
+            fit = fit_primitive(read_mesh(mesh_path(meshes_dir, name)) * scale)
+        except Exception as e:
+            print('No collision primitive for {}: {}'.format(name, e))
+            fit = None
+        errors[name] = fit['error'] if fit else None
+        if fit and fit['error'] <= max_error:
+            fit['rpy'] = rpy_from_matrix(fit.pop('rotation'))
+            primitives[name] = fit
+    return primitives, errors
+
+
+def sample_surface(triangles, count, rng):
+    """count points spread uniformly (by area) over the surface of triangles."""
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    area = np.linalg.norm(np.cross(b - a, c - a), axis=1)
+    total = area.sum()
+    p = area / total if total > 0 else None
+    index = rng.choice(len(triangles), size=count, p=p)
+    u, v = rng.random(count), rng.random(count)
+    flip = u + v > 1.0
+    u[flip], v[flip] = 1.0 - u[flip], 1.0 - v[flip]
+    return a[index] + u[:, None] * (b - a)[index] + v[:, None] * (c - a)[index]
+
+
+def _nearest(points, centers):
+    d2 = (np.einsum('ij,ij->i', points, points)[:, None]
+          - 2.0 * points @ centers.T
+          + np.einsum('ij,ij->i', centers, centers)[None, :])
+    return np.argmin(d2, axis=1)
+
+
+def fit_spheres(triangles, count, samples=2000, iterations=25, seed=0):
+    """
+    Approximate the surface of triangles by count spheres.
+
+    The surface is sampled, the samples are clustered by k-means (k-means++
+    start) and every cluster becomes a sphere around its centroid. Each
+    radius is the distance to the farthest sample or mesh vertex assigned
+    to it, so every vertex and every sample is inside at least one sphere.
+
+    Parameters
+    ----------
+    triangles: np.ndarray (n, 3, 3)
+    count: int
+        number of spheres
+    samples: int
+        surface samples for the clustering
+    iterations: int
+        k-means iterations
+    seed: int
+        random seed, the result is deterministic for a given seed
+
+    Returns
+    ----------
+    spheres: [((x, y, z), radius)]
+    """
+    rng = np.random.default_rng(seed)
+    triangles = np.asarray(triangles, dtype=np.float64)
+    points = sample_surface(triangles, max(samples, count), rng)
+    count = min(count, len(points))
+
+    # k-means++ seeding
+    centers = np.empty((count, 3))
+    centers[0] = points[rng.integers(len(points))]
+    d2 = np.sum((points - centers[0])**2, axis=1)
+    for k in range(1, count):
+        total = d2.sum()
+        centers[k] = points[rng.choice(len(points), p=d2 / total)] if total > 0 else points[k]
+        d2 = np.minimum(d2, np.sum((points - centers[k])**2, axis=1))
+
+    for _ in range(iterations):
+        label = _nearest(points, centers)
+        counts = np.bincount(label, minlength=count)
+        sums = np.stack([np.bincount(label, points[:, k], count) for k in range(3)], axis=1)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+
+    covered = np.concatenate([points, triangles.reshape(-1, 3)])
+    label = _nearest(covered, centers)
+    dist = np.linalg.norm(covered - centers[label], axis=1)
+    radius = np.zeros(count)
+    np.maximum.at(radius, label, dist)
+    return [(tuple(float(v) for v in centers[k]), float(radius[k]))
+            for k in range(count) if np.any(label == k)]
+
+
+def fit_collision_spheres(meshes_dir, names, count, offsets=None, samples=2000, scale=0.001, rotations=None):
+    """
+    Sphere approximation of every link mesh, see fit_spheres.
+
+    Parameters
+    ----------
+    meshes_dir: str
+        the meshes directory of the package
+    names: [str]
+        meshes (without extension), the link names
+    count: int
+        spheres per link
+    offsets: {name: (x, y, z)}
+        link origin in the mesh frame in meters; sphere centers are given
+        relative to it (the link frame)
+    samples: int
+        surface samples per link
+    scale: float
+        mesh units to meters
+    rotations: {name: 3x3}
+        orientation of the link frames in the mesh frame (see
+        transforms.Frames); parallel to it where missing
+
+    Returns
+    ----------
+    spheres: {name: [((x, y, z), radius)]}
+        in meters; links whose mesh cannot be read are left out
+    """
+    offsets = offsets or {}
+    rotations = rotations or {}
+    spheres = {}
+    for name in names:
+        try:
+            triangles = read_mesh(mesh_path(meshes_dir, name)) * scale
+            if not len(triangles):
+                continue
+            origin = np.asarray(offsets.get(name, (0.0, 0.0, 0.0)))
+            rotation = np.asarray(rotations.get(name, np.eye(3)))
+            spheres[name] = [(tuple(float(v) for v in (np.asarray(c) - origin) @ rotation), r)
+                             for c, r in fit_spheres(triangles, count, samples)]
+        except Exception as e:
+            print('No collision spheres for {}: {}'.format(name, e))
+    return spheres
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Timers and counters of one export, saved as export_metrics.json.
+
+run() activates a Metrics for the duration of an export; the stages and
+the helpers they call record into it through the module functions below,
+which do nothing while no Metrics is active (benchmarks, standalone
+tools). Recording is thread safe, the background writers count their
+files too.
+
+export_metrics.json (SCHEMA_VERSION 1) holds:
+
+    robot, package, options   what was exported and how
+    total_seconds             wall time of run() from the folder dialog on
+    stages                    [{name, thread, start, seconds}] (pipeline.py)
+    counters                  {name: int}, e.g. meshes_exported,
+                              files_written, bytes_written, xml_bytes
+    timers                    {name: {calls, seconds}}
+    links                     {link: {timer: seconds}}, e.g. mesh_export,
+                              mass_properties
+
+New keys may be added within a schema version; renamed or removed keys
+bump it.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+from . import utils
+
+SCHEMA_VERSION = 1
+# files counted as xml_bytes by record_file
+XML_EXTENSIONS = ('.urdf', '.xacro', '.trans', '.gazebo', '.launch')
+
+
+class Metrics:
+    """
+    Attributes
+    ----------
+    counters: {name: int}
+    timers: {name: [calls, seconds]}
+    links: {link: {timer: seconds}}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+        self.links = {}
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, name, seconds, link=None):
+        with self._lock:
+            timer = self.timers.setdefault(name, [0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            if link is not None:
+                per_link = self.links.setdefault(link, {})
+                per_link[name] = per_link.get(name, 0.0) + seconds
+
+    def to_dict(self, **fields):
+        """The export_metrics.json document, fields (robot, stages, ...) first."""
+        with self._lock:
+            return dict(schema=SCHEMA_VERSION, **fields,
+                        counters=dict(sorted(self.counters.items())),
+                        timers={name: {'calls': calls, 'seconds': round(seconds, 6)}
+                                for name, (calls, seconds) in sorted(self.timers.items())},
+                        links={link: {name: round(t, 6) for name, t in timers.items()}
+                               for link, timers in self.links.items()})
+
+    def save(self, file_name, **fields):
+        """Write to_dict(**fields) as JSON, replacing file_name atomically (utils.atomic_open)."""
+        with utils.atomic_open(file_name, encoding='utf-8') as f:
+            json.dump(self.to_dict(**fields), f, indent=2)
+            f.write('\n')
+
+
+_active = None
+
+
+def activate(metrics):
+    """Record into metrics (None stops recording)."""
+    global _active
+    _active = metrics
+
+
+def active():
+    """The Metrics being recorded into, None if none."""
+    return _active
+
+
+def count(name, n=1):
+    metrics = _active
+    if metrics is not None:
+        metrics.count(name, n)
+
+
+def counter(name):
+    """Value of counter name so far, 0 while no Metrics is active."""
+    metrics = _active
+    if metrics is None:
+        return 0
+    with metrics._lock:
+        return metrics.counters.get(name, 0)
+
+
+def add_time(name, seconds, link=None):
+    metrics = _active
+    if metrics is not None:
+        metrics.add_time(name, seconds, link)
+
+
+@contextlib.contextmanager
+def timer(name, link=None):
+    """Time the block into timer name (and the link's entry if given)."""
+    if _active is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - t0, link)
+
+
+def record_file(file_name):
+    """Count a written file and its bytes (xml_bytes for XML_EXTENSIONS)."""
+    metrics = _active
+    if metrics is None:
+        return
+    size = os.path.getsize(file_name)
+    metrics.count('files_written')
+    metrics.count('bytes_written', size)
+    if file_name.endswith(XML_EXTENSIONS):
+        metrics.count('xml_bytes', size)
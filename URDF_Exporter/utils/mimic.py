@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Mimic joints declared in the joint names.
+
+A joint named "<follower>-Link-<leader>:<multiplier>[:<offset>]" follows the
+joint whose name (or the part of it before "-Link-") is <leader>, exactly
+or ignoring case. Every joint is written under the part of its name before
+"-Link-".
+
+URDF consumers (ros_control, Gazebo's mimic plugins) only drive followers
+of joints that are not mimics themselves, so chains are flattened: when B
+follows A and C follows B, C is written as a follower of A with the
+composed multiplier and offset. Cycles have no joint to drive them; their
+joints are written without <mimic> and reported.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+NUMBER = r'[+-]?(?:\d+\.\d*|\d*\.\d+|\d+)(?:[eE][+-]?\d+)?'
+NAME_PATTERN = re.compile(r'^(?P<base>.+?)-Link-(?P<leader>[^:]+):(?P<mult>' + NUMBER +
+                          r')(?::(?P<offset>' + NUMBER + r'))?$', re.UNICODE)
+MIMIC_TYPES = ('revolute', 'continuous', 'prismatic')
+
+
+def base_name(name):
+    """Name a joint is written under: the part before "-Link-"."""
+    return name.split('-Link-')[0]
+
+
+def parse_name(name):
+    """
+    Parameters
+    ----------
+    name: str
+        joint name
+
+    Returns
+    ----------
+    spec: (leader, multiplier, offset) or None
+        None if the name declares no mimic
+    """
+    m = NAME_PATTERN.match(name)
+    if not m:
+        return None
+    offset = m.group('offset')
+    return m.group('leader'), float(m.group('mult')), float(offset) if offset is not None else 0.0
+
+
+@dataclass
+class MimicReport:
+    """
+    Outcome of annotate_mimics_from_names.
+
+    Attributes
+    ----------
+    annotated: [(follower, leader, multiplier, offset, via)]
+        output names of the followers given a <mimic> and of their leaders;
+        via is the leader named by a flattened follower, None for direct ones
+    unmatched: [(joint, leader)]
+        joints whose leader is not a joint of the design
+    unsupported: [(joint, type)]
+        joints of a type that cannot mimic
+    cycles: [[joint]]
+        joints following each other in a loop, left without <mimic>
+    """
+    annotated: list = field(default_factory=list)
+    unmatched: list = field(default_factory=list)
+    unsupported: list = field(default_factory=list)
+    cycles: list = field(default_factory=list)
+
+
+class NameIndex:
+    """
+    Leader lookup of joints_dict: exact key, then base name, then base name
+    ignoring case, each a dict lookup.
+    """
+
+    def __init__(self, names):
+        self.keys = set(names)
+        self.base = {}
+        self.folded = {}
+        for name in names:
+            base = base_name(name)
+            # the last joint of a base name wins the exact lookup, the
+            # first one the case-insensitive lookup
+            self.base[base] = name
+            self.folded.setdefault(base.casefold(), name)
+
+    def find(self, leader):
+        """Key of the joint named leader, None if there is none."""
+        if leader in self.keys:
+            return leader
+        if leader in self.base:
+            return self.base[leader]
+        return self.folded.get(leader.casefold())
+
+
+def _flatten(links):
+    # links: {follower: (leader, multiplier, offset)}, keys are joint keys.
+    # Returns ({follower: (root, multiplier, offset)}, cycles); root is the
+    # first joint of the chain that follows nobody, or the joint of a cycle
+    # the chain runs into. Iterative, linear in the number of links.
+    resolved = {}
+    cycles = []
+    in_cycle = set()
+    for start in links:
+        path, position = [], {}
+        node = start
+        while node in links and node not in resolved and node not in in_cycle:
+            if node in position:
+                cycle = path[position[node]:]
+                cycles.append(cycle)
+                in_cycle.update(cycle)
+                del path[position[node]:]
+                break
+            position[node] = len(path)
+            path.append(node)
+            node = links[node][0]
+        root, multiplier, offset = resolved[node] if node in resolved else (node, 1.0, 0.0)
+        for follower in reversed(path):
+            _, m, o = links[follower]
+            # follower = m * leader + o and leader = multiplier * root + offset
+            multiplier, offset = m * multiplier, m * offset + o
+            resolved[follower] = (root, multiplier, offset)
+    return resolved, cycles
+
+
+def annotate_mimics_from_names(joints_dict):
+    """
+    Set 'output_name' of every joint and 'mimic' of the followers declared
+    in the joint names (see the module docstring).
+
+    Parameters
+    ----------
+    joints_dict: {name: {type, mimic, ...}}
+        see Joint.make_joints_dict; joints already holding a mimic are kept
+
+    Returns
+    ----------
+    report: MimicReport
+    """
+    report = MimicReport()
+    index = NameIndex(joints_dict)
+    links = {}
+    for name, joint in joints_dict.items():
+        joint['output_name'] = base_name(name)
+        spec = parse_name(name)
+        if spec is None:
+            continue
+        leader, multiplier, offset = spec
+        leader_key = index.find(leader)
+        if leader_key is None:
+            report.unmatched.append((name, leader))
+        elif joint['type'] not in MIMIC_TYPES:
+            report.unsupported.append((name, joint['type']))
+        elif joint.get('mimic') is None:
+            links[name] = (leader_key, multiplier, offset)
+
+    resolved, report.cycles = _flatten(links)
+    for name, (leader_key, _, _) in links.items():
+        if name not in resolved:
+            continue
+        root, multiplier, offset = resolved[name]
+        via = None
+        if root != leader_key:
+            via = base_name(leader_key)
+            # composed factors carry float noise (0.1 * 3) into the URDF
+            multiplier, offset = round(multiplier, 12), round(offset, 12)
+        leader = base_name(root)
+        joints_dict[name]['mimic'] = {'joint': leader, 'multiplier': multiplier, 'offset': offset}
+        report.annotated.append((base_name(name), leader, multiplier, offset, via))
+    return report
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Settings of one export run.
+
+run() builds an ExportOptions with the defaults below; edit them here (or
+construct ExportOptions yourself when driving the stages from a script).
+"""
+
+from dataclasses import dataclass
+from .mesh import MESH_FORMATS
+from .refinement import REFINEMENTS
+from .transforms import LINK_FRAMES
+from ..core.Snapshot import ACCURACY_TIERS
+
+# mesh export modes
+#   'direct': export each link straight from its occurrence in the design
+#   'copy':   copy the bodies of every link into a temporary component,
+#             export those and delete them again (the original behaviour,
+#             kept as a fallback)
+MESH_EXPORT_MODES = ('direct', 'copy')
+
+# inertia engines
+#   'fusion': getPhysicalProperties of every link
+#   'mesh':   signed tetrahedra over the exported meshes and mesh_density
+#             (needs numpy, see inertia.py)
+INERTIA_ENGINES = ('fusion', 'mesh')
+
+
+@dataclass
+class ExportOptions:
+    """
+    Attributes
+    ----------
+    mesh_export_mode: str
+        one of MESH_EXPORT_MODES
+    collision_triangle_budget: int
+        maximum triangles of the decimated collision meshes written to
+        meshes/collision/; 0 uses the visual meshes for collision
+    collision_primitives: bool
+        replace the collision mesh of a link by a box, cylinder or sphere
+        when one fits the mesh within primitive_max_error
+    primitive_max_error: float
+        largest accepted (primitive volume - mesh volume) / mesh volume
+    collision_spheres: int
+        spheres per link written to config/collision_spheres.yaml for
+        sphere based planners; 0 writes no sphere file
+    sphere_samples: int
+        surface samples per link the spheres are clustered from
+    mesh_format: str
+        'stl', or 'obj' / 'glb' to replace the exported STLs by indexed,
+        vertex-welded meshes (needs numpy)
+    weld_tolerance: float
+        distance in mm below which vertices are merged
+    mesh_refinement: str
+        'low', 'medium' or 'high' for one Fusion preset for every mesh, or
+        'adaptive' for a surface deviation per mesh from its size and
+        mesh_triangle_budget
+    mesh_triangle_budget: int
+        estimated triangles of all meshes of the robot together ('adaptive')
+    mass_accuracy: str
+        accuracy tier of the mass properties: 'draft' (Low), 'normal' (High)
+        or 'final' (VeryHigh)
+    mass_progressive: bool
+        after the first pass, upgrade link by link to the next tiers while
+        the mass or inertia still changes by more than mass_tolerance
+    mass_tolerance: float
+        relative change between tiers below which a link is kept
+    inertia_engine: str
+        one of INERTIA_ENGINES
+    mesh_density: float
+        kg/m^3 of every link for the 'mesh' engine
+    inertia_cross_check: bool
+        with the 'fusion' engine, also derive each link's center of mass and
+        tensor from its mesh (at the Fusion mass) and log the differences
+    link_frames: str
+        'world' for link frames parallel to the design axes (every rpy is
+        0), 'occurrence' for frames turning with their occurrences (see
+        transforms.py)
+    artifact_workers: int
+        threads writing the URDF, xacro, launch and yaml files and copying
+        the package template; 1 writes them one after another. Rendering
+        holds the GIL, so more threads only pay off on slow disks
+    profile: bool
+        profile the main thread with cProfile, dump export_profile.prof next
+        to the log and list the top functions in it
+    trace_api: bool
+        count and time every Fusion API property read and method call of
+        the export and log them ranked by time (see apitrace.py)
+    dump_snapshot: bool
+        save the design snapshot, the link mass properties and the exported
+        STLs to design_snapshot.json.gz next to the log, to rebuild the
+        package without Fusion with `python -m URDF_Exporter`
+    """
+    mesh_export_mode: str = 'direct'
+    collision_triangle_budget: int = 1000
+    collision_primitives: bool = False
+    primitive_max_error: float = 0.1
+    collision_spheres: int = 0
+    sphere_samples: int = 2000
+    mesh_format: str = 'stl'
+    weld_tolerance: float = 1e-4
+    mesh_refinement: str = 'low'
+    mesh_triangle_budget: int = 500000
+    mass_accuracy: str = 'final'
+    mass_progressive: bool = False
+    mass_tolerance: float = 1e-3
+    inertia_engine: str = 'fusion'
+    mesh_density: float = 7850.0
+    inertia_cross_check: bool = False
+    link_frames: str = 'world'
+    artifact_workers: int = 1
+    profile: bool = False
+    trace_api: bool = False
+    dump_snapshot: bool = False
+
+    def __post_init__(self):
+        if self.mesh_export_mode not in MESH_EXPORT_MODES:
+            raise ValueError('mesh_export_mode must be one of {}, got {!r}'
+                             .format(MESH_EXPORT_MODES, self.mesh_export_mode))
+        if self.mesh_refinement not in REFINEMENTS:
+            raise ValueError('mesh_refinement must be one of {}, got {!r}'
+                             .format(REFINEMENTS, self.mesh_refinement))
+        if self.mass_accuracy not in ACCURACY_TIERS:
+            raise ValueError('mass_accuracy must be one of {}, got {!r}'
+                             .format(ACCURACY_TIERS, self.mass_accuracy))
+        if self.inertia_engine not in INERTIA_ENGINES:
+            raise ValueError('inertia_engine must be one of {}, got {!r}'
+                             .format(INERTIA_ENGINES, self.inertia_engine))
+        if self.link_frames not in LINK_FRAMES:
+            raise ValueError('link_frames must be one of {}, got {!r}'
+                             .format(LINK_FRAMES, self.link_frames))
+        if self.artifact_workers < 1:
+            raise ValueError('artifact_workers must be at least 1, got {!r}'.format(self.artifact_workers))
+        if self.mesh_format not in MESH_FORMATS:
+            raise ValueError('mesh_format must be one of {}, got {!r}'
+                             .format(MESH_FORMATS, self.mesh_format))
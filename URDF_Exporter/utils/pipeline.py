@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Stages of one export and the background worker overlapping them.
+
+run() walks a fixed graph of stages:
+
+    snapshot -> kinematics -> inertials -> mesh export -> urdf -> finalize
+                          \\-> text (background worker) ------/
+
+Fusion's API may only be called from the main thread, so every stage that
+reads the design or exports meshes stays there. The text artifacts that
+only depend on the joints (transmissions, gazebo, launch and yaml files,
+the package template) need no Fusion call: they are rendered on one
+background worker from the end of the kinematics stage on, while the main
+thread reads the physical properties and exports the meshes. The URDF
+refers to the mesh results (collision shapes, mesh inertials, formats) and
+is written once they exist; the worker is joined before finalize.
+
+Every stage records its start and end on one monotonic clock, so the log
+shows which stages ran side by side.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+
+@dataclass
+class StageTiming:
+    """
+    Attributes
+    ----------
+    name: str
+    thread: str
+        'main' or 'background'
+    start, end: float
+        seconds since the pipeline started; end is None while running
+    """
+    name: str
+    thread: str
+    start: float
+    end: float = None
+
+    @property
+    def seconds(self):
+        return None if self.end is None else self.end - self.start
+
+
+class Pipeline:
+    """
+    Stage clock of run() and its background worker.
+
+    The main thread moves from one stage to the next with begin(); work
+    without Fusion calls is handed to background() and collected with
+    join().
+    """
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self.timings = []
+        self._current = None
+        self._executor = None
+        self._futures = {}
+
+    def now(self):
+        """Seconds since the pipeline started."""
+        return time.perf_counter() - self._t0
+
+    def begin(self, name):
+        """End the current main thread stage, if any, and start stage name."""
+        self.end()
+        self._current = StageTiming(name, 'main', self.now())
+        self.timings.append(self._current)
+
+    def end(self):
+        """End the current main thread stage."""
+        if self._current is not None:
+            self._current.end = self.now()
+            self._current = None
+
+    def background(self, name, fn):
+        """
+        Run fn() on the background worker as stage name.
+
+        Parameters
+        ----------
+        name: str
+        fn: callable
+            must not call the Fusion API
+
+        Returns
+        ----------
+        future: concurrent.futures.Future
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='export')
+        timing = StageTiming(name, 'background', None)
+        self.timings.append(timing)
+
+        def timed():
+            timing.start = self.now()
+            try:
+                return fn()
+            finally:
+                timing.end = self.now()
+        self._futures[name] = self._executor.submit(timed)
+        return self._futures[name]
+
+    def join(self, name):
+        """Wait for the background stage name; return its result or raise its exception."""
+        return self._futures.pop(name).result()
+
+    def close(self):
+        """Wait for the background worker and stop it; the stage clock keeps its timings."""
+        self.end()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def overlap(self, a, b):
+        """Seconds stages a and b ran at the same time."""
+        ta = next(t for t in self.timings if t.name == a)
+        tb = next(t for t in self.timings if t.name == b)
+        if None in (ta.start, ta.end, tb.start, tb.end):
+            return 0.0
+        return max(0.0, min(ta.end, tb.end) - max(ta.start, tb.start))
+
+    def report(self):
+        """Log lines of the stage timings, in start order."""
+        done = sorted((t for t in self.timings if t.end is not None), key=lambda t: t.start)
+        return ['[stage] {:<12} {:<10} {:8.3f}s  ({:.3f} -> {:.3f})'
+                .format(t.name, t.thread, t.seconds, t.start, t.end) for t in done]
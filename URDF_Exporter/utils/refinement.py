@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Mesh refinement settings of the STL export.
+
+The fixed presets map to Fusion's MeshRefinementSettings. The 'adaptive'
+planner instead gives every mesh a custom surface deviation proportional to
+its size, with one global factor chosen so that the estimated triangle count
+of the whole robot stays within a budget: small fasteners get coarse
+absolute tolerances, large curved shells fine ones.
+"""
+
+import math
+try:
+    import adsk, adsk.core, adsk.fusion
+except ImportError:  # standalone tools run outside Fusion
+    adsk = None
+
+PRESETS = {'low': 'MeshRefinementLow',
+           'medium': 'MeshRefinementMedium',
+           'high': 'MeshRefinementHigh'}
+REFINEMENTS = tuple(PRESETS) + ('adaptive',)
+
+# a curved surface of area A and size d meshed with chord deviation
+# r * d needs about TRIANGLE_FACTOR * A / d^2 / r triangles (a sphere gives
+# pi / (sqrt(3) r), i.e. 0.58 * A / d^2 / r)
+TRIANGLE_FACTOR = 0.58
+# relative deviation is kept within these bounds whatever the budget
+MIN_RELATIVE_DEVIATION = 1e-4
+MAX_RELATIVE_DEVIATION = 0.05
+# Fusion rejects tolerances below a few microns (cm)
+MIN_SURFACE_DEVIATION = 5e-4
+MAX_NORMAL_DEVIATION = math.radians(30.0)
+MIN_NORMAL_DEVIATION = math.radians(2.0)
+
+
+def _size(fingerprint):
+    lo, hi = fingerprint['bbox']
+    return math.sqrt(sum((b - a)**2 for a, b in zip(lo, hi)))
+
+
+def _quantize_up(value):
+    # snap to a power of sqrt(2) (rounding up) so that a small change of one
+    # link does not change the settings, and the mesh fingerprints, of all
+    # the others
+    return 2.0 ** (math.ceil(2.0 * math.log2(value)) / 2.0)
+
+
+def plan_refinement(fingerprints, mode, triangle_budget):
+    """
+    Refinement settings for every mesh.
+
+    Parameters
+    ----------
+    fingerprints: {name: fingerprint or None}
+        see manifest.fingerprint; bbox in cm, area in cm^2
+    mode: str
+        one of REFINEMENTS
+    triangle_budget: int
+        estimated triangles of all meshes together ('adaptive' only)
+
+    Returns
+    ----------
+    settings: {name: dict}
+        {'refinement': 'MeshRefinementLow'} for the presets (and for meshes
+        without a fingerprint), {'refinement': 'MeshRefinementCustom',
+        'surface_deviation': cm, 'normal_deviation': rad, 'estimate': int}
+        for adaptive meshes
+    """
+    if mode != 'adaptive':
+        return {name: {'refinement': PRESETS[mode]} for name in fingerprints}
+
+    shapes = {}
+    for name, fp in fingerprints.items():
+        if fp and _size(fp) > 0 and fp['area'] > 0:
+            shapes[name] = (_size(fp), fp['area'])
+    # estimate(r) = sum(TRIANGLE_FACTOR * A / d^2) / r for one relative deviation r
+    weight = sum(TRIANGLE_FACTOR * area / size**2 for size, area in shapes.values())
+    relative = weight / triangle_budget if triangle_budget > 0 else MAX_RELATIVE_DEVIATION
+    relative = min(max(_quantize_up(relative) if relative > 0 else MIN_RELATIVE_DEVIATION,
+                       MIN_RELATIVE_DEVIATION), MAX_RELATIVE_DEVIATION)
+
+    settings = {}
+    for name in fingerprints:
+        if name not in shapes:
+            settings[name] = {'refinement': PRESETS['low']}
+            continue
+        size, area = shapes[name]
+        deviation = max(relative * size, MIN_SURFACE_DEVIATION)
+        # angle between the normals of a chord with sagitta r*d on a radius d/2
+        normal = min(max(4.0 * math.sqrt(deviation / size), MIN_NORMAL_DEVIATION), MAX_NORMAL_DEVIATION)
+        settings[name] = {'refinement': 'MeshRefinementCustom',
+                          'surface_deviation': deviation,
+                          'normal_deviation': normal,
+                          'estimate': int(TRIANGLE_FACTOR * area / (size * deviation))}
+    return settings
+
+
+def describe(settings):
+    """Short text of settings for the logs and the mesh fingerprints."""
+    if settings['refinement'] != 'MeshRefinementCustom':
+        return settings['refinement']
+    return 'MeshRefinementCustom sd={:.4g} nd={:.4g}'.format(settings['surface_deviation'],
+                                                            settings['normal_deviation'])
+
+
+def apply(stl_options, settings):
+    """Set the refinement of an adsk.fusion.STLExportOptions."""
+    stl_options.meshRefinement = getattr(adsk.fusion.MeshRefinementSettings, settings['refinement'])
+    if settings['refinement'] == 'MeshRefinementCustom':
+        stl_options.surfaceDeviation = settings['surface_deviation']
+        stl_options.normalDeviation = settings['normal_deviation']
+
+
+def stl_triangle_count(file_name):
+    """Triangles of a binary STL, from its header; None if unreadable."""
+    try:
+        with open(file_name, 'rb') as f:
+            f.seek(80)
+            return int.from_bytes(f.read(4), 'little')
+    except OSError:
+        return None
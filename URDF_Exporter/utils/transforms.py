@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Batched rigid transforms of occurrences, joints and link frames.
+
+The occurrence matrices (row major 16-tuples, as Matrix3D.asArray()
+returns them) are stacked into one (N, 4, 4) array, and the joint world
+origins, the parent -> child transforms and their roll/pitch/yaw are
+computed for all joints in a few numpy operations. Fusion's bundled Python
+has no numpy; every function then falls back to a plain loop with the same
+results.
+
+Link frames
+-----------
+'world':      every link frame is parallel to the design's axes, at the
+              world position of the joint that moves it (the original
+              behaviour; all rpy are 0 and meshes, which stay in world
+              coordinates, are offset by -xyz)
+'occurrence': the frame of a link additionally turns with its occurrence,
+              so joint origins get the rpy between the parent and child
+              occurrences, axes are given in the child frame and the
+              visual, collision and inertial origins are rotated to match.
+              base_link keeps the world frame.
+"""
+
+import itertools
+import math
+from dataclasses import dataclass, field
+
+try:
+    import numpy as np
+except ImportError:  # Fusion's bundled Python
+    np = None
+
+LINK_FRAMES = ('world', 'occurrence')
+IDENTITY = ((1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0))
+
+
+def rotation(transform):
+    """3x3 rotation (rows) of a row-major 16-tuple."""
+    m = transform
+    return ((m[0], m[1], m[2]), (m[4], m[5], m[6]), (m[8], m[9], m[10]))
+
+
+def transpose(R):
+    return tuple(zip(*R))
+
+
+def matmul(A, B):
+    """3x3 product A @ B."""
+    return tuple(tuple(sum(A[i][k] * B[k][j] for k in range(3)) for j in range(3)) for i in range(3))
+
+
+def rotate(R, v):
+    """R @ v for a 3-vector."""
+    return tuple(R[i][0]*v[0] + R[i][1]*v[1] + R[i][2]*v[2] for i in range(3))
+
+
+def rpy(R):
+    """URDF roll, pitch, yaw (R = Rz(yaw) Ry(pitch) Rx(roll)) of a 3x3 rotation."""
+    return (math.atan2(R[2][1], R[2][2]),
+            math.atan2(-R[2][0], math.hypot(R[2][1], R[2][2])),
+            math.atan2(R[1][0], R[0][0]))
+
+
+def rpy_matrix(roll, pitch, yaw):
+    """3x3 rotation of URDF roll, pitch, yaw."""
+    cr, sr = math.cos(roll), math.sin(roll)
+    cp, sp = math.cos(pitch), math.sin(pitch)
+    cy, sy = math.cos(yaw), math.sin(yaw)
+    return ((cy*cp, cy*sp*sr - sy*cr, cy*sp*cr + sy*sr),
+            (sy*cp, sy*sp*sr + cy*cr, sy*sp*cr - cy*sr),
+            (-sp, cp*sr, cp*cr))
+
+
+def rotate_tensor(R, moments):
+    """
+    R I R^T of an inertia tensor given as [xx, yy, zz, xy, yz, xz].
+    """
+    xx, yy, zz, xy, yz, xz = moments
+    t = matmul(matmul(R, ((xx, xy, xz), (xy, yy, yz), (xz, yz, zz))), transpose(R))
+    return [t[0][0], t[1][1], t[2][2], t[0][1], t[1][2], t[0][2]]
+
+
+def _array(rows, width):
+    # np.fromiter over the flattened tuples is several times faster than
+    # np.asarray on a list of tuples
+    return np.fromiter(itertools.chain.from_iterable(rows), np.float64, len(rows) * width).reshape(len(rows), -1)
+
+
+def stack(transforms):
+    """(N, 4, 4) array of row-major 16-tuples (numpy only)."""
+    return _array(transforms, 16).reshape(-1, 4, 4)
+
+
+def apply(transforms, points):
+    """
+    Transform point i by matrix i.
+
+    Parameters
+    ----------
+    transforms: [16-tuple] or (N, 4, 4) array
+    points: [(x, y, z)]
+
+    Returns
+    ----------
+    points: [(x, y, z)]
+    """
+    if not len(points):
+        return []
+    if np is None:
+        return [tuple(m[4*i]*p[0] + m[4*i + 1]*p[1] + m[4*i + 2]*p[2] + m[4*i + 3] for i in range(3))
+                for m, p in zip(transforms, points)]
+    matrices = transforms if hasattr(transforms, 'ndim') else stack(transforms)
+    out = np.einsum('nij,nj->ni', matrices[:, :3, :3], _array(points, 3)) + matrices[:, :3, 3]
+    return list(map(tuple, out.tolist()))
+
+
+def rpy_batch(rotations):
+    """Roll, pitch, yaw (N, 3) of (N, 3, 3) rotations."""
+    R = np.asarray(rotations, dtype=np.float64)
+    return np.stack([np.arctan2(R[:, 2, 1], R[:, 2, 2]),
+                     np.arctan2(-R[:, 2, 0], np.hypot(R[:, 2, 1], R[:, 2, 2])),
+                     np.arctan2(R[:, 1, 0], R[:, 0, 0])], axis=1)
+
+
+def relative(parents, children):
+    """
+    Parent -> child transforms inv(P) C of rigid frames.
+
+    Parameters
+    ----------
+    parents, children: [(rotation, origin)]
+        frames as 3x3 rotations (rows) and origins
+
+    Returns
+    ----------
+    transforms: [(xyz, rpy)]
+        origin and roll, pitch, yaw of each child in its parent frame
+    """
+    if not len(parents):
+        return []
+    if np is None:
+        out = []
+        for (Rp, pp), (Rc, pc) in zip(parents, children):
+            Rt = transpose(Rp)
+            out.append((rotate(Rt, [c - p for c, p in zip(pc, pp)]), rpy(matmul(Rt, Rc))))
+        return out
+    Rp = _array([r for f in parents for r in f[0]], 3).reshape(-1, 3, 3)
+    Rc = _array([r for f in children for r in f[0]], 3).reshape(-1, 3, 3)
+    d = _array([f[1] for f in children], 3) - _array([f[1] for f in parents], 3)
+    xyz = np.einsum('nji,nj->ni', Rp, d)  # Rp^T d
+    R = np.einsum('nji,njk->nik', Rp, Rc)  # Rp^T Rc
+    return list(zip(map(tuple, xyz.tolist()), map(tuple, rpy_batch(R).tolist())))
+
+
+def inverse_rotate(rotations, vectors):
+    """R_i^T v_i: world vectors expressed in frames with rotations R_i (3x3 rows)."""
+    if not len(rotations):
+        return []
+    if np is None:
+        return [tuple(R[0][i]*v[0] + R[1][i]*v[1] + R[2][i]*v[2] for i in range(3))
+                for R, v in zip(rotations, vectors)]
+    R = _array([r for rotation in rotations for r in rotation], 3).reshape(-1, 3, 3)
+    return list(map(tuple, np.einsum('nji,nj->ni', R, _array(vectors, 3)).tolist()))
+
+
+def joint_world_origins(snapshot):
+    """
+    World position (cm) of every joint seen from each of its occurrences.
+
+    Parameters
+    ----------
+    snapshot: Snapshot.DesignSnapshot
+
+    Returns
+    ----------
+    origins: {joint name: (world_one, world_two)}
+        origin_one / origin_two mapped by the transform of occurrenceOne /
+        occurrenceTwo, None where the joint has no readable origin
+    """
+    occurrences = snapshot.occurrences
+    joints = snapshot.joints
+    matrices, points, slots = [], [], []
+    for i, joint in enumerate(joints):
+        if joint.origin_one is not None:
+            matrices.append(occurrences[joint.occurrence_one].transform)
+            points.append(joint.origin_one)
+            slots.append(2*i)
+        if joint.origin_two is not None:
+            matrices.append(occurrences[joint.occurrence_two].transform)
+            points.append(joint.origin_two)
+            slots.append(2*i + 1)
+    world = [None] * (2 * len(joints))
+    for slot, point in zip(slots, apply(matrices, points)):
+        world[slot] = point
+    return {joint.name: (world[2*i], world[2*i + 1]) for i, joint in enumerate(joints)}
+
+
+@dataclass
+class Frames:
+    """
+    Resolved link frames of an export ('occurrence' link frames).
+
+    Attributes
+    ----------
+    links: {name: (rotation, origin)}
+        rotation (3x3 rows, link -> world) and origin (m, world) of every link
+    joints: {joint name: (xyz, rpy, axis)}
+        joint origin in the parent frame (m, rounded like the 'world'
+        frames), its roll/pitch/yaw and the axis in the child frame
+    """
+    links: dict = field(default_factory=dict)
+    joints: dict = field(default_factory=dict)
+
+
+def resolve_frames(snapshot, joints_dict, link_frames='occurrence'):
+    """
+    Link frames and joint origins of joints_dict (see make_joints_dict).
+
+    Parameters
+    ----------
+    snapshot: Snapshot.DesignSnapshot
+    joints_dict: {name: {parent, child, xyz, axis, ...}}
+    link_frames: str
+        one of LINK_FRAMES
+
+    Returns
+    ----------
+    frames: Frames
+    """
+    rotations = {}
+    if link_frames == 'occurrence':
+        for occ in snapshot.top_level_occurrences():
+            if occ.link_name != 'base_link':
+                rotations.setdefault(occ.link_name, rotation(occ.transform))
+
+    frames = Frames()
+    frames.links['base_link'] = (IDENTITY, (0.0, 0.0, 0.0))
+    for joint in joints_dict.values():
+        # the first joint that reaches a link places it (see Model.make_model)
+        frames.links.setdefault(joint['child'], (rotations.get(joint['child'], IDENTITY), tuple(joint['xyz'])))
+
+    names = [j for j in joints_dict if joints_dict[j]['parent'] in frames.links]
+    parents = [frames.links[joints_dict[j]['parent']] for j in names]
+    children = [frames.links[joints_dict[j]['child']] for j in names]
+    axes = inverse_rotate([rotation for rotation, _ in children], [joints_dict[j]['axis'] for j in names])
+    for name, (xyz, angles), axis in zip(names, relative(parents, children), axes):
+        frames.joints[name] = ([round(v, 6) + 0.0 for v in xyz],
+                               [round(v, 6) + 0.0 for v in angles],
+                               [round(v, 6) + 0.0 for v in axis])
+    return frames
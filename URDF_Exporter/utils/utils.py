@@ -5,23 +5,39 @@ Created on Sun May 12 19:15:34 2019
 @author: syuntoku
 """
 
-import adsk, adsk.core, adsk.fusion
+try:
+    import adsk, adsk.core, adsk.fusion
+except ImportError:  # standalone tools (see inertia.py) run outside Fusion
+    adsk = None
 import os.path, re
 from xml.etree import ElementTree
 from xml.dom import minidom
 import shutil  # Replaced distutils with shutil
-import fileinput
-import sys
+import contextlib
+import threading
+from . import manifest, refinement, metrics
 
-def copy_occs(root):    
+# buffer size of the handles opened by atomic_open; a whole URDF for a few
+# hundred links goes out in a handful of write syscalls
+WRITE_BUFFER_SIZE = 1 << 16
+
+def copy_occs(root, snapshot):    
     """    
     duplicate all the components
+
+    Parameters
+    ----------
+    root: adsk.fusion.Component
+        root component
+    snapshot: Snapshot.DesignSnapshot
+        names and body counts of the top-level occurrences, so they are not
+        read from the design again
     """    
-    def copy_body(allOccs, occs):
+    def copy_body(allOccs, occ_snap):
         """    
         copy the old occs to new component
         """
-        
+        occs = occ_snap.native
         bodies = occs.bRepBodies
         transform = adsk.core.Matrix3D.create()
         
@@ -29,13 +45,13 @@ def copy_occs(root):
         # This support even when a component has some occses. 
 
         new_occs = allOccs.addNewComponent(transform)  # this create new occs
-        orig_name = occs.component.name
-        if occs.component.name == 'base_link':
+        orig_name = occ_snap.component_name
+        if orig_name == 'base_link':
             # rename original to a temporary name and give the new component the base name
             occs.component.name = 'old_component'
             new_occs.component.name = 'base_link'
         else:
-            new_occs.component.name = re.sub('[ :()]', '_', occs.name)
+            new_occs.component.name = occ_snap.name
         # After addNewComponent the newly created occurrence is at the end
         new_occs = allOccs.item((allOccs.count-1))
         for i in range(bodies.count):
@@ -46,15 +62,14 @@ def copy_occs(root):
     allOccs = root.occurrences
     oldOccs = []
     copied_info = []
-    coppy_list = [occs for occs in allOccs]
-    for occs in coppy_list:
-        if occs.bRepBodies.count > 0:
+    for occ_snap in snapshot.top_level_occurrences():
+        if occ_snap.body_count > 0:
             try:
-                new_occ, orig_name = copy_body(allOccs, occs)
-                oldOccs.append(occs)
-                copied_info.append({'new_occ': new_occ, 'orig_occ': occs, 'orig_name': orig_name})
+                new_occ, orig_name = copy_body(allOccs, occ_snap)
+                oldOccs.append(occ_snap.native)
+                copied_info.append({'new_occ': new_occ, 'orig_occ': occ_snap.native, 'orig_name': orig_name})
             except Exception as e:
-                print('Failed copying occ {}: {}'.format(occs.name, e))
+                print('Failed copying occ {}: {}'.format(occ_snap.name, e))
 
     # mark originals as temporarily renamed so new components can take their names
     for occs in oldOccs:
@@ -102,41 +117,214 @@ def delete_copied_components(root, copied_info):
             print('Failed to delete copied component: {}'.format(e))
 
 
-def export_stl(design, save_dir, components):  
+def plan_stl_export(components):
     """
-    export stl files into "save_dir/"
-    
+    Unique mesh export targets of the occurrences in components.
+
+    allOccurrences of a component also lists the occurrences nested below
+    it, so the same output file is reached once per ancestor component.
+    Each file name is planned once; when several occurrences map to the
+    same name the last one visited is kept, which is the one whose export
+    used to end up on disk.
+
     Parameters
     ----------
-    design: adsk.fusion.Design.cast(product)
-    save_dir: str
-        directory path to save
     components: design.allComponents
+
+    Returns
+    ----------
+    targets: [(file_name, occurrence)]
+        in order of first visit
+    visited: int
+        number of (component, occurrence) pairs looked at
+    """
+    targets = {}
+    visited = 0
+    for component in components:
+        for occ in component.allOccurrences:
+            visited += 1
+            name = occ.component.name
+            if 'old_component' not in name:
+                targets[name] = occ
+    return list(targets.items()), visited
+
+
+def plan_direct_stl_export(snapshot):
+    """
+    Mesh export targets for exporting straight from the design: one per
+    top-level occurrence with bodies, named after its link. These are the
+    names the copied components of copy_occs get.
+
+    Parameters
+    ----------
+    snapshot: Snapshot.DesignSnapshot
+
+    Returns
+    ----------
+    targets: [(file_name, occurrence)]
+    transforms: {file_name: (16 floats)}
+        occurrence transforms from the snapshot, for the mesh fingerprints
+    """
+    targets = []
+    transforms = {}
+    for occ_snap in snapshot.top_level_occurrences():
+        if occ_snap.body_count > 0 and occ_snap.link_name not in transforms:
+            targets.append((occ_snap.link_name, occ_snap.native))
+            transforms[occ_snap.link_name] = occ_snap.transform
+    return targets, transforms
+
+
+def _export_targets(design, save_dir, targets, previous_dir, transforms=None, mesh_format='stl',
+                    mesh_refinement='low', triangle_budget=0):
+    """
+    Export every (file_name, occurrence) of targets once as a binary STL
+    into "save_dir/meshes/", reusing unchanged meshes of previous_dir that
+    are already in mesh_format. The refinement of each mesh comes from
+    refinement.plan_refinement and is kept in mesh_manifest.settings.
     """
-          
     # create a single exportManager instance
     exportMgr = design.exportManager
     # get the script location
     try: os.mkdir(save_dir + '/meshes')
     except: pass
     scriptDir = save_dir + '/meshes'  
-    # export the occurrence one by one in the component to a specified file
-    for component in components:
-        allOccus = component.allOccurrences
-        for occ in allOccus:
-            if 'old_component' not in occ.component.name:
-                try:
-                    print(occ.component.name)
-                    fileName = scriptDir + "/" + occ.component.name              
-                    # create stl exportOptions
-                    stlExportOptions = exportMgr.createSTLExportOptions(occ, fileName)
-                    stlExportOptions.sendToPrintUtility = False
-                    stlExportOptions.isBinaryFormat = True
-                    # options are .MeshRefinementLow .MeshRefinementMedium .MeshRefinementHigh
-                    stlExportOptions.meshRefinement = adsk.fusion.MeshRefinementSettings.MeshRefinementLow
-                    exportMgr.execute(stlExportOptions)
-                except:
-                    print('Component ' + occ.component.name + ' has something wrong.')
+    mesh_manifest = manifest.MeshManifest(
+        scriptDir, previous_dir + '/meshes' if previous_dir else None, '.' + mesh_format)
+    mesh_manifest.planned = len(targets)
+    transforms = transforms or {}
+    # the size of every mesh is needed to plan the refinement before the first export
+    fingerprints = {name: manifest.fingerprint(occ, None, transforms.get(name)) for name, occ in targets}
+    mesh_manifest.settings = refinement.plan_refinement(fingerprints, mesh_refinement, triangle_budget)
+    # export each planned occurrence exactly once
+    for name, occ in targets:
+        try:
+            print(name)
+            fileName = scriptDir + "/" + name
+            settings = mesh_manifest.settings[name]
+            fingerprint = fingerprints[name]
+            if fingerprint is not None:
+                fingerprint['refinement'] = refinement.describe(settings)
+            if mesh_manifest.reuse(name, fingerprint):
+                metrics.count('meshes_reused')
+                continue
+            with metrics.timer('mesh_export', name):
+                # create stl exportOptions
+                stlExportOptions = exportMgr.createSTLExportOptions(occ, fileName)
+                stlExportOptions.sendToPrintUtility = False
+                stlExportOptions.isBinaryFormat = True
+                refinement.apply(stlExportOptions, settings)
+                exportMgr.execute(stlExportOptions)
+            metrics.count('meshes_exported')
+            mesh_manifest.record(name, fingerprint)
+        except:
+            metrics.count('mesh_export_failures')
+            print('Component ' + name + ' has something wrong.')
+    mesh_manifest.save()
+    return mesh_manifest
+
+
+def export_stl(design, save_dir, components, previous_dir=None, mesh_format='stl',
+               mesh_refinement='low', triangle_budget=0):  
+    """
+    export stl files into "save_dir/"
+    
+    Parameters
+    ----------
+    design: adsk.fusion.Design.cast(product)
+    save_dir: str
+        directory path to save
+    components: design.allComponents
+    previous_dir: str
+        previous version of the package; meshes whose fingerprint is
+        unchanged since then are linked from there instead of re-exported
+    mesh_format: str
+        format the meshes end up in (see mesh.convert_meshes); reused meshes
+        are taken in that format
+    mesh_refinement: str
+        'low', 'medium', 'high' or 'adaptive' (see refinement.plan_refinement)
+    triangle_budget: int
+        estimated triangles of all meshes together for 'adaptive'
+
+    Returns
+    ----------
+    mesh_manifest: manifest.MeshManifest
+        written to "save_dir/meshes/mesh_manifest.json", counts planned,
+        exported and reused meshes
+    """
+    targets, visited = plan_stl_export(components)
+    mesh_manifest = _export_targets(design, save_dir, targets, previous_dir, None, mesh_format,
+                                    mesh_refinement, triangle_budget)
+    mesh_manifest.visited = visited
+    return mesh_manifest
+
+
+def export_stl_direct(design, save_dir, snapshot, previous_dir=None, mesh_format='stl',
+                      mesh_refinement='low', triangle_budget=0):
+    """
+    export one stl file per link into "save_dir/meshes/" straight from the
+    occurrences of the design, without copy_occs / delete_copied_components.
+
+    Fusion meshes an occurrence in root coordinates, the same frame the
+    bodies copied by copy_occs end up in, so the files match the ones of
+    export_stl except that bodies of nested occurrences are part of the
+    link mesh.
+
+    Parameters
+    ----------
+    design: adsk.fusion.Design.cast(product)
+    save_dir: str
+        directory path to save
+    snapshot: Snapshot.DesignSnapshot
+    previous_dir: str
+        previous version of the package, see export_stl
+    mesh_format, mesh_refinement, triangle_budget:
+        see export_stl
+
+    Returns
+    ----------
+    mesh_manifest: manifest.MeshManifest
+    """
+    targets, transforms = plan_direct_stl_export(snapshot)
+    mesh_manifest = _export_targets(design, save_dir, targets, previous_dir, transforms, mesh_format,
+                                    mesh_refinement, triangle_budget)
+    mesh_manifest.visited = len(snapshot.top_level)
+    return mesh_manifest
+
+
+def next_package_name(base_dir, package_name):
+    """
+    If a package with the same name already exists in base_dir, append a
+    version suffix _vN where N is 1 higher than the highest existing version
+    number found. Existing names handled are:
+      package_name
+      package_name_v1, package_name_v2, ...
+
+    Returns
+    ----------
+    package_name: str
+        name for the new package
+    previous_name: str or None
+        the existing package with the highest version
+    """
+    try:
+        existing_versions = {}
+        for name in os.listdir(base_dir):
+            if name == package_name:
+                existing_versions[0] = name
+            else:
+                m = re.match(re.escape(package_name) + r'_v(\d+)$', name)
+                if m:
+                    try:
+                        existing_versions[int(m.group(1))] = name
+                    except ValueError:
+                        pass
+        if existing_versions:
+            last = max(existing_versions)
+            return f"{package_name}_v{last + 1}", existing_versions[last]
+    except Exception:
+        # If anything goes wrong (permissions, etc.), fall back to original name
+        pass
+    return package_name, None
 
 
 def file_dialog(ui):     
@@ -176,21 +364,169 @@ def origin2center_of_mass(inertia, center_of_mass, mass):
     return [round(i - mass*t, 6) for i, t in zip(inertia, translation_matrix)]
 
 
+class _UnsupportedXml(Exception):
+    """Raised by _pretty_xml_parts for trees only the minidom path handles."""
+
+
+def _escape_xml(data):
+    # same replacements, in the same order, as xml.dom.minidom._write_data
+    return data.replace("&", "&amp;").replace("<", "&lt;"). \
+                replace("\"", "&quot;").replace(">", "&gt;")
+
+
+def _pretty_xml_parts(elem, parts, indent, addindent):
+    """
+    Append the pretty-printed lines of elem to parts, laid out exactly like
+    minidom's toprettyxml(indent=addindent).
+
+    Mixed content, tails, comments, namespaced names, non-string values and
+    whitespace that ElementTree would escape inside attributes raise
+    _UnsupportedXml; prettify() hands those to the minidom path.
+    """
+    tag = elem.tag
+    if not isinstance(tag, str) or tag[:1] == '{':
+        raise _UnsupportedXml(tag)
+    parts.append(indent + '<' + tag)
+    for key, value in elem.attrib.items():
+        if not isinstance(key, str) or not isinstance(value, str) or key[:1] == '{' \
+                or '\n' in value or '\r' in value or '\t' in value:
+            raise _UnsupportedXml(key)
+        parts.append(' ' + key + '="' + _escape_xml(value) + '"')
+    text = elem.text
+    if len(elem):
+        if text:
+            raise _UnsupportedXml(tag)
+        parts.append('>\n')
+        child_indent = indent + addindent
+        for child in elem:
+            if child.tail:
+                raise _UnsupportedXml(tag)
+            _pretty_xml_parts(child, parts, child_indent, addindent)
+        parts.append(indent + '</' + tag + '>\n')
+    elif text:
+        if not isinstance(text, str) or '\r' in text:
+            raise _UnsupportedXml(tag)
+        parts.append('>' + _escape_xml(text) + '</' + tag + '>\n')
+    else:
+        parts.append('/>\n')
+
+
+def _prettify_minidom(elem):
+    """
+    Original prettify: serialize with ElementTree, re-parse with minidom and
+    pretty-print. Kept as the fallback for trees _pretty_xml_parts rejects.
+    """
+    rough_string = ElementTree.tostring(elem, 'utf-8')
+    reparsed = minidom.parseString(rough_string)
+    return reparsed.toprettyxml(indent="  ")
+
+
+def write_pretty_xml(elem, f):
+    """
+    Write the pretty-printed element (without the xml declaration) straight
+    to the file-like object f. No intermediate DOM is built.
+
+    Parameters
+    ----------
+    elem : xml.etree.ElementTree.Element
+    f : file-like object with a write method
+
+    Returns
+    ----------
+    number of characters written : int
+    """
+    parts = []
+    try:
+        _pretty_xml_parts(elem, parts, '', '  ')
+    except _UnsupportedXml:
+        xml = pretty_xml(elem)
+        f.write(xml)
+        return len(xml)
+    f.writelines(parts)
+    return sum(map(len, parts))
+
+
+def pretty_xml(elem):
+    """
+    Return the pretty-printed element without the xml declaration, i.e. what
+    "\\n".join(prettify(elem).split("\\n")[1:]) used to produce.
+
+    Parameters
+    ----------
+    elem : xml.etree.ElementTree.Element
+
+    Returns
+    ----------
+    pretified xml : str
+    """
+    parts = []
+    try:
+        _pretty_xml_parts(elem, parts, '', '  ')
+    except _UnsupportedXml:
+        return "\n".join(_prettify_minidom(elem).split("\n")[1:])
+    return ''.join(parts)
+
+
 def prettify(elem):
     """
     Return a pretty-printed XML string for the Element.
-    
+
+    The output is byte-identical to minidom's toprettyxml(indent="  ") of the
+    ElementTree serialization, without building either DOM.
+
     Parameters
     ----------
     elem : xml.etree.ElementTree.Element
-    
+
     Returns
     ----------
     pretified xml : str
     """
-    rough_string = ElementTree.tostring(elem, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    return reparsed.toprettyxml(indent="  ")
+    return '<?xml version="1.0" ?>\n' + pretty_xml(elem)
+
+
+@contextlib.contextmanager
+def atomic_open(file_name, mode='w', encoding=None, newline=None):
+    """
+    Open a buffered handle that writes to a temporary file next to
+    file_name and atomically renames it into place when the block exits
+    without an exception. A file_name that exists passes its permission
+    bits on to the new file. On an exception (or a cancel) the temporary
+    file is removed and any previous file_name is left untouched, so ROS
+    never sees a half-written file.
+
+    Parameters
+    ----------
+    file_name: str
+        final path of the file
+    mode: str
+        'w' or 'wb'
+    encoding: str
+        text encoding, platform default like open() when None
+    newline: str
+        as for open(); '' writes the line endings of the text unchanged
+
+    Yields
+    ----------
+    f: file object
+    """
+    tmp_name = '{}.{}-{}.tmp'.format(file_name, os.getpid(), threading.get_ident())
+    f = open(tmp_name, mode, buffering=WRITE_BUFFER_SIZE, encoding=encoding, newline=newline)
+    try:
+        with f:
+            yield f
+        try:
+            shutil.copymode(file_name, tmp_name)
+        except OSError:
+            pass  # a new file
+        os.replace(tmp_name, file_name)
+        metrics.record_file(file_name)
+    except BaseException:
+        try:
+            os.remove(tmp_name)
+        except OSError:
+            pass
+        raise
 
 
 def copy_package(save_dir, package_dir):
@@ -211,23 +547,32 @@ def copy_package(save_dir, package_dir):
         print(f"Error copying package: {e}")
 
 
+def _rewrite_lines(file_name, replace):
+    # replace(line) -> line; fileinput(inplace=True) would swap sys.stdout
+    # for the whole process, which is not safe next to other writer threads
+    with open(file_name) as f:
+        lines = f.readlines()
+    with atomic_open(file_name) as f:
+        f.writelines(replace(line) for line in lines)
+
+
 def update_cmakelists(save_dir, package_name):
     file_name = save_dir + '/CMakeLists.txt'
 
-    for line in fileinput.input(file_name, inplace=True):
+    def replace(line):
         if 'project(fusion2urdf)' in line:
-            sys.stdout.write("project(" + package_name + ")\n")
-        else:
-            sys.stdout.write(line)
+            return "project(" + package_name + ")\n"
+        return line
+    _rewrite_lines(file_name, replace)
 
 
 def update_package_xml(save_dir, package_name):
     file_name = save_dir + '/package.xml'
 
-    for line in fileinput.input(file_name, inplace=True):
+    def replace(line):
         if '<name>' in line:
-            sys.stdout.write("  <name>" + package_name + "</name>\n")
+            return "  <name>" + package_name + "</name>\n"
         elif '<description>' in line:
-            sys.stdout.write("<description>The " + package_name + " package</description>\n")
-        else:
-            sys.stdout.write(line)
+            return "<description>The " + package_name + " package</description>\n"
+        return line
+    _rewrite_lines(file_name, replace)
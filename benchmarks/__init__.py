@@ -0,0 +1,10 @@
+"""
+Offline benchmarks for the URDF exporter.
+
+The exporter normally only runs inside Fusion 360. The modules in this package
+provide a pure-Python stand-in for the parts of ``adsk`` the exporter touches
+(``fake_adsk``), a synthetic robot generator (``synthetic``) and benchmark entry
+points, e.g.
+
+    python -m benchmarks.bench_export --sizes 10 100 1000 10000
+"""
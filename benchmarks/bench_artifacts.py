@@ -0,0 +1,77 @@
+"""
+Benchmark the parallel artifact stage (Write.write_artifacts) against the
+serial path.
+
+    python -m benchmarks.bench_artifacts --links 1000 --workers 1 2 4 8
+
+Resolves the model of a synthetic robot once, then writes the URDF, xacro,
+launch and yaml files and copies the package template with each number
+of threads into its own directory. The files of every run are checked to
+match those of the serial run before anything is reported. Rendering is
+pure Python and holds the GIL; what overlaps is the file I/O (the template
+copy, the writes and the renames into place), so the gain is bounded by
+write_urdf, the largest writer, and is larger on slow or scanned disks.
+"""
+
+import argparse
+import filecmp
+import os
+import shutil
+import tempfile
+
+from . import harness, synthetic
+
+
+def _same_tree(a, b):
+    comparison = filecmp.dircmp(a, b)
+    if comparison.left_only or comparison.right_only or comparison.diff_files or comparison.funny_files:
+        return False
+    return all(_same_tree(os.path.join(a, d), os.path.join(b, d)) for d in comparison.common_dirs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--links', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=5, help='best of this many runs')
+    parser.add_argument('--topology', choices=('chain', 'tree'), default='tree')
+    args = parser.parse_args(argv)
+
+    harness.load_exporter()
+    from URDF_Exporter.core import Joint, Link, Kinematics, Model, Snapshot, Write
+
+    design = synthetic.make_robot(args.links, topology=args.topology)
+    snapshot = Snapshot.take_snapshot(design.rootComponent)
+    joints_dict, _ = Joint.make_joints_dict(snapshot, '')
+    tree = Kinematics.KinematicTree.from_joints(joints_dict)
+    inertial_dict, _ = Link.make_inertial_dict(snapshot, '', tree.order)
+    package_name = 'robot_description'
+    package_dir = os.path.join(harness.REPO_ROOT, 'URDF_Exporter', 'package') + '/'
+    model = Model.make_model(joints_dict, inertial_dict, package_name, tree)
+
+    work = tempfile.mkdtemp(prefix='bench_artifacts_')
+    try:
+        rows, serial, writers = [], None, 0
+        for workers in args.workers:
+            save_dir = os.path.join(work, str(workers))
+
+            def write():
+                shutil.rmtree(save_dir, ignore_errors=True)
+                os.makedirs(save_dir)
+                return Write.write_artifacts(model, package_name, 'robot', save_dir, package_dir, workers)
+
+            seconds = harness.best_of(write, args.repeat)
+            writers = len(write())
+            if serial is None:
+                serial = (seconds, save_dir)
+            elif not _same_tree(serial[1], save_dir):
+                raise RuntimeError('{} threads wrote other files than the serial path'.format(workers))
+            rows.append((workers, '{:.4f}'.format(seconds), '{:.2f}x'.format(serial[0] / seconds)))
+        print('{} links ({}), {} artifact writers'.format(args.links, args.topology, writers))
+        harness.print_table(('threads', 'seconds', 'speedup'), rows)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+End-to-end export benchmark against the fake ``adsk`` modules.
+
+Drives every stage of ``URDF_Exporter.run()`` on synthetic robots and reports
+wall time and allocations per stage:
+
+    python -m benchmarks.bench_export
+    python -m benchmarks.bench_export --sizes 100 1000 --topology tree --no-alloc
+    python -m benchmarks.bench_export --sizes 1000 --run
+
+``--run`` additionally times the complete ``run()`` entry point, the way the
+Fusion script runner calls it.
+"""
+
+import argparse
+import shutil
+import tempfile
+import os
+
+from . import fake_adsk, harness, synthetic
+
+SUCCESS_MSG = 'Successfully create URDF file'
+
+
+def export_stages(design, save_dir, trace_alloc=True, mesh_mode='direct', primitives_error=None,
+                  spheres=0, mesh_format='stl', mesh_refinement='low', mass_accuracy='final',
+                  inertia_engine='fusion'):
+    """
+    Run the exporter stages of ``run()`` one by one on ``design``.
+
+    ``mesh_mode`` is ``ExportOptions.mesh_export_mode``: ``'direct'`` exports
+    from the original occurrences, ``'copy'`` times copy_occs, export_stl and
+    delete_copied_components separately. With ``primitives_error`` collision
+    primitives are fitted and kept up to that volume error, ``spheres`` > 0
+    times the sphere approximation with that many spheres per link and
+    ``mesh_format`` ``'obj'``/``'glb'`` the conversion of the meshes;
+    ``mesh_refinement`` is passed to the mesh export (budget 500k triangles)
+    and ``mass_accuracy`` to the snapshot. ``inertia_engine`` ``'mesh'``
+    times the inertials from the exported meshes instead of Fusion's.
+
+    Returns
+    ----------
+    results: [harness.StageResult]
+    """
+    from URDF_Exporter.core import Joint, Link, Kinematics, Model, Write, Snapshot
+    from URDF_Exporter.utils import utils, mesh, inertia
+
+    root = design.rootComponent
+    robot_name = root.name.split()[0]
+    package_name = robot_name + '_description'
+    package_dir = os.path.join(harness.REPO_ROOT, 'URDF_Exporter', 'package') + '/'
+    os.makedirs(save_dir, exist_ok=True)
+
+    results = []
+    state = {}
+
+    def stage(name, fn):
+        r = harness.measure(name, fn, trace_alloc)
+        results.append(r)
+        return r.value
+
+    snapshot = stage('take_snapshot', lambda: Snapshot.take_snapshot(root, mass_accuracy))
+    state['joints_dict'], _ = stage('make_joints_dict', lambda: Joint.make_joints_dict(snapshot, SUCCESS_MSG))
+    link_names = Kinematics.KinematicTree.from_joints(state['joints_dict']).order
+    if inertia_engine == 'fusion':
+        state['inertial_dict'], _ = stage('make_inertial_dict',
+                                          lambda: Link.make_inertial_dict(snapshot, SUCCESS_MSG, link_names))
+    stage('copy_package', lambda: (utils.copy_package(save_dir, package_dir),
+                                   utils.update_cmakelists(save_dir, package_name),
+                                   utils.update_package_xml(save_dir, package_name)))
+    if mesh_mode == 'direct':
+        stage('export_stl_direct', lambda: utils.export_stl_direct(design, save_dir, snapshot, None, 'stl',
+                                                                   mesh_refinement, 500000))
+    else:
+        copied_info = stage('copy_occs', lambda: utils.copy_occs(root, snapshot))
+        stage('export_stl', lambda: utils.export_stl(design, save_dir, design.allComponents, None, 'stl',
+                                                     mesh_refinement, 500000))
+        stage('delete_copied_components', lambda: utils.delete_copied_components(root, copied_info))
+
+    meshes_dir = os.path.join(save_dir, 'meshes')
+    if inertia_engine == 'mesh':
+        state['inertial_dict'] = stage('make_mesh_inertial_dict',
+                                       lambda: inertia.make_mesh_inertial_dict(meshes_dir, link_names))
+    collision_dir = mesh.COLLISION_DIR if mesh.available() else None
+    primitives = {}
+    if primitives_error is not None and mesh.available():
+        primitives, _ = stage('fit_collision_primitives', lambda: mesh.fit_collision_primitives(
+            meshes_dir, link_names, primitives_error))
+    if collision_dir:
+        stage('decimate_collision', lambda: mesh.decimate_collision_meshes(
+            meshes_dir, 1000, [n for n in link_names if n not in primitives], mesh_format))
+
+    if spheres and mesh.available():
+        offsets = {'base_link': (0.0, 0.0, 0.0)}
+        for j in state['joints_dict'].values():
+            offsets.setdefault(j['child'], j['xyz'])
+        stage('fit_collision_spheres', lambda: Write.write_collision_spheres(
+            package_name, robot_name, save_dir,
+            mesh.fit_collision_spheres(meshes_dir, link_names, spheres, offsets)))
+
+    if mesh_format != 'stl':
+        stage('convert_meshes', lambda: mesh.convert_meshes(meshes_dir, link_names, mesh_format))
+
+    model = stage('make_model', lambda: Model.make_model(state['joints_dict'], state['inertial_dict'], package_name,
+                                                         collision_dir=collision_dir,
+                                                         collision_primitives=primitives, mesh_format=mesh_format))
+    common = (package_name, robot_name, save_dir)
+    stage('write_urdf', lambda: Write.write_urdf(model, *common))
+    stage('write_materials_xacro', lambda: Write.write_materials_xacro(*common))
+    stage('write_transmissions_xacro', lambda: Write.write_transmissions_xacro(model, *common))
+    stage('write_gazebo_xacro', lambda: Write.write_gazebo_xacro(model, *common))
+    stage('write_display_launch', lambda: Write.write_display_launch(*common))
+    stage('write_gazebo_launch', lambda: Write.write_gazebo_launch(*common))
+    stage('write_control_launch', lambda: Write.write_control_launch(*common, model))
+    stage('write_yaml', lambda: Write.write_yaml(*common, model))
+    return results
+
+
+def run_entry_point(exporter, design, base_dir, trace_alloc=True):
+    """Time ``exporter.run()`` end to end with ``design`` as the active product."""
+    app = fake_adsk.activate(design, folder=base_dir)
+    result = harness.measure('run()', lambda: exporter.run(None), trace_alloc)
+    messages = app.userInterface.messages
+    if not messages or not messages[-1][1].startswith('URDF export complete'):
+        raise RuntimeError('run() did not complete: {}'.format(messages[-1:] or 'no message'))
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help='link counts to benchmark')
+    parser.add_argument('--topology', choices=('chain', 'tree'), default='chain')
+    parser.add_argument('--bodies', type=int, default=1, help='bodies per link')
+    parser.add_argument('--sub-parts', type=int, default=0, help='nested occurrences per link')
+    parser.add_argument('--no-alloc', action='store_true',
+                        help='skip tracemalloc; wall times are then undistorted')
+    parser.add_argument('--mesh-mode', choices=('direct', 'copy'), default='direct',
+                        help='mesh export path of the stage breakdown')
+    parser.add_argument('--primitives', type=float, metavar='ERROR',
+                        help='fit collision primitives, keeping fits up to this volume error')
+    parser.add_argument('--spheres', type=int, default=0, help='collision spheres per link')
+    parser.add_argument('--mesh-format', choices=('stl', 'obj', 'glb'), default='stl')
+    parser.add_argument('--refinement', choices=('low', 'medium', 'high', 'adaptive'), default='low')
+    parser.add_argument('--mass-accuracy', choices=('draft', 'normal', 'final'), default='final')
+    parser.add_argument('--inertia-engine', choices=('fusion', 'mesh'), default='fusion')
+    parser.add_argument('--run', action='store_true', help='also time the full run() entry point')
+    parser.add_argument('--keep', metavar='DIR', help='write packages under DIR and keep them')
+    args = parser.parse_args(argv)
+
+    exporter = harness.load_exporter()
+    trace_alloc = not args.no_alloc
+    work = args.keep or tempfile.mkdtemp(prefix='urdf_bench_')
+    try:
+        for n in args.sizes:
+            design = synthetic.make_robot(n, bodies_per_link=args.bodies, topology=args.topology,
+                                          sub_parts=args.sub_parts)
+            results = export_stages(design, os.path.join(work, 'stages_{}'.format(n), 'Robot_description'),
+                                    trace_alloc, args.mesh_mode, args.primitives, args.spheres,
+                                    args.mesh_format, args.refinement, args.mass_accuracy,
+                                    args.inertia_engine)
+            if args.run:
+                design = synthetic.make_robot(n, bodies_per_link=args.bodies, topology=args.topology,
+                                              sub_parts=args.sub_parts)
+                run_dir = os.path.join(work, 'run_{}'.format(n))
+                os.makedirs(run_dir, exist_ok=True)
+                results.append(run_entry_point(exporter, design, run_dir, trace_alloc))
+
+            print('{} links ({} topology, {} bodies/link, {} mesh export)'
+                  .format(n, args.topology, args.bodies, args.mesh_mode))
+            rows = [(r.name, '{:.4f}'.format(r.seconds),
+                     harness.format_bytes(r.peak_bytes) if trace_alloc else '-',
+                     harness.format_bytes(r.net_bytes) if trace_alloc else '-')
+                    for r in results]
+            stage_total = sum(r.seconds for r in results if r.name != 'run()')
+            rows.append(('total (stages)', '{:.4f}'.format(stage_total), '', ''))
+            harness.print_table(('stage', 'seconds', 'peak alloc', 'retained'), rows)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark mimic resolution from joint names (utils/mimic.py) against the
+per-follower scan it replaces.
+
+    python -m benchmarks.bench_mimic --joints 500 5000
+
+The synthetic name sets look like a hand: every finger has a driven joint
+and a chain of followers ("j_3_2-Link-J_3_1:0.8" follows j_3_1, whose
+name is spelled in another case so the case-insensitive lookup is taken),
+and every finger's last follower points back at the first one of the
+next finger to add cycles. The direct leaders of both implementations are
+checked to agree before anything is reported.
+"""
+
+import argparse
+import re
+
+from . import harness
+
+
+def make_joints(n_joints, chain=4, cycle_every=50):
+    """joints_dict of n_joints revolute joints named like a hand model."""
+    names = []
+    for i in range(n_joints):
+        finger, k = divmod(i, chain)
+        if k == 0:
+            name = 'j_{}_0'.format(finger)
+        else:
+            name = 'j_{}_{}-Link-J_{}_{}:0.8:0.01'.format(finger, k, finger, k - 1)
+        if k == 0 and finger % cycle_every == 1:
+            # the driven joint of this finger follows its own last follower
+            name = 'j_{}_0-Link-j_{}_{}:1'.format(finger, finger, chain - 1)
+        names.append(name)
+    return {name: {'type': 'revolute', 'mimic': None} for name in names}
+
+
+def legacy_annotate(joints_dict):
+    # _annotate_mimics_from_names as it was nested in run(), without logging
+    def _base_name(name):
+        return name.split('-Link-')[0]
+    base_to_key = {}
+    for k in joints_dict.keys():
+        base_to_key[_base_name(k)] = k
+    patt = re.compile(r'^(?P<base>.+?)-Link-(?P<leader>[^:]+):(?P<mult>[+-]?(?:\d+\.\d*|\d*\.\d+|\d+)(?:[eE][+-]?\d+)?)(?::(?P<offset>[+-]?(?:\d+\.\d*|\d*\.\d+|\d+)(?:[eE][+-]?\d+)?))?$', re.UNICODE)
+    leaders = {}
+    for j in list(joints_dict.keys()):
+        m = patt.match(j)
+        joints_dict[j]['output_name'] = _base_name(j)
+        if not m:
+            continue
+        leader_raw = m.group('leader')
+        leader_key = None
+        if leader_raw in joints_dict:
+            leader_key = leader_raw
+        elif leader_raw in base_to_key:
+            leader_key = base_to_key[leader_raw]
+        else:
+            for k in joints_dict.keys():
+                if _base_name(k).lower() == leader_raw.lower():
+                    leader_key = k
+                    break
+        if leader_key:
+            leaders[j] = leader_key
+    return leaders
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--joints', type=int, nargs='+', default=[500, 5000])
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args(argv)
+
+    harness.load_exporter()
+    from URDF_Exporter.utils import mimic
+
+    rows = []
+    for n in args.joints:
+        joints_dict = make_joints(n)
+        legacy = legacy_annotate(make_joints(n))
+        index = mimic.NameIndex(joints_dict)
+        direct = {name: index.find(mimic.parse_name(name)[0]) for name in legacy}
+        if direct != legacy:
+            raise RuntimeError('the indexed lookup finds other leaders')
+        report = mimic.annotate_mimics_from_names(make_joints(n))
+        chained = sum(1 for a in report.annotated if a[4])
+
+        legacy_t = harness.best_of(lambda: legacy_annotate(make_joints(n)), args.repeat)
+        indexed_t = harness.best_of(lambda: mimic.annotate_mimics_from_names(make_joints(n)), args.repeat)
+        build_t = harness.best_of(lambda: make_joints(n), args.repeat)
+        legacy_t, indexed_t = legacy_t - build_t, indexed_t - build_t
+        rows.append((n, len(report.annotated), chained, len(report.cycles),
+                     '{:.4f}'.format(legacy_t), '{:.4f}'.format(indexed_t),
+                     '{:.0f}x'.format(legacy_t / indexed_t)))
+    harness.print_table(('joints', 'followers', 'flattened', 'cycles', 'linear scan s', 'indexed s', 'speedup'),
+                        rows)
+
+
+if __name__ == '__main__':
+    main()
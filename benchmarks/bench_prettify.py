@@ -0,0 +1,138 @@
+"""
+Benchmark the streaming XML serializer in utils against the original
+ElementTree -> minidom -> toprettyxml round trip.
+
+    python -m benchmarks.bench_prettify --elements 20000
+
+Every element is checked to serialize byte-identically on both paths before
+anything is timed.
+"""
+
+import argparse
+import io
+from xml.etree.ElementTree import Element, SubElement
+
+from . import harness
+
+
+def _link(i):
+    link = Element('link')
+    link.attrib = {'name': 'link_{}_1'.format(i)}
+    inertial = SubElement(link, 'inertial')
+    SubElement(inertial, 'origin').attrib = {'xyz': '0.0125 -0.0031 {}'.format(i * 1e-4), 'rpy': '0 0 0'}
+    SubElement(inertial, 'mass').attrib = {'value': str(0.5 + i * 1e-3)}
+    SubElement(inertial, 'inertia').attrib = {'ixx': '1e-05', 'iyy': '2e-05', 'izz': '3e-05',
+                                              'ixy': '0.0', 'iyz': '-0.0', 'ixz': '0.0'}
+    for tag in ('visual', 'collision'):
+        part = SubElement(link, tag)
+        SubElement(part, 'origin').attrib = {'xyz': '-0.05 0.03 -0.005', 'rpy': '0 0 0'}
+        geometry = SubElement(part, 'geometry')
+        SubElement(geometry, 'mesh').attrib = {
+            'filename': 'package://Robot_description/meshes/link_{}_1.stl'.format(i),
+            'scale': '0.001 0.001 0.001'}
+        if tag == 'visual':
+            SubElement(part, 'material').attrib = {'name': 'silver'}
+    return link
+
+
+def _joint(i):
+    joint = Element('joint')
+    joint.attrib = {'name': 'Rev{}'.format(i), 'type': 'revolute'}
+    SubElement(joint, 'origin').attrib = {'xyz': '0.05 0.0 0.005', 'rpy': '0 0 0'}
+    SubElement(joint, 'parent').attrib = {'link': 'link_{}_1'.format(i - 1)}
+    SubElement(joint, 'child').attrib = {'link': 'link_{}_1'.format(i)}
+    SubElement(joint, 'axis').attrib = {'xyz': '0.0 0.0 1.0'}
+    SubElement(joint, 'limit').attrib = {'upper': '1.57', 'lower': '-1.57', 'effort': '100', 'velocity': '100'}
+    if i % 5 == 0:
+        SubElement(joint, 'mimic').attrib = {'joint': 'Rev{}'.format(i - 1), 'multiplier': '-1.0', 'offset': '0.0'}
+    return joint
+
+
+def _transmission(i):
+    tran = Element('transmission')
+    tran.attrib = {'name': 'Rev{}_tran'.format(i)}
+    SubElement(tran, 'type').text = 'transmission_interface/SimpleTransmission'
+    joint = SubElement(tran, 'joint')
+    joint.attrib = {'name': 'Rev{}'.format(i)}
+    SubElement(joint, 'hardwareInterface').text = 'hardware_interface/EffortJointInterface'
+    actuator = SubElement(tran, 'actuator')
+    actuator.attrib = {'name': 'Rev{}_actr'.format(i)}
+    SubElement(actuator, 'hardwareInterface').text = 'hardware_interface/EffortJointInterface'
+    SubElement(actuator, 'mechanicalReduction').text = '1'
+    return tran
+
+
+def _edge_cases():
+    """Trees exercising escaping and the minidom fallback."""
+    quoted = Element('node')
+    quoted.attrib = {'args': 'a & b < c > "d"', 'name': "it's"}
+    SubElement(quoted, 'remap').text = 'x & "y" <z>'
+    empty_text = Element('param')
+    empty_text.text = ''
+    mixed = Element('launch')
+    mixed.text = '\n  '
+    SubElement(mixed, 'arg').tail = 'tail'
+    newline_attr = Element('param')
+    newline_attr.attrib = {'value': 'a\nb\tc'}
+    return [quoted, empty_text, mixed, newline_attr]
+
+
+class _NullStream:
+    """Write sink that only counts, so timings exclude output buffering."""
+
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, data):
+        self.chars += len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.chars += len(line)
+
+
+def sample_elements(n):
+    makers = (_link, _joint, _transmission)
+    return [makers[i % 3](i + 1) for i in range(n)] + _edge_cases()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--elements', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    harness.load_exporter()
+    from URDF_Exporter.utils import utils
+
+    elements = sample_elements(args.elements)
+
+    def minidom_path(out):
+        for e in elements:
+            out.write("\n".join(utils._prettify_minidom(e).split("\n")[1:]))
+
+    def streaming_path(out):
+        for e in elements:
+            utils.write_pretty_xml(e, out)
+
+    old, new = io.StringIO(), io.StringIO()
+    minidom_path(old)
+    streaming_path(new)
+    mismatched = [i for i, e in enumerate(elements) if utils.prettify(e) != utils._prettify_minidom(e)]
+    if mismatched or old.getvalue() != new.getvalue():
+        raise SystemExit('serializers disagree on elements {}'.format(sorted(set(mismatched))[:10]))
+
+    rows = []
+    for name, fn in (('minidom round trip', minidom_path), ('streaming', streaming_path)):
+        seconds = harness.best_of(lambda: fn(_NullStream()), args.repeat)
+        alloc = harness.measure(name, lambda: fn(_NullStream()))
+        rows.append((name, '{:.4f}'.format(seconds), '{:.1f}'.format(seconds / len(elements) * 1e6),
+                     harness.format_bytes(alloc.peak_bytes)))
+    base = float(rows[0][1])
+    rows = [r + ('{:.1f}x'.format(base / float(r[1])),) for r in rows]
+    print('{} elements, output byte-identical'.format(len(elements)))
+    harness.print_table(('path', 'seconds', 'us/element', 'peak alloc', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark the batched transform engine (utils/transforms.py) against the
+per-joint pure-Python path it replaces.
+
+    python -m benchmarks.bench_transforms --joints 10000
+
+Times, on a synthetic robot with rotated links, the joint world origins of
+both occurrences of every joint, the 'occurrence' link frames (parent ->
+child transforms with rpy) and make_joints_dict as a whole, each with
+numpy and with the fallback Fusion's bundled Python gets. The results of
+the paths are checked to agree before anything is reported.
+"""
+
+import argparse
+
+from . import harness, synthetic
+
+
+def _transform_point(m, p):
+    # the per-joint helper make_joints_dict used before the batched engine
+    ex = [m[0], m[4], m[8]]
+    ey = [m[1], m[5], m[9]]
+    ez = [m[2], m[6], m[10]]
+    oo = [m[3], m[7], m[11]]
+    return [p[0]*ex[i] + p[1]*ey[i] + p[2]*ez[i] + oo[i] for i in range(3)]
+
+
+def _legacy_origins(snapshot):
+    occurrences = snapshot.occurrences
+    return {j.name: (_transform_point(occurrences[j.occurrence_one].transform, j.origin_one),
+                     _transform_point(occurrences[j.occurrence_two].transform, j.origin_two))
+            for j in snapshot.joints}
+
+
+def _max_difference(a, b):
+    return max(abs(x - y) for k in a for p, q in zip(a[k], b[k]) for x, y in zip(p, q))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--joints', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args(argv)
+
+    harness.load_exporter()
+    from URDF_Exporter.core import Joint, Snapshot
+    from URDF_Exporter.utils import transforms
+    numpy = transforms.np
+    if numpy is None:
+        parser.error('numpy is required to compare against the fallback')
+
+    def best(fn):
+        results = [harness.measure('', fn, trace_alloc=False) for _ in range(args.repeat)]
+        return min(r.seconds for r in results), results[0].value
+
+    def fallback(fn):
+        transforms.np = None
+        try:
+            return best(fn)
+        finally:
+            transforms.np = numpy
+
+    for n in args.joints:
+        design = synthetic.make_robot(n + 1, topology='tree', rotated=True, joint_origins=True)
+        snapshot = Snapshot.take_snapshot(design.rootComponent)
+        joints_dict, _ = Joint.make_joints_dict(snapshot, '')
+
+        legacy_t, legacy = best(lambda: _legacy_origins(snapshot))
+        batch_t, batch = best(lambda: transforms.joint_world_origins(snapshot))
+        plain_t, plain = fallback(lambda: transforms.joint_world_origins(snapshot))
+        origins_error = max(_max_difference(legacy, batch), _max_difference(legacy, plain))
+
+        frames_t, frames = best(lambda: transforms.resolve_frames(snapshot, joints_dict))
+        frames_plain_t, frames_plain = fallback(lambda: transforms.resolve_frames(snapshot, joints_dict))
+        if frames.joints != frames_plain.joints:
+            raise RuntimeError('batched and fallback link frames differ')
+
+        joints_t, _ = best(lambda: Joint.make_joints_dict(snapshot, ''))
+        joints_plain_t, _ = fallback(lambda: Joint.make_joints_dict(snapshot, ''))
+
+        print('{} joints (tree, rotated links); origins agree within {:.1e} cm'.format(n, origins_error))
+        rows = [('joint world origins', '{:.4f}'.format(legacy_t), '{:.4f}'.format(plain_t),
+                 '{:.4f}'.format(batch_t), '{:.1f}x'.format(legacy_t / batch_t)),
+                ('occurrence link frames', '-', '{:.4f}'.format(frames_plain_t),
+                 '{:.4f}'.format(frames_t), '{:.1f}x'.format(frames_plain_t / frames_t)),
+                ('make_joints_dict', '-', '{:.4f}'.format(joints_plain_t),
+                 '{:.4f}'.format(joints_t), '{:.1f}x'.format(joints_plain_t / joints_t))]
+        harness.print_table(('stage', 'per-joint loop', 'fallback', 'numpy', 'speedup'), rows)
+
+
+if __name__ == '__main__':
+    main()
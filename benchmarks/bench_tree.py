@@ -0,0 +1,87 @@
+"""
+Benchmark the kinematic tree (core/Kinematics.py) on large joint graphs.
+
+    python -m benchmarks.bench_tree --links 1000 10000 100000
+
+Builds random trees (every link hangs off an earlier one, the joints are
+listed in shuffled design order and a few loop closures are added), then
+times orienting the undirected joints as make_joints_dict does, building
+the tree of an oriented joints_dict as run() does, and resolving the model
+(Model.make_model) and writing its <joint> elements. The work per link is constant; what growth remains in
+the time per link at 100k links is cache misses on the larger dicts.
+"""
+
+import argparse
+import io
+import random
+
+from . import harness
+
+
+def make_edges(n_links, loops, seed=0):
+    """Undirected joints [(name, link, link)] of a random tree plus loop closures."""
+    rng = random.Random(seed)
+    names = ['base_link'] + ['link_{}'.format(i) for i in range(1, n_links)]
+    edges = []
+    for i in range(1, n_links):
+        pair = [names[rng.randrange(i)], names[i]]
+        rng.shuffle(pair)
+        edges.append(('joint_{}'.format(i), pair[0], pair[1]))
+    for i in range(loops):
+        a, b = rng.sample(names, 2)
+        edges.append(('loop_{}'.format(i), a, b))
+    rng.shuffle(edges)
+    return edges
+
+
+def make_joints_dict(tree, edges):
+    """Oriented joints_dict of tree, loop closures last (like make_joints_dict)."""
+    joints_dict = {}
+    for link in tree.order[1:]:
+        joints_dict[tree.joint[link]] = {
+            'type': 'revolute', 'axis': [0, 0, 1], 'upper_limit': 1.0, 'lower_limit': -1.0,
+            'parent': tree.parent[link], 'child': link, 'xyz': [0.01 * tree.depth[link], 0.0, 0.0]}
+    for name, a, b in edges:
+        if name not in joints_dict:
+            joints_dict[name] = {
+                'type': 'revolute', 'axis': [0, 0, 1], 'upper_limit': 1.0, 'lower_limit': -1.0,
+                'parent': a, 'child': b, 'xyz': [0.0, 0.0, 0.0]}
+    return joints_dict
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--links', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--loops', type=int, default=10, help='loop-closure joints added to each tree')
+    parser.add_argument('--repeat', type=int, default=3, help='best of this many runs')
+    args = parser.parse_args(argv)
+
+    harness.load_exporter()
+    from URDF_Exporter.core import Kinematics, Model, Write
+
+    rows = []
+    for n in args.links:
+        edges = make_edges(n, args.loops)
+        tree = Kinematics.KinematicTree.from_edges(edges)
+        if len(tree) != n or len(tree.loop_joints) != args.loops or tree.disconnected:
+            raise RuntimeError('the tree of {} links was not recovered'.format(n))
+        joints_dict = make_joints_dict(tree, edges)
+        oriented = Kinematics.KinematicTree.from_joints(joints_dict)
+        if oriented.order != tree.order:
+            raise RuntimeError('the oriented tree differs')
+
+        orient_t = harness.best_of(lambda: Kinematics.KinematicTree.from_edges(edges), args.repeat)
+        joints_t = harness.best_of(lambda: Kinematics.KinematicTree.from_joints(joints_dict), args.repeat)
+        inertial_dict = {link: {'mass': 1.0, 'center_of_mass': [0.0, 0.0, 0.0], 'inertia': [1e-3] * 3 + [0.0] * 3}
+                         for link in tree.order}
+        write_t = harness.best_of(lambda: Write.write_joint_urdf(
+            Model.make_model(joints_dict, inertial_dict, 'robot_description', oriented), io.StringIO()), args.repeat)
+        rows.append((n, max(tree.depth.values()),
+                     '{:.4f}'.format(orient_t), '{:.4f}'.format(joints_t), '{:.4f}'.format(write_t),
+                     '{:.2f}'.format(1e6 * (orient_t + joints_t) / n)))
+    harness.print_table(('links', 'max depth', 'from_edges s', 'from_joints s', 'model + <joint> s',
+                         'tree us/link'), rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,706 @@
+"""
+Pure-Python stand-in for the parts of the Fusion 360 API (``adsk.core`` and
+``adsk.fusion``) that the exporter touches.
+
+Call ``install()`` before importing anything from ``URDF_Exporter``; it
+registers ``adsk``, ``adsk.core`` and ``adsk.fusion`` in ``sys.modules``.
+Geometry is held as plain triangle lists so mass properties, bounding boxes
+and binary STL export are all derived from the same data.
+
+Units follow Fusion: lengths in cm, mass in kg, inertia in kg*cm^2. Exported
+STL files are written in mm, like Fusion does for the exporter's meshes.
+"""
+
+import math
+import struct
+import sys
+import types
+
+
+# --------------------
+# linear algebra helpers (row-major 4x4 as a flat list of 16, like asArray())
+
+def _identity():
+    return [1.0, 0.0, 0.0, 0.0,
+            0.0, 1.0, 0.0, 0.0,
+            0.0, 0.0, 1.0, 0.0,
+            0.0, 0.0, 0.0, 1.0]
+
+
+def _matmul(a, b):
+    out = [0.0] * 16
+    for r in range(4):
+        for c in range(4):
+            out[4*r + c] = sum(a[4*r + k] * b[4*k + c] for k in range(4))
+    return out
+
+
+def _apply(m, p):
+    x, y, z = p
+    return (m[0]*x + m[1]*y + m[2]*z + m[3],
+            m[4]*x + m[5]*y + m[6]*z + m[7],
+            m[8]*x + m[9]*y + m[10]*z + m[11])
+
+
+def _invert_rigid(m):
+    # transpose the rotation and rotate the translation back
+    r = [m[0], m[4], m[8],
+         m[1], m[5], m[9],
+         m[2], m[6], m[10]]
+    t = (m[3], m[7], m[11])
+    inv = [r[0], r[1], r[2], -(r[0]*t[0] + r[1]*t[1] + r[2]*t[2]),
+           r[3], r[4], r[5], -(r[3]*t[0] + r[4]*t[1] + r[5]*t[2]),
+           r[6], r[7], r[8], -(r[6]*t[0] + r[7]*t[1] + r[8]*t[2]),
+           0.0, 0.0, 0.0, 1.0]
+    return inv
+
+
+def rotation_z(angle, translation=(0.0, 0.0, 0.0)):
+    """Return a flat 4x4 matrix rotating by ``angle`` about z, then translating."""
+    c, s = math.cos(angle), math.sin(angle)
+    return [c, -s, 0.0, translation[0],
+            s, c, 0.0, translation[1],
+            0.0, 0.0, 1.0, translation[2],
+            0.0, 0.0, 0.0, 1.0]
+
+
+def rotation_x(angle, translation=(0.0, 0.0, 0.0)):
+    """Return a flat 4x4 matrix rotating by ``angle`` about x, then translating."""
+    c, s = math.cos(angle), math.sin(angle)
+    return [1.0, 0.0, 0.0, translation[0],
+            0.0, c, -s, translation[1],
+            0.0, s, c, translation[2],
+            0.0, 0.0, 0.0, 1.0]
+
+
+def _mass_properties(triangles, density):
+    """
+    Integrate a closed triangle mesh with signed tetrahedra.
+
+    Returns
+    ----------
+    (mass, center_of_mass, moments about the origin [xx, yy, zz, xy, yz, xz],
+     area, volume)
+    """
+    vol = 0.0
+    area = 0.0
+    cx = cy = cz = 0.0
+    sxx = syy = szz = sxy = syz = sxz = 0.0
+    for a, b, c in triangles:
+        det = (a[0]*(b[1]*c[2] - b[2]*c[1])
+               - a[1]*(b[0]*c[2] - b[2]*c[0])
+               + a[2]*(b[0]*c[1] - b[1]*c[0]))
+        vol += det / 6.0
+        sx, sy, sz = a[0]+b[0]+c[0], a[1]+b[1]+c[1], a[2]+b[2]+c[2]
+        cx += det * sx / 24.0
+        cy += det * sy / 24.0
+        cz += det * sz / 24.0
+        k = det / 120.0
+        sxx += k * (a[0]*a[0] + b[0]*b[0] + c[0]*c[0] + sx*sx)
+        syy += k * (a[1]*a[1] + b[1]*b[1] + c[1]*c[1] + sy*sy)
+        szz += k * (a[2]*a[2] + b[2]*b[2] + c[2]*c[2] + sz*sz)
+        sxy += k * (a[0]*a[1] + b[0]*b[1] + c[0]*c[1] + sx*sy)
+        syz += k * (a[1]*a[2] + b[1]*b[2] + c[1]*c[2] + sy*sz)
+        sxz += k * (a[0]*a[2] + b[0]*b[2] + c[0]*c[2] + sx*sz)
+        ux, uy, uz = b[0]-a[0], b[1]-a[1], b[2]-a[2]
+        vx, vy, vz = c[0]-a[0], c[1]-a[1], c[2]-a[2]
+        area += 0.5 * math.sqrt((uy*vz - uz*vy)**2 + (uz*vx - ux*vz)**2 + (ux*vy - uy*vx)**2)
+    mass = density * vol
+    com = (cx / vol, cy / vol, cz / vol) if vol else (0.0, 0.0, 0.0)
+    # products of inertia are tensor entries (-integral of xy dm), which is
+    # the convention utils.origin2center_of_mass expects
+    moments = [density * (syy + szz), density * (sxx + szz), density * (sxx + syy),
+               -density * sxy, -density * syz, -density * sxz]
+    return mass, com, moments, area, vol
+
+
+def box_triangles(size, center=(0.0, 0.0, 0.0)):
+    """Outward-facing triangles of an axis aligned box."""
+    hx, hy, hz = size[0] / 2.0, size[1] / 2.0, size[2] / 2.0
+    cx, cy, cz = center
+    v = [(cx + sx*hx, cy + sy*hy, cz + sz*hz)
+         for sx in (-1, 1) for sy in (-1, 1) for sz in (-1, 1)]
+    # vertex index = 4*ix + 2*iy + iz
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5),  # -x, +x
+             (0, 4, 5, 1), (2, 3, 7, 6),  # -y, +y
+             (0, 2, 6, 4), (1, 5, 7, 3)]  # -z, +z
+    tris = []
+    for a, b, c, d in quads:
+        tris.append((v[a], v[b], v[c]))
+        tris.append((v[a], v[c], v[d]))
+    return tris
+
+
+def cylinder_triangles(radius, length, segments=32, center=(0.0, 0.0, 0.0)):
+    """Outward-facing triangles of a cylinder whose axis is z."""
+    cx, cy, cz = center
+    z0, z1 = cz - length / 2.0, cz + length / 2.0
+    ring = [(cx + radius*math.cos(2*math.pi*i/segments),
+             cy + radius*math.sin(2*math.pi*i/segments)) for i in range(segments)]
+    tris = []
+    for i in range(segments):
+        (x0, y0), (x1, y1) = ring[i], ring[(i + 1) % segments]
+        tris.append(((x0, y0, z0), (x1, y1, z0), (x1, y1, z1)))
+        tris.append(((x0, y0, z0), (x1, y1, z1), (x0, y0, z1)))
+        tris.append(((cx, cy, z0), (x1, y1, z0), (x0, y0, z0)))
+        tris.append(((cx, cy, z1), (x0, y0, z1), (x1, y1, z1)))
+    return tris
+
+
+# --------------------
+# adsk.core
+
+class Point3D:
+    def __init__(self, x=0.0, y=0.0, z=0.0):
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    @staticmethod
+    def create(x=0.0, y=0.0, z=0.0):
+        return Point3D(x, y, z)
+
+    def asArray(self):
+        return [self.x, self.y, self.z]
+
+
+class Vector3D(Point3D):
+    @staticmethod
+    def create(x=0.0, y=0.0, z=0.0):
+        return Vector3D(x, y, z)
+
+
+class Matrix3D:
+    def __init__(self, data=None):
+        self._data = list(data) if data is not None else _identity()
+
+    @staticmethod
+    def create():
+        return Matrix3D()
+
+    def asArray(self):
+        return list(self._data)
+
+    def setWithArray(self, data):
+        self._data = [float(_) for _ in data]
+        return True
+
+    @property
+    def translation(self):
+        return Vector3D(self._data[3], self._data[7], self._data[11])
+
+
+class DialogResults:
+    DialogOK = 0
+    DialogCancel = 1
+
+
+class ProgressDialog:
+    def __init__(self):
+        self.isBackgroundTranslucency = True
+        self.cancelButtonText = ''
+        self.message = ''
+        self.progressValue = 0
+        self.maximumValue = 0
+        self.wasCancelled = False
+        self.isShowing = False
+
+    def show(self, title, message, minimum, maximum, delay=0):
+        self.message = message
+        self.progressValue = minimum
+        self.maximumValue = maximum
+        self.isShowing = True
+        return True
+
+    def hide(self):
+        self.isShowing = False
+        return True
+
+    def setProgressValue(self, value):
+        self.progressValue = value
+        return True
+
+
+class FolderDialog:
+    def __init__(self, folder):
+        self.title = ''
+        self.folder = folder
+
+    def showDialog(self):
+        return DialogResults.DialogOK if self.folder else DialogResults.DialogCancel
+
+
+class UserInterface:
+    def __init__(self):
+        self.messages = []
+        self.folder = None
+
+    def messageBox(self, text, title='', *args):
+        self.messages.append((title, text))
+        return 0
+
+    def createProgressDialog(self):
+        return ProgressDialog()
+
+    def createFolderDialog(self):
+        return FolderDialog(self.folder)
+
+
+class Application:
+    _instance = None
+
+    def __init__(self):
+        self.userInterface = UserInterface()
+        self.activeProduct = None
+
+    @staticmethod
+    def get():
+        if Application._instance is None:
+            Application._instance = Application()
+        return Application._instance
+
+
+# --------------------
+# adsk.fusion
+
+class CalculationAccuracy:
+    LowCalculationAccuracy = 0
+    MediumCalculationAccuracy = 1
+    HighCalculationAccuracy = 2
+    VeryHighCalculationAccuracy = 3
+
+
+class MeshRefinementSettings:
+    MeshRefinementHigh = 0
+    MeshRefinementMedium = 1
+    MeshRefinementLow = 2
+    MeshRefinementCustom = 3
+
+
+class BoundingBox3D:
+    def __init__(self, min_point, max_point):
+        self.minPoint = Point3D(*min_point)
+        self.maxPoint = Point3D(*max_point)
+
+
+class PhysicalProperties:
+    # relative error of mass and moments per CalculationAccuracy, so that the
+    # accuracy tiers give (slightly) different answers like the real API
+    ACCURACY_ERROR = {0: 2e-3, 1: 5e-4, 2: 1e-4, 3: 0.0}
+
+    def __init__(self, triangles, density, accuracy):
+        mass, com, moments, area, volume = _mass_properties(triangles, density)
+        error = 1.0 + self.ACCURACY_ERROR.get(accuracy, 0.0)
+        self.accuracy = accuracy
+        self.mass = mass * error if error != 1.0 else mass
+        self.centerOfMass = Point3D(*com)
+        self.area = area
+        self.volume = volume
+        self.density = density
+        self._moments = [m * error for m in moments] if error != 1.0 else moments
+
+    def getXYZMomentsOfInertia(self):
+        return (True,) + tuple(self._moments)
+
+
+class _Collection:
+    """
+    Stand-in for the API's collection types.
+
+    Items are kept in an insertion-ordered dict so that deleting one of tens
+    of thousands of occurrences stays O(1) and the fake does not dominate
+    the timings it is used to take.
+    """
+
+    def __init__(self, items=None):
+        self._items = {}
+        self._cache = None
+        for it in items or ():
+            self._items[id(it)] = it
+
+    def _append(self, it):
+        self._items[id(it)] = it
+        self._cache = None
+
+    def _remove(self, it):
+        self._items.pop(id(it), None)
+        self._cache = None
+
+    def _list(self):
+        if self._cache is None:
+            self._cache = list(self._items.values())
+        return self._cache
+
+    def __contains__(self, it):
+        return id(it) in self._items
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        if index == len(self._items) - 1:
+            return next(reversed(self._items.values()))
+        return self._list()[index]
+
+    def __iter__(self):
+        return iter(self._list())
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        return self.item(index)
+
+
+class BRepBody:
+    def __init__(self, triangles, name='Body1', density=0.00785):
+        self.name = name
+        self.triangles = list(triangles)
+        self.density = density
+
+    def copyToComponent(self, target):
+        component = target.component if isinstance(target, Occurrence) else target
+        body = BRepBody(self.triangles, self.name, self.density)
+        component._bodies.append(body)
+        return body
+
+
+class Component:
+    def __init__(self, design, name):
+        self.design = design
+        self.name = name
+        self._bodies = []
+        self._joints = []
+        self.occurrences = Occurrences(self)
+        self._instances = 0
+        self._owner_occurrence = None
+        self._live = 0
+        self.entityToken = 'component:%d' % id(self)
+
+    @property
+    def bRepBodies(self):
+        return _Collection(self._bodies)
+
+    @property
+    def joints(self):
+        return _Collection(self._joints)
+
+    @property
+    def allOccurrences(self):
+        out = []
+        stack = list(reversed(self.occurrences._list()))
+        while stack:
+            occ = stack.pop()
+            out.append(occ)
+            stack.extend(reversed(occ.component.occurrences._list()))
+        return _Collection(out)
+
+    def _triangles(self, matrix=None):
+        """Triangles of this component and everything below it."""
+        tris = []
+        for body in self._bodies:
+            tris.extend(body.triangles if matrix is None else
+                        [tuple(_apply(matrix, p) for p in t) for t in body.triangles])
+        for occ in self.occurrences:
+            m = occ.transform.asArray() if matrix is None else _matmul(matrix, occ.transform.asArray())
+            tris.extend(occ.component._triangles(m))
+        return tris
+
+    def _density(self):
+        for body in self._bodies:
+            return body.density
+        for occ in self.occurrences:
+            return occ.component._density()
+        return 0.00785
+
+    def getPhysicalProperties(self, accuracy=CalculationAccuracy.LowCalculationAccuracy):
+        return PhysicalProperties(self._triangles(), self._density(), accuracy)
+
+    @property
+    def physicalProperties(self):
+        return self.getPhysicalProperties()
+
+    def deleteMe(self):
+        self.design._components._remove(self)
+        return True
+
+
+class Occurrence:
+    def __init__(self, parent_component, component, transform):
+        self._parent = parent_component
+        self.component = component
+        self.transform = Matrix3D(transform)
+        component._instances += 1
+        self._instance = component._instances
+        self.entityToken = 'occurrence:%d' % id(self)
+
+    @property
+    def name(self):
+        return '{}:{}'.format(self.component.name, self._instance)
+
+    @property
+    def fullPathName(self):
+        path = [self.name]
+        owner = self._parent
+        while owner is not None and owner._owner_occurrence is not None:
+            path.append(owner._owner_occurrence.name)
+            owner = owner._owner_occurrence._parent
+        return '+'.join(reversed(path))
+
+    def _world(self):
+        m = self.transform.asArray()
+        owner = self._parent._owner_occurrence
+        while owner is not None:
+            m = _matmul(owner.transform.asArray(), m)
+            owner = owner._parent._owner_occurrence
+        return m
+
+    @property
+    def childOccurrences(self):
+        return _Collection(self.component.occurrences)
+
+    @property
+    def bRepBodies(self):
+        m = self._world()
+        return _Collection([BRepBody([tuple(_apply(m, p) for p in t) for t in b.triangles], b.name, b.density)
+                            for b in self.component._bodies])
+
+    def _world_triangles(self):
+        return self.component._triangles(self._world())
+
+    def getPhysicalProperties(self, accuracy=CalculationAccuracy.LowCalculationAccuracy):
+        return PhysicalProperties(self._world_triangles(), self.component._density(), accuracy)
+
+    @property
+    def physicalProperties(self):
+        return self.getPhysicalProperties()
+
+    @property
+    def boundingBox(self):
+        pts = [p for t in self._world_triangles() for p in t]
+        if not pts:
+            return BoundingBox3D((0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+        return BoundingBox3D([min(p[i] for p in pts) for i in range(3)],
+                             [max(p[i] for p in pts) for i in range(3)])
+
+    def deleteMe(self):
+        self._parent.occurrences._remove(self)
+        self.component._live -= 1
+        if not self.component._live:
+            self.component.deleteMe()
+        return True
+
+
+class Occurrences(_Collection):
+    def __init__(self, owner):
+        super().__init__()
+        self._owner = owner
+
+    def addNewComponent(self, transform):
+        design = self._owner.design
+        component = Component(design, 'Component{}'.format(len(design._components)))
+        design._components._append(component)
+        return self._add(component, transform.asArray())
+
+    def addExistingComponent(self, component, transform):
+        return self._add(component, transform.asArray())
+
+    def _add(self, component, transform):
+        occ = Occurrence(self._owner, component, transform)
+        component._live += 1
+        # components only ever get one owner occurrence in the synthetic
+        # designs; it is what nested occurrences use to build world matrices
+        if getattr(component, '_owner_occurrence', None) is None:
+            component._owner_occurrence = occ
+        self._append(occ)
+        return occ
+
+
+class JointGeometry:
+    def __init__(self, origin):
+        self.origin = Point3D(*origin)
+
+
+class JointOrigin:
+    """Joint origin feature; unlike JointGeometry it has no ``origin``."""
+
+    def __init__(self, origin, name='Joint Origin1'):
+        self.name = name
+        self.geometry = JointGeometry(origin)
+
+
+class JointLimits:
+    def __init__(self, minimum=None, maximum=None):
+        self.isMinimumValueEnabled = minimum is not None
+        self.isMaximumValueEnabled = maximum is not None
+        self.minimumValue = minimum if minimum is not None else 0.0
+        self.maximumValue = maximum if maximum is not None else 0.0
+
+
+class JointTypes:
+    RigidJointType = 0
+    RevoluteJointType = 1
+    SliderJointType = 2
+
+
+class RigidJointMotion:
+    jointType = JointTypes.RigidJointType
+
+
+class RevoluteJointMotion:
+    jointType = JointTypes.RevoluteJointType
+
+    def __init__(self, axis, minimum=None, maximum=None):
+        self.rotationAxisVector = Vector3D(*axis)
+        self.rotationLimits = JointLimits(minimum, maximum)
+
+
+class SliderJointMotion:
+    jointType = JointTypes.SliderJointType
+
+    def __init__(self, direction, minimum=None, maximum=None):
+        self.slideDirectionVector = Vector3D(*direction)
+        self.slideLimits = JointLimits(minimum, maximum)
+
+
+class Joint:
+    def __init__(self, name, motion, occurrence_one, occurrence_two, geometry_one, geometry_two):
+        self.name = name
+        self.jointMotion = motion
+        self.occurrenceOne = occurrence_one
+        self.occurrenceTwo = occurrence_two
+        self.geometryOrOriginOne = geometry_one
+        self.geometryOrOriginTwo = geometry_two
+
+
+class STLExportOptions:
+    def __init__(self, geometry, filename):
+        self.geometry = geometry
+        self.filename = filename
+        self.sendToPrintUtility = True
+        self.isBinaryFormat = False
+        self.meshRefinement = MeshRefinementSettings.MeshRefinementMedium
+        self.surfaceDeviation = 0.0
+        self.normalDeviation = 0.0
+        self.maximumEdgeLength = 0.0
+        self.aspectRatio = 0.0
+
+
+class ExportManager:
+    def __init__(self):
+        self.executed = 0
+
+    def createSTLExportOptions(self, geometry, filename=''):
+        return STLExportOptions(geometry, filename)
+
+    def execute(self, options):
+        geometry = options.geometry
+        if isinstance(geometry, Occurrence):
+            tris = geometry._world_triangles()
+        elif isinstance(geometry, Component):
+            tris = geometry._triangles()
+        else:
+            tris = geometry.triangles
+        file_name = options.filename
+        if not file_name.lower().endswith('.stl'):
+            file_name += '.stl'
+        write_binary_stl(file_name, tris, scale=10.0)
+        self.executed += 1
+        return True
+
+
+def write_binary_stl(file_name, triangles, scale=1.0):
+    """Write ``triangles`` as a binary STL, multiplying coordinates by ``scale``."""
+    out = bytearray(b'fake_adsk binary STL'.ljust(80, b' '))
+    out += struct.pack('<I', len(triangles))
+    pack = struct.Struct('<12fH').pack
+    for a, b, c in triangles:
+        ux, uy, uz = b[0]-a[0], b[1]-a[1], b[2]-a[2]
+        vx, vy, vz = c[0]-a[0], c[1]-a[1], c[2]-a[2]
+        nx, ny, nz = uy*vz - uz*vy, uz*vx - ux*vz, ux*vy - uy*vx
+        n = math.sqrt(nx*nx + ny*ny + nz*nz) or 1.0
+        out += pack(nx/n, ny/n, nz/n,
+                    a[0]*scale, a[1]*scale, a[2]*scale,
+                    b[0]*scale, b[1]*scale, b[2]*scale,
+                    c[0]*scale, c[1]*scale, c[2]*scale, 0)
+    with open(file_name, 'wb') as f:
+        f.write(out)
+
+
+class Design:
+    def __init__(self, root_name='Robot'):
+        self._components = _Collection()
+        self.rootComponent = Component(self, root_name)
+        self._components._append(self.rootComponent)
+        self.exportManager = ExportManager()
+
+    @property
+    def allComponents(self):
+        return _Collection(self._components)
+
+    @staticmethod
+    def cast(product):
+        return product if isinstance(product, Design) else None
+
+    def add_component(self, name, bodies=(), parent=None, transform=None):
+        """
+        Create a component with ``bodies`` and one occurrence of it under
+        ``parent`` (a component, defaults to the root).
+        """
+        component = Component(self, name)
+        for body in bodies:
+            component._bodies.append(body)
+        self._components._append(component)
+        owner = parent if parent is not None else self.rootComponent
+        occ = owner.occurrences._add(component, transform if transform is not None else _identity())
+        return occ
+
+    def add_instance(self, component, parent=None, transform=None):
+        """Add another occurrence of an existing component."""
+        owner = parent if parent is not None else self.rootComponent
+        return owner.occurrences._add(component, transform if transform is not None else _identity())
+
+
+# --------------------
+# module registration
+
+def install():
+    """
+    Register ``adsk``, ``adsk.core`` and ``adsk.fusion`` in ``sys.modules``.
+
+    Returns the ``adsk`` module. Calling it again returns the modules that are
+    already installed.
+    """
+    if 'adsk' in sys.modules and getattr(sys.modules['adsk'], '__fake__', False):
+        return sys.modules['adsk']
+
+    adsk = types.ModuleType('adsk')
+    adsk.__fake__ = True
+    core = types.ModuleType('adsk.core')
+    fusion = types.ModuleType('adsk.fusion')
+    for cls in (Point3D, Vector3D, Matrix3D, DialogResults, ProgressDialog,
+                FolderDialog, UserInterface, Application):
+        setattr(core, cls.__name__, cls)
+    for cls in (CalculationAccuracy, MeshRefinementSettings, BoundingBox3D,
+                PhysicalProperties, BRepBody, Component, Occurrence, Occurrences,
+                JointGeometry, JointOrigin, JointLimits, JointTypes, RigidJointMotion,
+                RevoluteJointMotion, SliderJointMotion, Joint, STLExportOptions,
+                ExportManager, Design):
+        setattr(fusion, cls.__name__, cls)
+    adsk.core = core
+    adsk.fusion = fusion
+    sys.modules['adsk'] = adsk
+    sys.modules['adsk.core'] = core
+    sys.modules['adsk.fusion'] = fusion
+    return adsk
+
+
+def activate(design, folder=None):
+    """
+    Make ``design`` the active product of ``Application.get()`` and have the
+    folder dialog return ``folder``. Returns the application.
+    """
+    app = Application.get()
+    app.activeProduct = design
+    app.userInterface = UserInterface()
+    app.userInterface.folder = folder
+    return app
@@ -0,0 +1,99 @@
+"""
+Shared helpers for the benchmark entry points: loading the exporter against
+the fake ``adsk`` modules, timing stages and printing result tables.
+"""
+
+import contextlib
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+from . import fake_adsk
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_exporter():
+    """
+    Install the fake ``adsk`` modules and import the exporter packages.
+
+    Returns
+    ----------
+    exporter: module
+        URDF_Exporter.URDF_Exporter (holds ``run``)
+    """
+    fake_adsk.install()
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import importlib
+    return importlib.import_module('URDF_Exporter.URDF_Exporter')
+
+
+class StageResult:
+    __slots__ = ('name', 'seconds', 'peak_bytes', 'net_bytes', 'value')
+
+    def __init__(self, name, seconds, peak_bytes, net_bytes, value):
+        self.name = name
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+        self.net_bytes = net_bytes
+        self.value = value
+
+
+def measure(name, fn, trace_alloc=True):
+    """
+    Run ``fn()`` once and record its wall time and, with ``trace_alloc``,
+    the peak and retained bytes allocated while it ran.
+
+    tracemalloc slows allocation-heavy code down noticeably, so wall times
+    taken with ``trace_alloc`` are only comparable with each other.
+    """
+    gc.collect()
+    if trace_alloc:
+        tracemalloc.start()
+        base, _ = tracemalloc.get_traced_memory()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the exporter print()s progress
+        value = fn()
+    seconds = time.perf_counter() - t0
+    peak = net = 0
+    if trace_alloc:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        net = current - base
+        peak -= base
+    return StageResult(name, seconds, peak, net, value)
+
+
+def best_of(fn, repeat=3):
+    """Best wall time of ``repeat`` calls of ``fn()``."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def format_bytes(n):
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(n) < 1024 or unit == 'GiB':
+            return '{:.1f} {}'.format(n, unit) if unit != 'B' else '{} B'.format(n)
+        n /= 1024.0
+
+
+def print_table(headers, rows, out=sys.stdout):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) if rows else len(str(h))
+              for i, h in enumerate(headers)]
+    line = '  '.join(str(h).ljust(w) for h, w in zip(headers, widths))
+    out.write(line + '\n')
+    out.write('  '.join('-' * w for w in widths) + '\n')
+    for r in rows:
+        out.write('  '.join(str(c).rjust(w) if i else str(c).ljust(w)
+                            for i, (c, w) in enumerate(zip(r, widths))) + '\n')
+    out.write('\n')
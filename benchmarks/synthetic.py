@@ -0,0 +1,121 @@
+"""
+Synthetic robot generator for the offline benchmarks.
+
+``make_robot`` builds a ``fake_adsk.Design`` shaped like what the exporter
+sees in Fusion: a ``base_link`` component, one top-level occurrence per link
+and one root joint per parent/child pair with occurrenceTwo as the parent.
+"""
+
+import math
+import random
+
+from . import fake_adsk
+
+# (kind, name prefix) cycled over the joints
+JOINT_KINDS = [('revolute', 'Rev'), ('continuous', 'Rev'),
+               ('prismatic', 'Slider'), ('fixed', 'Rigid')]
+
+
+def _link_bodies(n_bodies, shape, density):
+    bodies = []
+    for b in range(n_bodies):
+        if shape == 'cylinder':
+            tris = fake_adsk.cylinder_triangles(1.0, 0.5, segments=16, center=(2.0, 0.0, 1.2*b))
+        else:
+            tris = fake_adsk.box_triangles((4.0, 2.0, 1.0), center=(2.0, 0.0, 1.2*b))
+        bodies.append(fake_adsk.BRepBody(tris, 'Body{}'.format(b + 1), density))
+    return bodies
+
+
+def make_robot(n_links, bodies_per_link=1, topology='chain', branching=3,
+               sub_parts=0, shared_components=False, rotated=False,
+               joint_origins=False, shape='box', root_name='Robot', seed=0):
+    """
+    Build a synthetic robot design.
+
+    Parameters
+    ----------
+    n_links: int
+        number of links including base_link (n_links - 1 joints)
+    bodies_per_link: int
+        bodies in each link component
+    topology: str
+        'chain' (serial arm) or 'tree' (each link has up to ``branching`` children)
+    branching: int
+        children per link for the 'tree' topology
+    sub_parts: int
+        nested occurrences (fasteners) inside each link component
+    shared_components: bool
+        reuse one component for every non-base link, like repeated wheels or
+        finger segments
+    rotated: bool
+        give every link a random yaw so occurrence transforms are not pure
+        translations
+    joint_origins: bool
+        use JointOrigin features instead of JointGeometry for occurrenceOne
+    shape: str
+        'box' or 'cylinder' link bodies
+    seed: int
+        random seed for the link layout
+
+    Returns
+    ----------
+    design: fake_adsk.Design
+    """
+    rng = random.Random(seed)
+    density = 0.00785  # kg/cm^3, steel
+    design = fake_adsk.Design(root_name)
+    root = design.rootComponent
+
+    base = design.add_component(
+        'base_link', [fake_adsk.BRepBody(fake_adsk.box_triangles((10.0, 10.0, 2.0)), 'Body1', density)])
+    occs = [base]
+    worlds = [base.transform.asArray()]
+
+    shared = None
+    for i in range(1, n_links):
+        parent = i - 1 if topology == 'chain' else (i - 1) // branching
+        slot = 0 if topology == 'chain' else (i - 1) % branching
+        pw = worlds[parent]
+        pos = (pw[3] + 5.0, pw[7] + 3.0 * (slot - (branching - 1) / 2.0), pw[11] + 0.5)
+        yaw = rng.uniform(-math.pi, math.pi) if rotated else 0.0
+        transform = fake_adsk.rotation_z(yaw, pos)
+
+        if shared_components and shared is not None:
+            occ = design.add_instance(shared, transform=transform)
+        else:
+            name = 'segment' if shared_components else 'link_{}'.format(i)
+            occ = design.add_component(name, _link_bodies(bodies_per_link, shape, density),
+                                       transform=transform)
+            if shared_components:
+                shared = occ.component
+            for s in range(sub_parts):
+                design.add_component(
+                    '{}_fastener_{}'.format(occ.component.name, s + 1),
+                    [fake_adsk.BRepBody(fake_adsk.box_triangles((0.2, 0.2, 0.6), center=(0.5*s, 0.5, 0.0)),
+                                        'Body1', density)],
+                    parent=occ.component)
+        occs.append(occ)
+        worlds.append(transform)
+
+        kind, prefix = JOINT_KINDS[(i - 1) % len(JOINT_KINDS)]
+        if kind == 'revolute':
+            motion = fake_adsk.RevoluteJointMotion((0.0, 0.0, 1.0), -1.57, 1.57)
+        elif kind == 'continuous':
+            motion = fake_adsk.RevoluteJointMotion((0.0, 1.0, 0.0))
+        elif kind == 'prismatic':
+            motion = fake_adsk.SliderJointMotion((1.0, 0.0, 0.0), 0.0, 5.0)
+        else:
+            motion = fake_adsk.RigidJointMotion()
+
+        # the joint sits at the child's origin; both geometries hold it in
+        # their occurrence's local coordinates
+        local_one = fake_adsk._apply(fake_adsk._invert_rigid(transform), pos)
+        local_two = fake_adsk._apply(fake_adsk._invert_rigid(pw), pos)
+        geometry_one = (fake_adsk.JointOrigin(local_one) if joint_origins
+                        else fake_adsk.JointGeometry(local_one))
+        joint = fake_adsk.Joint('{}{}'.format(prefix, i), motion, occ, occs[parent],
+                                geometry_one, fake_adsk.JointGeometry(local_two))
+        root._joints.append(joint)
+
+    return design